@@ -0,0 +1,11 @@
+# compare and the results are loaded on first use, so that the helpers can
+# import the lighter modules without networkx and numpy
+PIPELINE_NAMES = ["compare", "save_results", "ComparisonResult"]
+
+
+def __getattr__(name):
+    if name in PIPELINE_NAMES:
+        import asgan.pipeline as pipeline
+        return getattr(pipeline, name)
+
+    raise AttributeError("module 'asgan' has no attribute '{}'".format(name))
@@ -7,4 +7,5 @@ sys.path.insert(0, src)
 
 from asgan.main import main
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,14 @@
 import networkx as nx
+from asgan.synteny_blocks import get_sequence_blocks
 
 
 def build_adjacency_graph(assembly_graph, synteny_blocks):
-    adjacency_graph = nx.MultiDiGraph()
+    adjacency_graph = nx.MultiDiGraph(sequences=assembly_graph.graph["sequences"])
     node_curr_id = max(assembly_graph.nodes) + 1
     distances_between_blocks = dict()
 
     for (node_from, node_to, data) in assembly_graph.edges(data=True):
-        edge_synteny_blocks = synteny_blocks.get(data["name"])
+        edge_synteny_blocks = get_sequence_blocks(synteny_blocks, data["id"])
 
         if edge_synteny_blocks is None:
             if node_from != node_to:
@@ -15,27 +16,25 @@ def build_adjacency_graph(assembly_graph, synteny_blocks):
             continue
 
         if len(edge_synteny_blocks) == 1:
-            edge_name = edge_synteny_blocks[0].signed_id()
-            adjacency_graph.add_edge(node_from, node_to, name=edge_name)
+            block_id = edge_synteny_blocks[0].id
+            adjacency_graph.add_edge(node_from, node_to, block=block_id)
             continue
 
-        edge_synteny_blocks.sort(key=lambda block: block.start)
-
-        edge_name = edge_synteny_blocks[0].signed_id()
-        adjacency_graph.add_edge(node_from, node_curr_id, name=edge_name)
+        block_id = edge_synteny_blocks[0].id
+        adjacency_graph.add_edge(node_from, node_curr_id, block=block_id)
         node_curr_id += 1
 
         for i in range(1, len(edge_synteny_blocks) - 1):
-            edge_name = edge_synteny_blocks[i].signed_id()
-            adjacency_graph.add_edge(node_curr_id - 1, node_curr_id, name=edge_name)
+            block_id = edge_synteny_blocks[i].id
+            adjacency_graph.add_edge(node_curr_id - 1, node_curr_id, block=block_id)
 
             dist = edge_synteny_blocks[i].start - edge_synteny_blocks[i - 1].end
             distances_between_blocks[node_curr_id - 1] = {"distance": dist}
 
             node_curr_id += 1
 
-        edge_name = edge_synteny_blocks[-1].signed_id()
-        adjacency_graph.add_edge(node_curr_id - 1, node_to, name=edge_name)
+        block_id = edge_synteny_blocks[-1].id
+        adjacency_graph.add_edge(node_curr_id - 1, node_to, block=block_id)
 
         dist = edge_synteny_blocks[-1].start - edge_synteny_blocks[-2].end
         distances_between_blocks[node_curr_id - 1] = {"distance": dist}
@@ -52,17 +51,18 @@ def build_adjacency_graph(assembly_graph, synteny_blocks):
 
 
 def build_contracted_adjacency_graph(adjacency_graph):
+    sequences = adjacency_graph.graph["sequences"]
     contracted_adjacency_graph = nx.MultiDiGraph()
 
     for (node, data) in adjacency_graph.nodes(data=True):
         contracted_adjacency_graph.add_node(node, **data)
 
     for (node_from, node_to, data) in adjacency_graph.edges(data=True):
-        if data["name"].startswith("+") or data["name"].startswith("-"):
+        if "block" in data:
             continue
 
         contracted_adjacency_graph.add_edge(node_from, node_to,
-                                            name=data["name"],
-                                            weight=data["length"])
+                                            id=data["id"],
+                                            weight=sequences.length(data["id"]))
 
     return contracted_adjacency_graph
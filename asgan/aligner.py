@@ -1,19 +1,24 @@
 import os
-from asgan.output_generator import pretty_number
+import shutil
+import weakref
+import tempfile
+
+import asgan.progress as progress
 
 
 class RawPafHit:
-    def __init__(self, raw_hit):
+    # query_id and target_id are indices in the sequence tables of the graphs
+    def __init__(self, raw_hit, sequences_query, sequences_target):
         raw_hit = raw_hit.strip().split()
 
-        self.query_name = raw_hit[0]
+        self.query_id = sequences_query.name2id[raw_hit[0]]
         self.query_len = int(raw_hit[1])
         self.query_start = int(raw_hit[2])
         self.query_end = int(raw_hit[3])
 
         self.strand = raw_hit[4]
 
-        self.target_name = raw_hit[5]
+        self.target_id = sequences_target.name2id[raw_hit[5]]
         self.target_len = int(raw_hit[6])
         self.target_start = int(raw_hit[7])
         self.target_end = int(raw_hit[8])
@@ -30,44 +35,102 @@ class RawPafHit:
     def alignment_identity(self):
         return float(self.matching_bases) / float(self.number_bases)
 
-    def __str__(self):
-        query_info = "{}\t{}\t{}\t{}".format(
-            self.query_name,
-            pretty_number(self.query_len),
-            pretty_number(self.query_start),
-            pretty_number(self.query_end))
+    def to_paf(self, sequences_query, sequences_target):
+        return "\t".join(map(str, [sequences_query.names[self.query_id], self.query_len,
+                                   self.query_start, self.query_end, self.strand,
+                                   sequences_target.names[self.target_id], self.target_len,
+                                   self.target_start, self.target_end,
+                                   self.matching_bases, self.number_bases]))
+
+
+class RawHitFile:
+    # Raw hits kept in a PAF file and parsed again each time they are
+    # iterated over, so that they are never held in memory as a whole. The
+    # file is removed with the object that took it over; a pickled copy
+    # (passed to a worker process) only refers to it.
+    def __init__(self, paf_file, sequences_query, sequences_target):
+        self.paf_file = paf_file
+        self.sequences_query = sequences_query
+        self.sequences_target = sequences_target
+        self.remove = weakref.finalize(self, os.remove, paf_file)
+
+    def __iter__(self):
+        return read_paf(self.paf_file, self.sequences_query, self.sequences_target)
+
+    def __getstate__(self):
+        return self.paf_file, self.sequences_query, self.sequences_target
 
-        target_info = "{}\t{}\t{}\t{}".format(
-            self.target_name,
-            pretty_number(self.target_len),
-            pretty_number(self.target_start),
-            pretty_number(self.target_end))
+    def __setstate__(self, state):
+        self.paf_file, self.sequences_query, self.sequences_target = state
 
-        return "{}\t{}\t{}".format(query_info, self.strand, target_info)
 
+def read_paf(paf_file, sequences_query, sequences_target):
+    with open(paf_file) as f:
+        for raw_hit in f:
+            yield RawPafHit(raw_hit, sequences_query, sequences_target)
 
-def align(sequences_query, sequences_target, args):
-    out_file = args.out_dir + "/minimap.paf"
 
-    run_minimap(sequences_query, sequences_target, out_file, args)
+def align(fasta_query, fasta_target, sequences_query, sequences_target,
+          out_dir, minimap_preset, threads=None, keep_file=False):
+    # fasta_target is either a FASTA file or an index built by build_index.
+    # With keep_file, the PAF file is moved out of out_dir and the hits are
+    # returned as a RawHitFile instead of a list.
+    out_file = out_dir + "/minimap.paf"
 
-    with open(out_file) as f:
-        raw_hits = [RawPafHit(raw_hit) for raw_hit in f]
+    run_minimap(fasta_query, fasta_target, out_file, minimap_preset, threads)
+
+    if keep_file:
+        return take_paf_file(out_file, sequences_query, sequences_target)
+
+    paf_lines = progress.counter("paf_lines")
+    raw_hits = []
+
+    for raw_hit in read_paf(out_file, sequences_query, sequences_target):
+        raw_hits.append(raw_hit)
+        paf_lines.add()
+
+    paf_lines.done()
 
     os.remove(out_file)
     return raw_hits
 
 
-def run_minimap(sequences_query, sequences_target, out_file, args):
-    asgan_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    MINIMAP_BIN = os.path.join(asgan_root, "lib/minimap2/minimap2")
+def take_paf_file(paf_file, sequences_query, sequences_target):
+    fd, kept_file = tempfile.mkstemp(prefix="asgan_", suffix=".paf")
+    os.close(fd)
+    shutil.move(paf_file, kept_file)
+    return RawHitFile(kept_file, sequences_query, sequences_target)
 
-    cmd = [MINIMAP_BIN]
+
+def build_index(sequences_target, out_dir, minimap_preset, threads=None):
+    index_file = out_dir + "/target.mmi"
+
+    cmd = [minimap_bin()]
+    cmd.extend(["-x", minimap_preset])
+    if threads is not None:
+        cmd.extend(["-t", str(threads)])
+    cmd.extend(["-d", index_file, sequences_target])
+    cmd.extend(["> /dev/null 2>&1"])
+    cmd = " ".join(cmd)
+
+    os.system(cmd)
+    return index_file
+
+
+def run_minimap(sequences_query, sequences_target, out_file, minimap_preset, threads=None):
+    cmd = [minimap_bin()]
     cmd.extend(["--secondary=no"])
-    cmd.extend(["-cx", args.minimap_preset])
+    cmd.extend(["-cx", minimap_preset])
+    if threads is not None:
+        cmd.extend(["-t", str(threads)])
     cmd.extend([sequences_target, sequences_query])
     cmd.extend([">", out_file])
     cmd.extend(["2> /dev/null"])
     cmd = " ".join(cmd)
 
     os.system(cmd)
+
+
+def minimap_bin():
+    asgan_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    return os.path.join(asgan_root, "lib/minimap2/minimap2")
@@ -1,58 +1,122 @@
+import os
+
 import networkx as nx
+import asgan.snapshot as snap
 from asgan.utils import DisjointSet
 from asgan.gfa_parser import parse_gfa
 
+REPEAT_DETECTION_METHODS = ["tag", "depth", "topology", "all"]
+
 
-class Sequence:
-    def __init__(self, name, length, strand, is_repeat):
-        self.name = name + strand
-        self.length = length
-        self.is_repeat = is_repeat
+def parse_assembly_graph(gfa_file, repeat_detection="tag", use_snapshot=False,
+                         snapshot_dir=None):
+    # With use_snapshot, the parsed sequences and the nodes of the graph
+    # are saved in a binary snapshot (next to the GFA or in snapshot_dir)
+    # and loaded from it while the GFA stays the same.
+    if not use_snapshot:
+        sequences, links = parse_gfa(gfa_file)
+        return build(sequences, links, repeat_detection)
 
+    path = snap.snapshot_path(gfa_file, snapshot_dir)
 
-def parse_assembly_graph(gfa_file):
-    sequences, links = parse_gfa(gfa_file)
-    return build(sequences, links)
+    snapshot = None
+    if os.path.exists(path):
+        # an outdated snapshot may be replaced by another run while it is
+        # read; the GFA is parsed then
+        try:
+            if snap.is_valid(path, gfa_file):
+                snapshot = snap.load_snapshot(path)
+        except (OSError, ValueError):
+            snapshot = None
 
+    if snapshot is not None:
+        sequences, nodes_from, nodes_to = snapshot
+    else:
+        sequences, links = parse_gfa(gfa_file)
+        nodes_from, nodes_to = find_nodes(sequences, links)
 
-def build(raw_sequences, links):
-    sequences = list()
-    sequence2id = dict()
-    curr_id = 0
+        if snapshot_dir is not None:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        snap.save_snapshot(path, gfa_file, sequences, nodes_from, nodes_to)
 
-    for seq in raw_sequences:
-        sequences.append(Sequence(seq.name, seq.length, "+", seq.is_repeat))
-        sequence2id[seq.name + "+"] = curr_id
+    return build_graph(sequences, nodes_from, nodes_to, repeat_detection)
 
-        sequences.append(Sequence(seq.name, seq.length, "-", seq.is_repeat))
-        sequence2id[seq.name + "-"] = curr_id + 1
 
-        curr_id += 2
+def build(sequences, links, repeat_detection="tag"):
+    nodes_from, nodes_to = find_nodes(sequences, links)
+    return build_graph(sequences, nodes_from, nodes_to, repeat_detection)
 
-    disjoint_set = DisjointSet(2 * len(sequences))
+
+def find_nodes(sequences, links):
+    # the start and end nodes of the edge of each oriented sequence
+    disjoint_set = DisjointSet(4 * len(sequences))
 
     for link in links:
-        id_from = sequence2id[link.from_name + link.from_strand]
-        id_to = sequence2id[link.to_name + link.to_strand]
-        disjoint_set.union(2 * id_from + 1, 2 * id_to)
+        disjoint_set.union(2 * link.from_id + 1, 2 * link.to_id)
+
+    nodes_from = [disjoint_set.find(2 * i) for i in range(2 * len(sequences))]
+    nodes_to = [disjoint_set.find(2 * i + 1) for i in range(2 * len(sequences))]
+    return nodes_from, nodes_to
 
-    assembly_graph = nx.MultiDiGraph()
 
-    for i, seq in enumerate(sequences):
-        node_from = disjoint_set.find(2 * i)
-        node_to = disjoint_set.find(2 * i + 1)
-        assembly_graph.add_edge(node_from, node_to, name=seq.name,
-                                length=seq.length,
-                                is_repeat=seq.is_repeat)
+def build_graph(sequences, nodes_from, nodes_to, repeat_detection="tag"):
+    assembly_graph = nx.MultiDiGraph(sequences=sequences)
 
+    for (i, (node_from, node_to)) in enumerate(zip(nodes_from, nodes_to)):
+        assembly_graph.add_edge(node_from, node_to, id=i)
+
+    detect_repeats(assembly_graph, repeat_detection)
     return assembly_graph
 
 
+def detect_repeats(assembly_graph, method, depth_rate=1.75):
+    # Segments tagged with r:i:1 are always repeats. The depth method also
+    # marks segments whose depth exceeds the length-weighted mean depth by
+    # depth_rate, the topology method marks segments that have more than one
+    # predecessor and more than one successor.
+    if method not in REPEAT_DETECTION_METHODS:
+        raise ValueError("unknown repeat detection method: {}".format(method))
+
+    if method == "tag":
+        return
+
+    sequences = assembly_graph.graph["sequences"]
+    use_depth = method in ["depth", "all"]
+    use_topology = method in ["topology", "all"]
+
+    depths_weighted_sum, lengths_sum = 0, 0
+    for (depth, length) in zip(sequences.depths, sequences.lengths):
+        if depth is not None:
+            depths_weighted_sum += depth * length
+            lengths_sum += length
+
+    depths_weighted_mean = None
+    if lengths_sum > 0:
+        depths_weighted_mean = depths_weighted_sum / lengths_sum
+
+    for (node_from, node_to, data) in assembly_graph.edges(data=True):
+        i = data["id"] >> 1
+        if sequences.is_repeat[i]:
+            continue
+
+        depth = sequences.depths[i]
+        if use_depth and depths_weighted_mean is not None and depth is not None:
+            if depth > depth_rate * depths_weighted_mean:
+                sequences.is_repeat[i] = True
+                continue
+
+        if use_topology:
+            if assembly_graph.in_degree(node_from) > 1 \
+               and assembly_graph.out_degree(node_to) > 1:
+                sequences.is_repeat[i] = True
+
+
 def get_repeats(assembly_graph):
+    sequences = assembly_graph.graph["sequences"]
     repeats = set()
 
-    for (_, _, data) in assembly_graph.edges(data=True):
-        if data["is_repeat"]:
-            repeats.add(data["name"][:-1])
+    for (name, is_repeat) in zip(sequences.names, sequences.is_repeat):
+        if is_repeat:
+            repeats.add(name)
 
     return repeats
@@ -1,67 +1,80 @@
 import networkx as nx
-from asgan.common import inv_sign, build_block2edge_dict, build_id2block_dict
+import asgan.progress as progress
+from asgan.common import block_index, build_block2edge, build_id2block
+from asgan.synteny_blocks import get_block
 from asgan.adjacency_graph import build_contracted_adjacency_graph
 
+# blocks farther apart than this in either graph are not considered adjacent
+MAX_ADJACENCY_DIST = 10**6
+
 
 def build_breakpoint_graph(adjacency_graph_query, synteny_blocks_query,
-                           adjacency_graph_target, synteny_blocks_target):
+                           adjacency_graph_target, synteny_blocks_target,
+                           max_dist=MAX_ADJACENCY_DIST):
+    # block i is represented by its tail node i and its head node
+    # number_synteny_blocks + i
     number_synteny_blocks = count_number_synteny_blocks(adjacency_graph_query)
-    breakpoint_graph = nx.Graph()
-    labels = dict()
+    breakpoint_graph = nx.Graph(number_synteny_blocks=number_synteny_blocks)
 
     for i in range(1, number_synteny_blocks + 1):
-        tail, head = "{}t".format(i), "{}h".format(i)
-
-        breakpoint_graph.add_node(i, label=tail)
-        breakpoint_graph.add_node(number_synteny_blocks + i, label=head)
-
-        labels[tail] = i
-        labels[head] = number_synteny_blocks + i
+        breakpoint_graph.add_node(i)
+        breakpoint_graph.add_node(number_synteny_blocks + i)
 
     contracted_adjacency_graph_query = build_contracted_adjacency_graph(adjacency_graph_query)
     contracted_adjacency_graph_target = build_contracted_adjacency_graph(adjacency_graph_target)
 
-    block2edge_query = build_block2edge_dict(adjacency_graph_query)
-    block2edge_target = build_block2edge_dict(adjacency_graph_target)
+    dijkstra_calls_query = progress.counter("dijkstra_calls_query")
+    dijkstra_calls_target = progress.counter("dijkstra_calls_target")
+
+    block2edge_query = build_block2edge(adjacency_graph_query, number_synteny_blocks)
+    block2edge_target = build_block2edge(adjacency_graph_target, number_synteny_blocks)
 
-    id2block_query = build_id2block_dict(synteny_blocks_query)
-    id2block_target = build_id2block_dict(synteny_blocks_target)
+    id2block_query = build_id2block(synteny_blocks_query)
+    id2block_target = build_id2block(synteny_blocks_target)
 
-    signs = [("+", "+"), ("+", "-"), ("-", "+"), ("-", "-")]
+    signs = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+    block_pairs = progress.counter("block_pairs",
+                                   total=number_synteny_blocks * (number_synteny_blocks - 1) // 2)
 
     for i in range(1, number_synteny_blocks):
+        block_pairs.add(number_synteny_blocks - i)
         for j in range(i + 1, number_synteny_blocks + 1):
             for (sign1, sign2) in signs:
-                block_fwd_from, block_fwd_to = make_signed_blocks(i, j, sign1, sign2)
-                block_inv_from, block_inv_to = make_signed_blocks(j, i, inv_sign(sign2),
-                                                                  inv_sign(sign1))
+                block_fwd_from, block_fwd_to = sign1 * i, sign2 * j
+                block_inv_from, block_inv_to = -sign2 * j, -sign1 * i
 
                 if not check_adjacency(block_fwd_from, block_fwd_to,
                                        contracted_adjacency_graph_query,
-                                       block2edge_query, id2block_query):
+                                       block2edge_query, id2block_query, max_dist,
+                                       dijkstra_calls_query):
                     continue
 
                 if not check_adjacency(block_inv_from, block_inv_to,
                                        contracted_adjacency_graph_query,
-                                       block2edge_query, id2block_query):
+                                       block2edge_query, id2block_query, max_dist,
+                                       dijkstra_calls_query):
                     continue
 
                 if not check_adjacency(block_fwd_from, block_fwd_to,
                                        contracted_adjacency_graph_target,
-                                       block2edge_target, id2block_target):
+                                       block2edge_target, id2block_target, max_dist,
+                                       dijkstra_calls_target):
                     continue
 
                 if not check_adjacency(block_inv_from, block_inv_to,
                                        contracted_adjacency_graph_target,
-                                       block2edge_target, id2block_target):
+                                       block2edge_target, id2block_target, max_dist,
+                                       dijkstra_calls_target):
                     continue
 
-                label_from = "{}{}".format(i, ["t", "h"][sign1 == "+"])
-                label_to = "{}{}".format(j, ["h", "t"][sign2 == "+"])
-                node_from = labels[label_from]
-                node_to = labels[label_to]
+                node_from = [i, number_synteny_blocks + i][sign1 > 0]
+                node_to = [number_synteny_blocks + j, j][sign2 > 0]
                 breakpoint_graph.add_edge(node_from, node_to)
 
+    block_pairs.done()
+    dijkstra_calls_query.done()
+    dijkstra_calls_target.done()
+
     return breakpoint_graph
 
 
@@ -69,55 +82,55 @@ def count_number_synteny_blocks(adjacency_graph):
     number_synteny_blocks = 0
 
     for (node_from, node_to, data) in adjacency_graph.edges(data=True):
-        if data["name"].startswith("+") or data["name"].startswith("-"):
+        if "block" in data:
             number_synteny_blocks += 1
 
     return number_synteny_blocks // 2
 
 
-def make_signed_blocks(id_from, id_to, sign_from, sign_to):
-    signed_id_from = "{}{}".format(sign_from, id_from)
-    signed_id_to = "{}{}".format(sign_to, id_to)
-    return signed_id_from, signed_id_to
-
-
-def check_adjacency(id_from, id_to, contracted_adjacency_graph, block2edge, id2block):
-    from_start, from_end = block2edge[id_from]
-    to_start, to_end = block2edge[id_to]
+def check_adjacency(id_from, id_to, contracted_adjacency_graph, block2edge, id2block,
+                    max_dist=MAX_ADJACENCY_DIST, dijkstra_calls=progress.NULL_COUNTER):
+    from_start, from_end = block2edge[block_index(id_from)]
+    to_start, to_end = block2edge[block_index(id_to)]
 
     if from_end == to_start:
         dist = contracted_adjacency_graph.nodes[from_end].get("distance")
-        block_from, block_to = id2block[id_from], id2block[id_to]
+        block_from, block_to = get_block(id2block, id_from), get_block(id2block, id_to)
 
-        if dist is None or block_from.sequence_name != block_to.sequence_name:
+        if dist is None or block_from.sequence_id != block_to.sequence_id:
             dist = block_to.start + (block_from.sequence_length - block_from.end)
-            return dist < 10**6
+            return dist < max_dist
 
-        return dist < 10**6
+        return dist < max_dist
 
+    dijkstra_calls.add()
     if not nx.has_path(contracted_adjacency_graph, from_end, to_start):
         return False
 
-    return nx.dijkstra_path_length(contracted_adjacency_graph, from_end, to_start) < 10**6
+    return nx.dijkstra_path_length(contracted_adjacency_graph, from_end, to_start) < max_dist
+
+
+def node_block(graph, node):
+    number_synteny_blocks = graph.graph["number_synteny_blocks"]
+    return node - number_synteny_blocks if node > number_synteny_blocks else node
+
+
+def is_head(graph, node):
+    return node > graph.graph["number_synteny_blocks"]
 
 
 def build_path_components(breakpoint_graph, max_matching):
-    path_components = nx.Graph()
+    number_synteny_blocks = breakpoint_graph.graph["number_synteny_blocks"]
+    path_components = nx.Graph(number_synteny_blocks=number_synteny_blocks)
 
-    for (node, data) in breakpoint_graph.nodes(data=True):
-        path_components.add_node(node, **data)
+    for node in breakpoint_graph.nodes():
+        path_components.add_node(node)
 
     for (node_from, node_to) in max_matching:
         path_components.add_edge(node_from, node_to)
 
-    for (node_from, data_from) in breakpoint_graph.nodes(data=True):
-        for (node_to, data_to) in breakpoint_graph.nodes(data=True):
-            if node_from == node_to:
-                continue
-
-            label_from, label_to = data_from["label"], data_to["label"]
-            if label_from[:-1] == label_to[:-1]:
-                path_components.add_edge(node_from, node_to)
+    for i in range(1, number_synteny_blocks + 1):
+        path_components.add_edge(i, number_synteny_blocks + i)
 
     return path_components
 
@@ -146,26 +159,24 @@ def unite_cycles(graph, unused_edges):
         return True
 
     def unite_components(node_from, node_to):
-        node_from_label = node_labels[node_from]
-        node_to_label = node_labels[node_to]
-
         for node in graph[node_from]:
-            node_label = node_labels[node]
-            if node_label[:-1] != node_from_label[:-1]:
+            if node_block(graph, node) != node_block(graph, node_from):
                 graph.remove_edge(node, node_from)
                 break
 
         for node in graph[node_to]:
-            node_label = node_labels[node]
-            if node_label[:-1] != node_to_label[:-1]:
+            if node_block(graph, node) != node_block(graph, node_to):
                 graph.remove_edge(node, node_to)
                 break
 
         graph.add_edge(node_from, node_to)
 
+    processed_edges = progress.counter("unused_edges", total=len(unused_edges))
+
     number_united_components = 0
-    node_labels = nx.get_node_attributes(graph, "label")
     for (node_from, node_to) in unused_edges:
+        processed_edges.add()
+
         if nx.has_path(graph, node_from, node_to):
             continue
 
@@ -186,4 +197,5 @@ def unite_cycles(graph, unused_edges):
             unite_components(node_from, node_to)
             number_united_components += 1
 
+    processed_edges.done()
     return number_united_components
@@ -0,0 +1,118 @@
+import os
+import pickle
+import hashlib
+
+from asgan.gfa_parser import RecordType, GfaTokenizer
+from asgan.compression import open_input
+
+CHECKPOINT_FILE = "checkpoint.pickle"
+
+
+class GfaState:
+    # content digests of the segments of a GFA in the file order and its
+    # links as (from_name, from_strand, to_name, to_strand)
+    def __init__(self, names, digests, links):
+        self.names = names
+        self.digests = digests
+        self.links = links
+
+
+class Checkpoint:
+    # everything a later run needs to decide which alignments can be reused;
+    # raw hits are kept as PAF records since sequence indices change between
+    # versions of a GFA. skip_target holds the target sequences left out of
+    # the index by the pre-screen.
+    def __init__(self, minimap_preset, prescreen, skip_target, state_query, state_target,
+                 raw_hits):
+        self.minimap_preset = minimap_preset
+        self.prescreen = prescreen
+        self.skip_target = skip_target
+        self.state_query = state_query
+        self.state_target = state_target
+        self.raw_hits = raw_hits
+
+
+class GfaDiff:
+    def __init__(self, old_state, new_state):
+        old_digests = dict(zip(old_state.names, old_state.digests))
+
+        self.unchanged, self.changed, self.added = [], [], []
+        for (name, digest) in zip(new_state.names, new_state.digests):
+            if name not in old_digests:
+                self.added.append(name)
+            elif old_digests[name] == digest:
+                self.unchanged.append(name)
+            else:
+                self.changed.append(name)
+
+        self.removed = sorted(set(old_digests) - set(new_state.names))
+        self.links_added = len(new_state.links - old_state.links)
+        self.links_removed = len(old_state.links - new_state.links)
+
+    def __str__(self):
+        return ("{} unchanged, {} changed, {} new, {} removed segments; "
+                "{} links added, {} removed").format(
+                    len(self.unchanged), len(self.changed), len(self.added),
+                    len(self.removed), self.links_added, self.links_removed)
+
+
+def read_gfa_state(gfa_file):
+    # sequences are hashed piece by piece as the tokenizer reads them
+    names, digests, links = [], [], set()
+
+    def sink(name):
+        names.append(name)
+        digests.append(hashlib.sha1())
+        return digests[-1].update
+
+    with open_input(gfa_file, "rb") as f:
+        for (record, _) in GfaTokenizer(f, sink).records():
+            if record[0] == RecordType.LINK:
+                links.add(tuple(record[1:5]))
+
+    return GfaState(names, [digest.hexdigest() for digest in digests], links)
+
+
+def find_reusable_sequences(previous, minimap_preset, prescreen, state_query, state_target,
+                            screen):
+    # Hits of a query sequence depend only on its own content and on the
+    # target index, so they can be reused for unchanged query sequences as
+    # long as the target and the alignment settings are exactly the same.
+    # The pre-screen picks the indexed target sequences by their containment
+    # in the query, so the index may change with the query even if the
+    # target does not.
+    if previous.minimap_preset != minimap_preset or previous.prescreen != prescreen:
+        return set()
+
+    if getattr(previous, "skip_target", set()) != screen.skip_target:
+        return set()
+
+    if (previous.state_target.names != state_target.names or
+            previous.state_target.digests != state_target.digests):
+        return set()
+
+    return set(GfaDiff(previous.state_query, state_query).unchanged)
+
+
+def build_checkpoint(minimap_preset, prescreen, skip_target, state_query, state_target,
+                     raw_hits, sequences_query, sequences_target):
+    raw_hits = [raw_hit.to_paf(sequences_query, sequences_target) for raw_hit in raw_hits]
+    return Checkpoint(minimap_preset, prescreen, skip_target, state_query, state_target,
+                      raw_hits)
+
+
+def save_checkpoint(checkpoint, out_dir):
+    # written under a temporary name first, so that a run reading the same
+    # cache directory never loads a partial checkpoint
+    checkpoint_file = "{}/{}".format(out_dir, CHECKPOINT_FILE)
+    tmp_file = "{}.{}.tmp".format(checkpoint_file, os.getpid())
+
+    with open(tmp_file, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(tmp_file, checkpoint_file)
+
+
+def load_checkpoint(run_dir):
+    with open("{}/{}".format(run_dir, CHECKPOINT_FILE), "rb") as f:
+        return pickle.load(f)
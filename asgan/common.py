@@ -1,26 +1,49 @@
 
 
-def inv_sign(sign):
-    return ["+", "-"][sign == "+"]
+# A sequence of an assembly graph is referred to by an integer that encodes
+# both the index of the sequence and its strand: 2 * index for the forward
+# strand and 2 * index + 1 for the reverse complement one.
+def oriented_id(index, strand):
+    return 2 * index + (strand == "-")
 
 
-def build_block2edge_dict(adjacency_graph):
-    block2edge = dict()
+def complement_id(sequence_id):
+    return sequence_id ^ 1
+
+
+def sequence_strand(sequence_id):
+    return ["+", "-"][sequence_id & 1]
+
+
+# Synteny blocks have signed ids 1, -1, 2, -2, ... that are mapped to dense
+# indices 0, 1, 2, 3, ... in the same way.
+def block_index(block_id):
+    return 2 * abs(block_id) - 2 + (block_id < 0)
 
-    for (node_from, node_to, data) in adjacency_graph.edges(data=True):
-        edge_name = data["name"]
 
-        if edge_name.startswith("+") or edge_name.startswith("-"):
-            block2edge[edge_name] = (node_from, node_to)
+def count_synteny_blocks(synteny_blocks):
+    return sum([len(blocks) for blocks in synteny_blocks if blocks is not None])
+
+
+def build_block2edge(adjacency_graph, number_synteny_blocks):
+    block2edge = [None] * (2 * number_synteny_blocks)
+
+    for (node_from, node_to, data) in adjacency_graph.edges(data=True):
+        if "block" in data:
+            block2edge[block_index(data["block"])] = (node_from, node_to)
 
     return block2edge
 
 
-def build_id2block_dict(synteny_blocks):
-    id2block = dict()
+def build_id2block(synteny_blocks):
+    # only the stored strand of each block, indexed by abs(block.id)
+    id2block = [None] * (count_synteny_blocks(synteny_blocks) + 1)
+
+    for blocks in synteny_blocks:
+        if blocks is None:
+            continue
 
-    for blocks in synteny_blocks.values():
         for block in blocks:
-            id2block[block.signed_id()] = block
+            id2block[abs(block.id)] = block
 
     return id2block
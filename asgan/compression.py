@@ -0,0 +1,121 @@
+import io
+import gzip
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b"\x1f\x8b"
+DECOMPRESSION_THREADS = 4
+
+# blocks being decompressed ahead of the reader per thread
+BLOCKS_PER_THREAD = 16
+
+
+def is_gzip(header):
+    return header[:2] == GZIP_MAGIC
+
+
+def is_bgzf(header):
+    # BGZF is gzip with the FEXTRA flag and a "BC" extra subfield
+    # holding the size of the block
+    return (is_gzip(header) and len(header) >= 16 and header[3] & 4 != 0 and
+            header[12:14] == b"BC")
+
+
+def open_input(file_name, mode="rt", threads=DECOMPRESSION_THREADS):
+    # Opens a plain, gzip or BGZF file by its first bytes. BGZF blocks are
+    # decompressed in parallel; zlib releases the GIL, so threads suffice.
+    with open(file_name, "rb") as f:
+        header = f.read(18)
+
+    if is_bgzf(header):
+        stream = io.BufferedReader(BgzfReader(file_name, threads), buffer_size=1 << 20)
+    elif is_gzip(header):
+        stream = gzip.open(file_name, "rb")
+    else:
+        return open(file_name, mode)
+
+    return stream if "b" in mode else io.TextIOWrapper(stream)
+
+
+def is_compressed(file_name):
+    with open(file_name, "rb") as f:
+        return is_gzip(f.read(2))
+
+
+def read_bgzf_blocks(f):
+    # yields the compressed data of each block with its CRC and size
+    while True:
+        header = f.read(12)
+        if not header:
+            return
+
+        if len(header) < 12 or not is_gzip(header):
+            raise ValueError("invalid BGZF block")
+
+        extra_length = struct.unpack("<H", header[10:12])[0]
+        extra = f.read(extra_length)
+
+        block_size, pos = None, 0
+        while pos + 4 <= len(extra):
+            field_length = struct.unpack("<H", extra[pos + 2:pos + 4])[0]
+            if extra[pos:pos + 2] == b"BC":
+                block_size = struct.unpack("<H", extra[pos + 4:pos + 6])[0] + 1
+            pos += 4 + field_length
+
+        if block_size is None:
+            raise ValueError("invalid BGZF block: no block size")
+
+        data = f.read(block_size - 12 - extra_length)
+        crc, size = struct.unpack("<II", data[-8:])
+        yield data[:-8], crc, size
+
+
+def decompress_block(data, crc, size):
+    block = zlib.decompress(data, -zlib.MAX_WBITS)
+
+    if len(block) != size or zlib.crc32(block) & 0xffffffff != crc:
+        raise ValueError("corrupted BGZF block")
+
+    return block
+
+
+class BgzfReader(io.RawIOBase):
+    def __init__(self, file_name, threads):
+        self.file_handle = open(file_name, "rb")
+        self.pool = ThreadPoolExecutor(threads)
+        self.blocks = read_bgzf_blocks(self.file_handle)
+        self.pending = deque()
+        self.max_pending = threads * BLOCKS_PER_THREAD
+        self.buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def fill_pending(self):
+        while len(self.pending) < self.max_pending:
+            block = next(self.blocks, None)
+            if block is None:
+                return
+            self.pending.append(self.pool.submit(decompress_block, *block))
+
+    def readinto(self, buffer):
+        while not self.buffer:
+            self.fill_pending()
+            if not self.pending:
+                return 0
+            self.buffer = memoryview(self.pending.popleft().result())
+
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            for future in self.pending:
+                future.cancel()
+            self.pool.shutdown()
+            self.file_handle.close()
+        super().close()
@@ -0,0 +1,163 @@
+import zlib
+import struct
+from itertools import islice
+
+import numpy as np
+
+from asgan.common import build_id2block
+from asgan.synteny_blocks import forward_block
+
+BACKGROUND = 255
+GRID_COLOR = (200, 200, 200)
+BLOCK_COLOR = (0, 160, 0)
+CHUNK_SIZE = 1000
+
+
+def build_dot_plot(raw_hits, sequences_query, sequences_target,
+                   synteny_blocks_query=None, synteny_blocks_target=None, size=1000):
+    # Query sequences go along the x axis and target ones along the y axis,
+    # one after another in the order of their tables. Hits are rasterized
+    # into two histograms (one per strand) holding the number of hits and
+    # the sum of their identities in each bin, so the memory used does not
+    # depend on the number of hits. Returns an RGB image: forward hits are
+    # blue, reverse ones are red, darker for a higher mean identity.
+    offsets_query = np.concatenate([[0], np.cumsum(sequences_query.lengths)])
+    offsets_target = np.concatenate([[0], np.cumsum(sequences_target.lengths)])
+    scale_x = size / max(offsets_query[-1], 1)
+    scale_y = size / max(offsets_target[-1], 1)
+
+    counts = np.zeros((2, size * size), dtype=np.float64)
+    identities = np.zeros((2, size * size), dtype=np.float64)
+
+    raw_hits = iter(raw_hits)
+    while True:
+        chunk = list(islice(raw_hits, CHUNK_SIZE))
+        if not chunk:
+            break
+
+        hits = np.array([(hit.query_id, hit.query_start, hit.query_end,
+                          hit.target_id, hit.target_start, hit.target_end,
+                          hit.strand == "-", hit.alignment_identity()) for hit in chunk],
+                        dtype=np.float64)
+
+        x0 = (offsets_query[hits[:, 0].astype(np.int64)] + hits[:, 1]) * scale_x
+        x1 = (offsets_query[hits[:, 0].astype(np.int64)] + hits[:, 2]) * scale_x
+        y0 = (offsets_target[hits[:, 3].astype(np.int64)] + hits[:, 4]) * scale_y
+        y1 = (offsets_target[hits[:, 3].astype(np.int64)] + hits[:, 5]) * scale_y
+        is_reverse = hits[:, 6].astype(bool)
+        y0, y1 = np.where(is_reverse, y1, y0), np.where(is_reverse, y0, y1)
+
+        # each hit is a segment sampled once per bin it crosses
+        number_samples = np.maximum(np.abs(x1 - x0), np.abs(y1 - y0)).astype(np.int64) + 1
+        hit_index = np.repeat(np.arange(len(chunk)), number_samples)
+        first_sample = np.repeat(np.cumsum(number_samples) - number_samples, number_samples)
+        t = (np.arange(len(hit_index)) - first_sample) / \
+            np.maximum(number_samples[hit_index] - 1, 1)
+
+        x = np.clip((x0[hit_index] + t * (x1 - x0)[hit_index]).astype(np.int64), 0, size - 1)
+        y = np.clip((y0[hit_index] + t * (y1 - y0)[hit_index]).astype(np.int64), 0, size - 1)
+        bins = (size - 1 - y) * size + x
+        strands = is_reverse[hit_index].astype(np.int64)
+
+        for strand in [0, 1]:
+            selected = strands == strand
+            counts[strand] += np.bincount(bins[selected], minlength=size * size)
+            identities[strand] += np.bincount(bins[selected], weights=hits[hit_index[selected], 7],
+                                              minlength=size * size)
+
+    image = np.full((size * size, 3), BACKGROUND, dtype=np.uint8)
+    draw_grid(image, offsets_query, offsets_target, scale_x, scale_y, size)
+
+    if synteny_blocks_query is not None and synteny_blocks_target is not None:
+        draw_blocks(image, synteny_blocks_query, synteny_blocks_target,
+                    offsets_query, offsets_target, scale_x, scale_y, size)
+
+    for (strand, channel) in [(0, 2), (1, 0)]:
+        covered = counts[strand] > 0
+        covered &= counts[strand] >= counts[1 - strand]
+        # identities from 0.5 to 1 go from the faintest color to the full
+        # one; identities below 0.5 are shown as 0.5
+        mean_identity = identities[strand][covered] / counts[strand][covered]
+        intensity = 0.3 + 0.7 * np.clip((mean_identity - 0.5) / 0.5, 0, 1)
+        shade = (255 * (1 - intensity)).astype(np.uint8)
+
+        image[covered] = shade[:, None]
+        image[covered, channel] = 255
+
+    return image.reshape(size, size, 3)
+
+
+def draw_grid(image, offsets_query, offsets_target, scale_x, scale_y, size):
+    for offset in offsets_query[1:-1]:
+        x = min(int(offset * scale_x), size - 1)
+        image[x + size * np.arange(size)] = GRID_COLOR
+
+    for offset in offsets_target[1:-1]:
+        y = size - 1 - min(int(offset * scale_y), size - 1)
+        image[y * size + np.arange(size)] = GRID_COLOR
+
+
+def draw_blocks(image, synteny_blocks_query, synteny_blocks_target,
+                offsets_query, offsets_target, scale_x, scale_y, size):
+    # the outline of the rectangle spanned by the two sides of each block
+    id2block_query = build_id2block(synteny_blocks_query)
+    id2block_target = build_id2block(synteny_blocks_target)
+
+    for block_id in range(1, len(id2block_query)):
+        if id2block_query[block_id] is None:
+            continue
+
+        block_query = forward_block(id2block_query[block_id])
+        block_target = forward_block(id2block_target[block_id])
+
+        offset_query = offsets_query[block_query.sequence_id >> 1]
+        offset_target = offsets_target[block_target.sequence_id >> 1]
+
+        x0 = min(int((offset_query + block_query.start) * scale_x), size - 1)
+        x1 = min(int((offset_query + block_query.end) * scale_x), size - 1)
+        y0 = size - 1 - min(int((offset_target + block_target.end) * scale_y), size - 1)
+        y1 = size - 1 - min(int((offset_target + block_target.start) * scale_y), size - 1)
+
+        for y in [y0, y1]:
+            image[y * size + np.arange(x0, x1 + 1)] = BLOCK_COLOR
+
+        for x in [x0, x1]:
+            image[np.arange(y0, y1 + 1) * size + x] = BLOCK_COLOR
+
+
+def save_png(image, out_file):
+    height, width, _ = image.shape
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8),
+                           image.reshape(height, width * 3)], axis=1)
+
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + \
+            struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff)
+
+    with open(out_file, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def save_pgm(image, out_file):
+    # grayscale version: the darkest channel of each pixel
+    height, width, _ = image.shape
+
+    with open(out_file, "wb") as f:
+        f.write("P5\n{} {}\n255\n".format(width, height).encode())
+        f.write(image.min(axis=2).astype(np.uint8).tobytes())
+
+
+def save_dot_plot(result, out_dir, out_file="dot_plot.png", size=1000):
+    image = build_dot_plot(result.raw_hits,
+                           result.assembly_graph_query.graph["sequences"],
+                           result.assembly_graph_target.graph["sequences"],
+                           result.synteny_blocks_query, result.synteny_blocks_target, size)
+
+    out_file = "{}/{}".format(out_dir, out_file)
+    if out_file.endswith(".pgm"):
+        save_pgm(image, out_file)
+    else:
+        save_png(image, out_file)
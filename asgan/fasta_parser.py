@@ -1,3 +1,6 @@
+from asgan.compression import open_input
+
+
 
 
 def read_fasta(file_handle):
@@ -25,7 +28,7 @@ def read_fasta(file_handle):
 def make_fasta_dict(input_fasta):
     sequences = dict()
 
-    with open(input_fasta) as f:
+    with open_input(input_fasta) as f:
         for header, seq in read_fasta(f):
             sequences[header] = seq
 
@@ -0,0 +1,180 @@
+import os
+import mmap
+import pickle
+from collections import deque
+
+import numpy as np
+
+from asgan.compression import is_compressed
+
+INDEX_SUFFIX = ".gfai"
+
+
+class GfaIndex:
+    # Byte offsets and lengths of the sequence fields of the S records of a
+    # GFA, in the file order, and the segments adjacent through links as a
+    # CSR array: the neighbours of segment i are
+    # neighbours[neighbour_starts[i]:neighbour_starts[i + 1]]. Segments
+    # only mentioned in links have the offset -1. The size and mtime of the
+    # GFA tell whether the index is still valid.
+    def __init__(self, names, offsets, lengths, neighbour_starts, neighbours,
+                 file_size, file_mtime):
+        self.names = names
+        self.offsets = offsets
+        self.lengths = lengths
+        self.neighbour_starts = neighbour_starts
+        self.neighbours = neighbours
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+        self.name2id = {name: i for (i, name) in enumerate(names)}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["name2id"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.name2id = {name: i for (i, name) in enumerate(self.names)}
+
+    def is_valid(self, gfa_file):
+        stat = os.stat(gfa_file)
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime
+
+    def component(self, name):
+        # breadth-first search over the links, so the time is proportional
+        # to the size of the component; segments are in the file order
+        start = self.name2id[name]
+        visited, queue = {start}, deque([start])
+
+        while queue:
+            i = queue.popleft()
+            for j in self.neighbours[self.neighbour_starts[i]:self.neighbour_starts[i + 1]].tolist():
+                if j not in visited:
+                    visited.add(j)
+                    queue.append(j)
+
+        return [self.names[i] for i in sorted(visited, key=lambda i: self.offsets[i])]
+
+
+def build_gfa_index(gfa_file):
+    names, name2id, offsets, lengths = [], dict(), [], []
+    links_from, links_to = [], []
+
+    def intern(name):
+        if name not in name2id:
+            name2id[name] = len(names)
+            names.append(name)
+            offsets.append(-1)
+            lengths.append(0)
+        return name2id[name]
+
+    # offsets are only meaningful in a file that can be read at random
+    if is_compressed(gfa_file):
+        raise ValueError("{}: can not index a compressed GFA".format(gfa_file))
+
+    stat = os.stat(gfa_file)
+
+    with open(gfa_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0
+        while pos < len(mm):
+            end = mm.find(b"\n", pos)
+            if end == -1:
+                end = len(mm)
+
+            record_type = mm[pos:pos + 2]
+
+            if record_type == b"S\t":
+                name_end = mm.find(b"\t", pos + 2, end)
+                if name_end != -1:
+                    sequence_end = mm.find(b"\t", name_end + 1, end)
+                    if sequence_end == -1:
+                        sequence_end = end - 1 if mm[end - 1:end] == b"\r" else end
+
+                    i = intern(mm[pos + 2:name_end].decode())
+                    offsets[i] = name_end + 1
+                    lengths[i] = sequence_end - name_end - 1
+
+            if record_type == b"L\t":
+                record = mm[pos:end].split(b"\t")
+                links_from.append(intern(record[1].decode()))
+                links_to.append(intern(record[3].decode()))
+
+            pos = end + 1
+
+    # both directions of every link, grouped by the first segment
+    links_from, links_to = (np.array(links_from + links_to, dtype=np.int64),
+                            np.array(links_to + links_from, dtype=np.int64))
+    order = np.argsort(links_from, kind="stable")
+    neighbour_starts = np.searchsorted(links_from[order], np.arange(len(names) + 1))
+
+    return GfaIndex(names, np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64),
+                    neighbour_starts, links_to[order], stat.st_size, stat.st_mtime_ns)
+
+
+def save_gfa_index(index, index_file):
+    with open(index_file, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_gfa_index(index_file):
+    with open(index_file, "rb") as f:
+        return pickle.load(f)
+
+
+def read_gfa_index(gfa_file):
+    # the index next to the GFA is rebuilt once the GFA changes
+    index_file = gfa_file + INDEX_SUFFIX
+
+    if os.path.exists(index_file):
+        index = load_gfa_index(index_file)
+        if index.is_valid(gfa_file):
+            return index
+
+    index = build_gfa_index(gfa_file)
+    save_gfa_index(index, index_file)
+    return index
+
+
+def extract_sequences(gfa_file, index, names, out_file):
+    # only the S records of the given segments are read, in the given order
+    with open(gfa_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            open(out_file, "wb") as fout:
+        for name in names:
+            i = index.name2id[name]
+            if index.offsets[i] == -1:
+                continue
+
+            start, length = int(index.offsets[i]), int(index.lengths[i])
+            fout.write(b">" + name.encode() + b"\n")
+            fout.write(mm[start:start + length])
+            fout.write(b"\n")
+
+    return out_file
+
+
+def read_synteny_path(synteny_paths_file, path_number, assembly="query"):
+    # the names of the sequences of a path of synteny_paths.txt in the order
+    # of the path; paths are numbered from 1 and separated by empty lines
+    column = 1 if assembly == "query" else 5
+    names, path, in_path = [], 0, False
+
+    with open(synteny_paths_file) as f:
+        for line in f:
+            if not line.strip():
+                in_path = False
+                continue
+
+            if not in_path:
+                in_path = True
+                path += 1
+
+            if path > path_number:
+                break
+
+            if path == path_number:
+                name = line.rstrip("\n").split("\t")[column].strip()
+                if name and name[:-1] not in names:
+                    names.append(name[:-1])
+
+    return names
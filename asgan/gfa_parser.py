@@ -1,8 +1,17 @@
 from collections import namedtuple
-from asgan.common import inv_sign
+from asgan.common import oriented_id, complement_id, sequence_strand
+from asgan.compression import open_input
 
-Link = namedtuple("Link", ["from_name", "from_strand", "to_name", "to_strand"])
-Sequence = namedtuple("Sequence", ["name", "length", "seq", "is_repeat"])
+# from_id and to_id are oriented sequence ids (see common.oriented_id)
+Link = namedtuple("Link", ["from_id", "to_id"])
+Sequence = namedtuple("Sequence", ["name", "length", "seq", "is_repeat", "depth"])
+
+# tags holding the mean depth of a segment and tags holding a total count
+# over the segment that has to be divided by its length
+DEPTH_TAGS = ["dp", "DP", "ll"]
+COUNT_TAGS = ["KC", "RC"]
+
+CHUNK_SIZE = 1 << 20
 
 
 class RecordType:
@@ -10,61 +19,265 @@ class RecordType:
     LINK = "L"
 
 
+class SequenceTable:
+    # Symbol table of the sequences of an assembly graph. Each name gets a
+    # dense index in the order it first appears in the GFA; the attributes
+    # of both strands are looked up by sequence_id >> 1.
+    def __init__(self):
+        self.names = []
+        self.lengths = []
+        self.is_repeat = []
+        self.depths = []
+        self.name2id = dict()
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        index = self.name2id.get(name)
+
+        if index is None:
+            index = len(self.names)
+            self.name2id[name] = index
+            self.names.append(name)
+            self.lengths.append(0)
+            self.is_repeat.append(False)
+            self.depths.append(None)
+
+        return index
+
+    def add(self, sequence):
+        index = self.intern(sequence.name)
+        self.lengths[index] = sequence.length
+        self.is_repeat[index] = sequence.is_repeat
+        self.depths[index] = sequence.depth
+        return index
+
+    def oriented_name(self, sequence_id):
+        return self.names[sequence_id >> 1] + sequence_strand(sequence_id)
+
+    def length(self, sequence_id):
+        return self.lengths[sequence_id >> 1]
+
+
 def parse_gfa(gfa_file):
-    sequences, links = [], []
+    sequences, links = SequenceTable(), set()
 
-    with open(gfa_file) as f:
-        for line in f:
-            record = line.strip().split()
+    with open_input(gfa_file, "rb") as f:
+        for (record, length) in GfaTokenizer(f).records():
             record_type = record[0]
 
             if record_type == RecordType.SEQUENCE:
-                sequences.append(parse_sequence(record))
+                sequences.add(parse_sequence_record(record[1], length, None, record[3:]))
 
             if record_type == RecordType.LINK:
-                link = parse_link(record)
-                links.append(link)
-                links.append(inv_link(link))
+                link = parse_link(record, sequences)
+                links.add(link)
+                links.add(inv_link(link))
 
-    return sequences, list(set(links))
+    return sequences, sorted(links)
 
 
-def extract_sequences(gfa_file, out_dir, out_file):
+def extract_sequences(gfa_file, out_dir, out_file, skip=()):
+    # skip holds the names of the sequences that are not needed
     out_file = "{}/{}".format(out_dir, out_file)
 
-    with open(gfa_file) as fin, open(out_file, "w") as fout:
-        for line in fin:
-            record = line.strip().split()
-            record_type = record[0]
+    with open_input(gfa_file, "rb") as fin, open(out_file, "wb") as fout:
+        def sink(name):
+            if name in skip:
+                return None
 
-            if record_type == RecordType.SEQUENCE:
-                sequence = parse_sequence(record)
-                fout.write(">{}\n{}\n".format(sequence.name, sequence.seq))
+            fout.write(b">" + name.encode() + b"\n")
+            return fout.write
+
+        for (record, _) in GfaTokenizer(fin, sink).records():
+            if record[0] == RecordType.SEQUENCE and record[1] not in skip:
+                fout.write(b"\n")
 
     return out_file
 
 
+class GfaTokenizer:
+    # Splits the records of a GFA opened in binary mode into fields, reading
+    # it in fixed-size chunks. Lines that fit in a chunk are split as text;
+    # the sequence field of a longer S record is never held in memory as a
+    # whole. Its pieces are passed to the writer that sequence_sink(name)
+    # returns (None to drop the sequence), and the record holds None in its
+    # place. Records are yielded with the length of the sequence field.
+    def __init__(self, file_handle, sequence_sink=None, chunk_size=CHUNK_SIZE):
+        self.file_handle = file_handle
+        self.sequence_sink = sequence_sink
+        self.chunk_size = chunk_size
+        self.buffer = b""
+        self.pos = 0
+
+    def fill(self):
+        chunk = self.file_handle.read(self.chunk_size)
+        if not chunk:
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def records(self):
+        while True:
+            # all the complete lines in the buffer are decoded and split at
+            # once, which is as fast as reading the file line by line
+            end = self.buffer.rfind(b"\n", self.pos)
+            if end != -1:
+                lines = self.buffer[self.pos:end].decode().split("\n")
+                self.pos = end + 1
+
+                for line in lines:
+                    record = self.split_line(line)
+                    if record is not None:
+                        yield record
+                continue
+
+            if self.buffer.startswith(b"S\t", self.pos) and self.has_long_sequence():
+                yield self.read_long_sequence()
+                continue
+
+            if self.buffer.find(b"\n", self.pos) != -1 or self.fill():
+                continue
+
+            # the last line, without a line break
+            if self.pos < len(self.buffer):
+                record = self.split_line(self.buffer[self.pos:].decode())
+                self.pos = len(self.buffer)
+                if record is not None:
+                    yield record
+            return
+
+    def split_line(self, line):
+        if line.endswith("\r"):
+            line = line[:-1]
+        if not line:
+            return None
+
+        fields = line.split("\t")
+        if fields[0] != RecordType.SEQUENCE or len(fields) < 2:
+            return fields, None
+
+        sequence = fields[2] if len(fields) > 2 else ""
+
+        if self.sequence_sink is not None:
+            write = self.sequence_sink(fields[1])
+            if write is not None and sequence:
+                write(sequence.encode())
+
+        return ["S", fields[1], None] + fields[3:], len(sequence)
+
+    def has_long_sequence(self):
+        # whether the S record at pos goes on past its name, reading more
+        # chunks until the end of the name is in the buffer
+        while True:
+            tab = self.buffer.find(b"\t", self.pos + 2)
+            newline = self.buffer.find(b"\n", self.pos + 2, None if tab == -1 else tab)
+
+            if newline != -1:
+                return False
+            if tab != -1:
+                return True
+            if not self.fill():
+                return False
+
+    def read_long_sequence(self):
+        name_end = self.buffer.find(b"\t", self.pos + 2)
+        name = self.buffer[self.pos + 2:name_end].decode()
+        self.pos = name_end + 1
+
+        write = None
+        if self.sequence_sink is not None:
+            write = self.sequence_sink(name)
+
+        length, delimiter = self.stream_field(write)
+        record = ["S", name, None]
+
+        if delimiter == b"\t":
+            end = self.buffer.find(b"\n", self.pos)
+            while end == -1 and self.fill():
+                end = self.buffer.find(b"\n", self.pos)
+            if end == -1:
+                end = len(self.buffer)
+
+            tags = self.buffer[self.pos:end].rstrip(b"\r")
+            self.pos = end + 1
+            record.extend(field.decode() for field in tags.split(b"\t"))
+
+        return record, length
+
+    def stream_field(self, write):
+        # passes the field to write chunk by chunk; returns its length and
+        # the delimiter that ends it (b"" at the end of the file)
+        length = 0
+
+        while True:
+            tab = self.buffer.find(b"\t", self.pos)
+            end = self.buffer.find(b"\n", self.pos, None if tab == -1 else tab)
+            end = tab if end == -1 else end
+
+            if end != -1:
+                piece, delimiter = self.buffer[self.pos:end], self.buffer[end:end + 1]
+                self.pos = end + 1
+            else:
+                # a trailing \r stays in the buffer until the next chunk
+                # shows whether it ends the line
+                piece_end = len(self.buffer) - self.buffer.endswith(b"\r")
+                piece, delimiter = self.buffer[self.pos:piece_end], None
+                self.pos = piece_end
+
+            if delimiter is not None or not self.fill():
+                piece = piece[:-1] if piece.endswith(b"\r") else piece
+                delimiter = delimiter or b""
+
+            if write is not None and piece:
+                write(piece)
+            length += len(piece)
+
+            if delimiter is not None:
+                return length, delimiter
+
+
 def parse_sequence(record):
-    name = record[1]
-    seq = record[2]
-    length = len(seq)
+    return parse_sequence_record(record[1], len(record[2]), record[2], record[3:])
+
+
+def parse_sequence_record(name, length, seq, tags):
+    # the length from the LN:i tag takes precedence over the one of seq
     is_repeat = False
+    depth, is_count = None, False
+
+    for tag in tags:
+        tag = tag.split(":", 2)
+        if len(tag) != 3:
+            continue
 
-    if len(record) > 3 and record[3].startswith("r"):
-        is_repeat = (int(record[3].split(":")[-1]) == 1)
+        tag_name, value = tag[0], tag[2]
 
-    return Sequence(name, length, seq, is_repeat)
+        if tag_name == "LN":
+            length = int(value)
+        elif tag_name == "r":
+            is_repeat = (int(value) == 1)
+        elif tag_name in DEPTH_TAGS and depth is None:
+            depth = float(value)
+        elif tag_name in COUNT_TAGS and depth is None:
+            depth, is_count = float(value), True
 
+    # counts are divided once the length is known
+    if is_count:
+        depth = depth / length if length > 0 else None
 
-def parse_link(record):
+    return Sequence(name, length, seq, is_repeat, depth)
+
+
+def parse_link(record, sequences):
     from_name, from_strand, to_name, to_strand = record[1:5]
-    return Link(from_name, from_strand, to_name, to_strand)
+    from_id = oriented_id(sequences.intern(from_name), from_strand)
+    to_id = oriented_id(sequences.intern(to_name), to_strand)
+    return Link(from_id, to_id)
 
 
 def inv_link(link):
-    from_name = link.to_name
-    from_strand = inv_sign(link.to_strand)
-    to_name = link.from_name
-    to_strand = inv_sign(link.from_strand)
-
-    return Link(from_name, from_strand, to_name, to_strand)
+    return Link(complement_id(link.to_id), complement_id(link.from_id))
@@ -1,84 +1,87 @@
-from asgan.output_generator import pretty_number
+import os
+import heapq
+import tempfile
+from itertools import islice
+
+import numpy as np
+
+from asgan.common import oriented_id, complement_id
+
+MIN_HIT_LENGTH = 50000
+MAX_HITS_DIST = 1 * 10**6
+
+# binary record of a processed hit in the sorted runs of sort_hits_external,
+# with the fields in the order of the PafHit arguments
+HIT_DTYPE = np.dtype([("query_id", "<i8"), ("query_len", "<i8"),
+                      ("query_start", "<i8"), ("query_end", "<i8"),
+                      ("target_id", "<i8"), ("target_len", "<i8"),
+                      ("target_start", "<i8"), ("target_end", "<i8")])
+
+# estimated memory taken by a hit while a run is being sorted: the tuple of
+# its fields and the record in the sorted array
+HIT_MEMORY = 512
 
 
 class PafHit:
-    def __init__(self, query_name, query_len, query_start, query_end,
-                 target_name, target_len, target_start, target_end):
+    # query_id and target_id are oriented sequence ids (see common.oriented_id)
+    def __init__(self, query_id, query_len, query_start, query_end,
+                 target_id, target_len, target_start, target_end):
         self.id = None
 
-        self.query_name = query_name
+        self.query_id = query_id
         self.query_len = query_len
         self.query_start = query_start
         self.query_end = query_end
 
-        self.target_name = target_name
+        self.target_id = target_id
         self.target_len = target_len
         self.target_start = target_start
         self.target_end = target_end
 
-    def signed_id(self):
-        return ["-", "+"][self.id > 0] + str(abs(self.id))
-
     def query_hit_length(self):
         return self.query_end - self.query_start
 
     def target_hit_length(self):
         return self.target_end - self.target_start
 
-    def __str__(self):
-        query_info = "{}\t{}\t{}\t{}\t".format(
-            self.query_name,
-            pretty_number(self.query_len),
-            pretty_number(self.query_start),
-            pretty_number(self.query_end))
-        target_info = "{}\t{}\t{}\t{}".format(
-            self.target_name,
-            pretty_number(self.target_len),
-            pretty_number(self.target_start),
-            pretty_number(self.target_end))
-
-        return query_info + target_info
 
+def process_raw_hits(raw_hits, min_hit_length=MIN_HIT_LENGTH, max_hits_dist=MAX_HITS_DIST,
+                     max_memory=None):
+    # Only one strand of each hit is kept: the query side is always on the
+    # forward strand, the complement hit is given by complement_hit. With
+    # max_memory (in bytes), the raw hits are streamed into runs sorted out
+    # of core, and the united hits are returned as a generator that yields
+    # them as the runs are merged.
+    raw_hits = filter_by_len(raw_hits, min_hit_length)
 
-def process_raw_hits(raw_hits):
-    raw_hits = filter_by_len(raw_hits)
+    if max_memory is not None:
+        return unite_hits_external(map(process_raw_hit, raw_hits), max_hits_dist, max_memory)
 
     processed_hits = []
     for raw_hit in raw_hits:
         processed_hit = process_raw_hit(raw_hit)
         processed_hits.append(processed_hit)
 
-    united_hits = unite_processed_hits(processed_hits)
+    united_hits = unite_processed_hits(processed_hits, max_hits_dist)
 
     for i, hit in enumerate(united_hits):
         hit.id = i + 1
 
-    hits = []
-    for hit in united_hits:
-        hits.append(hit)
-        hits.append(complement_hit(hit))
-
-    return hits
-
+    return united_hits
 
-def filter_repeats(raw_hits, repeats_query, repeats_target):
-    filtered_hits = []
 
+def filter_repeats(raw_hits, sequences_query, sequences_target):
     for hit in raw_hits:
-        if hit.query_name in repeats_query:
+        if sequences_query.is_repeat[hit.query_id]:
             continue
 
-        if hit.target_name in repeats_target:
+        if sequences_target.is_repeat[hit.target_id]:
             continue
 
-        filtered_hits.append(hit)
-
-    return filtered_hits
+        yield hit
 
 
-def filter_by_len(raw_hits, min_hit_length=50000):
-    filtered_hits = []
-
+def filter_by_len(raw_hits, min_hit_length=MIN_HIT_LENGTH):
     for raw_hit in raw_hits:
         if raw_hit.query_hit_length() < min_hit_length:
             continue
@@ -86,16 +89,14 @@ def filter_by_len(raw_hits, min_hit_length=50000):
         if raw_hit.target_hit_length() < min_hit_length:
             continue
 
-        filtered_hits.append(raw_hit)
-
-    return filtered_hits
+        yield raw_hit
 
 
 def process_raw_hit(raw_hit):
-    query_name = raw_hit.query_name + "+"
+    query_id = oriented_id(raw_hit.query_id, "+")
     query_start = raw_hit.query_start
     query_end = raw_hit.query_end
-    target_name = raw_hit.target_name + raw_hit.strand
+    target_id = oriented_id(raw_hit.target_id, raw_hit.strand)
 
     if raw_hit.strand == "+":
         target_start = raw_hit.target_start
@@ -105,57 +106,110 @@ def process_raw_hit(raw_hit):
         target_end = raw_hit.target_len - raw_hit.target_start
 
     processed_hit = PafHit(
-        query_name, raw_hit.query_len, query_start, query_end,
-        target_name, raw_hit.target_len, target_start, target_end)
+        query_id, raw_hit.query_len, query_start, query_end,
+        target_id, raw_hit.target_len, target_start, target_end)
 
     return processed_hit
 
 
-def unite_processed_hits(processed_hits):
-    processed_hits.sort(key=lambda hit: (-hit.query_len,
-                                         hit.query_name,
-                                         hit.query_start))
+def unite_processed_hits(processed_hits, max_hits_dist=MAX_HITS_DIST):
+    if not processed_hits:
+        return []
+
+    processed_hits.sort(key=hit_order)
+    return list(unite_sorted_hits(processed_hits, max_hits_dist))
 
-    united_hits = []
-    curr_hit = processed_hits[0]
-    max_hits_dist = 1 * 10**6
 
-    for i in range(1, len(processed_hits)):
-        next_hit = processed_hits[i]
+def hit_order(hit):
+    return (-hit.query_len, hit.query_id, hit.query_start)
 
+
+def unite_sorted_hits(sorted_hits, max_hits_dist=MAX_HITS_DIST):
+    # sorted_hits is any iterable of hits in hit_order
+    sorted_hits = iter(sorted_hits)
+    curr_hit = next(sorted_hits, None)
+    if curr_hit is None:
+        return
+
+    for next_hit in sorted_hits:
         query_hits_dist = next_hit.query_start - curr_hit.query_end
         target_hits_dist = next_hit.target_start - curr_hit.target_end
 
-        if curr_hit.query_name != next_hit.query_name \
-           or curr_hit.target_name != next_hit.target_name \
+        if curr_hit.query_id != next_hit.query_id \
+           or curr_hit.target_id != next_hit.target_id \
            or curr_hit.target_end > next_hit.target_end \
            or not (query_hits_dist <= max_hits_dist) \
            or not (target_hits_dist <= max_hits_dist):
-            united_hits.append(curr_hit)
-            curr_hit = processed_hits[i]
+            yield curr_hit
+            curr_hit = next_hit
         else:
             curr_hit.query_end = next_hit.query_end
             curr_hit.target_end = next_hit.target_end
 
-    united_hits.append(curr_hit)
+    yield curr_hit
 
-    return united_hits
+
+def unite_hits_external(processed_hits, max_hits_dist, max_memory):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sorted_hits = sort_hits_external(processed_hits, max_memory, tmp_dir)
+
+        for (i, hit) in enumerate(unite_sorted_hits(sorted_hits, max_hits_dist)):
+            hit.id = i + 1
+            yield hit
+
+
+def sort_hits_external(hits, max_memory, tmp_dir):
+    # The hits are sorted in runs that fit in max_memory, which are saved
+    # to tmp_dir as arrays of HIT_DTYPE records and then merged as a stream.
+    # Both the sort of a run and the merge are stable, so equal hits come
+    # in the same order as with the in-memory sort of unite_processed_hits.
+    run_size = max(1, max_memory // HIT_MEMORY)
+    run_files = []
+
+    hits = iter(hits)
+    while True:
+        records = [(hit.query_id, hit.query_len, hit.query_start, hit.query_end,
+                    hit.target_id, hit.target_len, hit.target_start, hit.target_end)
+                   for hit in islice(hits, run_size)]
+        if not records:
+            break
+
+        records = np.array(records, dtype=HIT_DTYPE)
+        order = np.lexsort((records["query_start"], records["query_id"], -records["query_len"]))
+
+        run_file = os.path.join(tmp_dir, "hits_{}.bin".format(len(run_files)))
+        records[order].tofile(run_file)
+        run_files.append(run_file)
+
+    # the memory is shared by the read buffers of the runs while merging
+    buffer_size = max(1, max_memory // (HIT_MEMORY * max(1, len(run_files))))
+    return heapq.merge(*[read_hits(run_file, buffer_size) for run_file in run_files],
+                       key=hit_order)
+
+
+def read_hits(run_file, buffer_size):
+    with open(run_file, "rb") as f:
+        while True:
+            records = np.fromfile(f, dtype=HIT_DTYPE, count=buffer_size)
+            if len(records) == 0:
+                return
+
+            for record in records.tolist():
+                yield PafHit(*record)
 
 
 def complement_hit(hit):
-    query_name = hit.query_name[:-1]
-    query_name += ["+", "-"][hit.query_name.endswith("+")]
+    query_id = complement_id(hit.query_id)
     query_start = hit.query_len - hit.query_end
     query_end = hit.query_len - hit.query_start
 
-    target_name = hit.target_name[:-1]
-    target_name += ["+", "-"][hit.target_name.endswith("+")]
+    target_id = complement_id(hit.target_id)
     target_start = hit.target_len - hit.target_end
     target_end = hit.target_len - hit.target_start
 
     complement_hit = PafHit(
-        query_name, hit.query_len, query_start, query_end,
-        target_name, hit.target_len, target_start, target_end)
+        query_id, hit.query_len, query_start, query_end,
+        target_id, hit.target_len, target_start, target_end)
 
     complement_hit.id = -hit.id
     return complement_hit
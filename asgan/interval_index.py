@@ -0,0 +1,121 @@
+import numpy as np
+
+
+class IntervalIndex:
+    # Positional index over intervals on the forward strands of the
+    # sequences of one assembly. Overlapping intervals are split into
+    # disjoint segments, each holding the values of all intervals covering
+    # it. Values are non-zero ints; batch lookups return 0 for positions
+    # that are not covered and the value of the first added interval
+    # otherwise.
+    def __init__(self, sequence_lengths, intervals):
+        offsets = [0]
+        for length in sequence_lengths:
+            offsets.append(offsets[-1] + length)
+
+        by_sequence = dict()
+        for (sequence, start, end, value) in intervals:
+            if start < end:
+                by_sequence.setdefault(sequence, []).append((start, end, value))
+
+        starts, ends, values = [], [], []
+        for sequence in sorted(by_sequence):
+            for (start, end, segment_values) in split_intervals(by_sequence[sequence]):
+                starts.append(offsets[sequence] + start)
+                ends.append(offsets[sequence] + end)
+                values.append(segment_values)
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        self.first_values = np.array([segment_values[0] for segment_values in values],
+                                     dtype=np.int64)
+        self.values = values
+
+    def find(self, sequence, position):
+        if not 0 <= position < self.offsets[sequence + 1] - self.offsets[sequence]:
+            return []
+
+        key = int(self.offsets[sequence]) + position
+        i = int(np.searchsorted(self.starts, key, side="right")) - 1
+
+        if i < 0 or key >= self.ends[i]:
+            return []
+
+        return list(self.values[i])
+
+    def find_batch(self, sequences, positions):
+        sequences = np.asarray(sequences, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+
+        if len(self.starts) == 0:
+            return np.zeros(len(positions), dtype=np.int64)
+
+        lengths = self.offsets[sequences + 1] - self.offsets[sequences]
+        keys = self.offsets[sequences] + positions
+
+        i = np.searchsorted(self.starts, keys, side="right") - 1
+        found = (i >= 0) & (positions >= 0) & (positions < lengths)
+        i = np.maximum(i, 0)
+
+        found &= keys < self.ends[i]
+        return np.where(found, self.first_values[i], 0)
+
+
+def split_intervals(intervals):
+    starts_at, ends_at = dict(), dict()
+    for (i, (start, end, _)) in enumerate(intervals):
+        starts_at.setdefault(start, []).append(i)
+        ends_at.setdefault(end, []).append(i)
+
+    bounds = sorted(set(starts_at) | set(ends_at))
+    segments = []
+    active = set()
+
+    for (lo, hi) in zip(bounds, bounds[1:]):
+        active.difference_update(ends_at.get(lo, []))
+        active.update(starts_at.get(lo, []))
+
+        if not active:
+            continue
+
+        segment_values = tuple(dict.fromkeys(intervals[i][2] for i in sorted(active)))
+
+        if segments and segments[-1][1] == lo and segments[-1][2] == segment_values:
+            segments[-1] = (segments[-1][0], hi, segment_values)
+        else:
+            segments.append((lo, hi, segment_values))
+
+    return segments
+
+
+def build_block_index(synteny_blocks, sequences):
+    # values are the signed ids of the blocks on the forward strand
+    intervals = []
+
+    for blocks in synteny_blocks:
+        if blocks is None:
+            continue
+
+        for block in blocks:
+            intervals.append((block.sequence_id >> 1, block.start, block.end, block.id))
+
+    return IntervalIndex(sequences.lengths, intervals)
+
+
+def build_path_index(path_sequences, sequences):
+    # values are path numbers starting from 1, in the order of path_sequences
+    intervals = []
+
+    for (i, path_sequence) in enumerate(path_sequences):
+        for subpath in path_sequence:
+            blocks = subpath if isinstance(subpath, list) else [subpath]
+
+            for block in blocks:
+                start, end = block.start, block.end
+                if block.sequence_id & 1:
+                    start, end = block.sequence_length - end, block.sequence_length - start
+
+                intervals.append((block.sequence_id >> 1, start, end, i + 1))
+
+    return IntervalIndex(sequences.lengths, intervals)
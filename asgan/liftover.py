@@ -0,0 +1,316 @@
+import argparse
+from itertools import islice
+
+import numpy as np
+
+from asgan.synteny_blocks import forward_block
+from asgan.interval_index import IntervalIndex
+from asgan.compression import open_input
+
+
+MAPPED, DELETED, SPLIT, GAP = 0, 1, 2, 3
+UNMAPPED_REASONS = {DELETED: "#Deleted in new",
+                    SPLIT: "#Split in new",
+                    GAP: "#In repeat gap in new"}
+STRAND_SYMBOLS = {1: "+", -1: "-", 0: "."}
+
+# column numbers of the sequence name, start, end, strand and sequence
+# length in the supported formats
+FILE_FORMATS = {"bed": (0, 1, 2, 5, None),
+                "paf": (0, 2, 3, 4, 1)}
+
+
+class LiftoverTable:
+    # One row per interval of a synteny path, with coordinates on the
+    # forward strands. Rows of paired synteny blocks have both sides and the
+    # strand of the target interval relative to the query one. Gap rows are
+    # the parts of paths between the blocks; they have only one side and -1
+    # for the sequence of the other one. Positions inside a block are
+    # interpolated linearly, since hits do not keep the alignment itself.
+    def __init__(self, names_query, lengths_query, names_target, lengths_target, rows):
+        self.names = {"query": list(names_query), "target": list(names_target)}
+        self.lengths = {"query": list(lengths_query), "target": list(lengths_target)}
+        self.name2id = {side: {name: i for (i, name) in enumerate(names)}
+                        for (side, names) in self.names.items()}
+
+        # block rows go first, so that the interval index prefers them over
+        # the gaps of other paths passing through the same position
+        rows = sorted(rows, key=lambda row: row[1] == 0)
+        columns = np.array(rows, dtype=np.int64).reshape(len(rows), 9)
+
+        self.paths = columns[:, 0]
+        self.blocks = columns[:, 1]
+        self.strands = columns[:, 8]
+        self.columns = {"query": columns[:, 2:5], "target": columns[:, 5:8]}
+        self.indices = dict()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def rows(self):
+        return zip(self.paths.tolist(), self.blocks.tolist(),
+                   self.columns["query"].tolist(), self.columns["target"].tolist(),
+                   self.strands.tolist())
+
+    def lift(self, sequence_names, starts, ends, reverse=False):
+        # lifts intervals from the query to the target, or back if reverse
+        # is set; returns the status of each interval (MAPPED or the reason
+        # it is unmapped) and the target names, starts, ends and strands
+        source, destination = sides(reverse)
+        sequence_ids = self.sequence_ids(source, sequence_names)
+        status, sequences, starts, ends, strands = self.lift_ids(sequence_ids, starts, ends,
+                                                                 reverse)
+        names = np.array(self.names[destination] + [""], dtype=object)[sequences]
+        return status, names, starts, ends, strands
+
+    def sequence_ids(self, side, sequence_names):
+        name2id = self.name2id[side]
+        names, inverse = np.unique(np.asarray(sequence_names, dtype=object).astype(str),
+                                   return_inverse=True)
+        name_ids = np.array([name2id.get(name, -1) for name in names], dtype=np.int64)
+        return name_ids[inverse]
+
+    def lift_ids(self, sequence_ids, starts, ends, reverse=False):
+        source, destination = sides(reverse)
+        sequence_ids = np.asarray(sequence_ids, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        # with no rows (no synteny paths) every interval is deleted
+        if len(self) == 0:
+            unmapped = np.full(len(starts), -1, dtype=np.int64)
+            return (np.full(len(starts), DELETED, dtype=np.int64), unmapped,
+                    unmapped.copy(), unmapped.copy(), np.zeros(len(starts), dtype=np.int64))
+
+        known = sequence_ids >= 0
+        sequence_ids = np.where(known, sequence_ids, 0)
+
+        # rows are numbered from 1 in the index, 0 standing for no row; -1
+        # selects the False appended to is_block below
+        index = self.get_index(source)
+        row_start = np.clip(index.find_batch(sequence_ids, starts) - 1, -1, len(self) - 1)
+        row_end = np.clip(index.find_batch(sequence_ids, np.maximum(ends - 1, starts)) - 1,
+                          -1, len(self) - 1)
+        row_start[~known] = -1
+        row_end[~known] = -1
+
+        is_block = np.append(self.blocks != 0, False)
+        in_gap = (((row_start >= 0) & ~is_block[row_start]) |
+                  ((row_end >= 0) & ~is_block[row_end]))
+
+        mapped = (row_start == row_end) & is_block[row_start]
+        status = np.full(len(starts), DELETED, dtype=np.int64)
+        status[~mapped & (row_start >= 0) & (row_end >= 0)] = SPLIT
+        status[~mapped & in_gap] = GAP
+        status[mapped] = MAPPED
+
+        row = np.where(mapped, row_start, 0)
+        source_columns = self.columns[source][row]
+        destination_columns = self.columns[destination][row]
+
+        source_start, source_end = source_columns[:, 1], source_columns[:, 2]
+        destination_start, destination_end = destination_columns[:, 1], destination_columns[:, 2]
+        scale = ((destination_end - destination_start) /
+                 np.maximum(source_end - source_start, 1))
+
+        offset_start = np.rint((starts - source_start) * scale).astype(np.int64)
+        offset_end = np.rint((ends - source_start) * scale).astype(np.int64)
+
+        strands = self.strands[row]
+        new_starts = np.where(strands > 0, destination_start + offset_start,
+                              destination_end - offset_end)
+        new_ends = np.where(strands > 0, destination_start + offset_end,
+                            destination_end - offset_start)
+        new_starts = np.clip(new_starts, destination_start, destination_end)
+        new_ends = np.clip(new_ends, new_starts, destination_end)
+
+        unmapped = ~mapped
+        sequences = np.where(mapped, destination_columns[:, 0], -1)
+        new_starts[unmapped] = -1
+        new_ends[unmapped] = -1
+        strands = np.where(mapped, strands, 0)
+
+        return status, sequences, new_starts, new_ends, strands
+
+    def get_index(self, side):
+        if side not in self.indices:
+            columns = self.columns[side]
+            intervals = [(sequence, start, end, i + 1)
+                         for (i, (sequence, start, end)) in enumerate(columns.tolist())
+                         if sequence >= 0]
+            self.indices[side] = IntervalIndex(self.lengths[side], intervals)
+
+        return self.indices[side]
+
+
+def sides(reverse):
+    return ("target", "query") if reverse else ("query", "target")
+
+
+def build_liftover_table(path_sequences_query, sequences_query,
+                         path_sequences_target, sequences_target):
+    rows = []
+
+    for (i, (path_query, path_target)) in enumerate(zip(path_sequences_query,
+                                                        path_sequences_target)):
+        for (element_query, element_target) in zip(path_query, path_target):
+            if isinstance(element_query, list):
+                for block in element_query:
+                    rows.append(gap_row(i + 1, block, is_query=True))
+
+                for block in element_target:
+                    rows.append(gap_row(i + 1, block, is_query=False))
+            else:
+                rows.append(block_row(i + 1, element_query, element_target))
+
+    rows = [row for row in rows if row[3] < row[4] or row[6] < row[7]]
+
+    return LiftoverTable(sequences_query.names, sequences_query.lengths,
+                         sequences_target.names, sequences_target.lengths, rows)
+
+
+def block_row(path, block_query, block_target):
+    strand = 1 if block_query.sequence_id & 1 == block_target.sequence_id & 1 else -1
+    return (path, block_query.id) + forward_interval(block_query) + \
+        forward_interval(block_target) + (strand,)
+
+
+def gap_row(path, block, is_query):
+    if is_query:
+        return (path, 0) + forward_interval(block) + (-1, 0, 0, 0)
+
+    return (path, 0, -1, 0, 0) + forward_interval(block) + (0,)
+
+
+def forward_interval(block):
+    block = forward_block(block)
+    return (block.sequence_id >> 1, block.start, block.end)
+
+
+def save_liftover_table(table, out_dir, out_file):
+    def format_side(side, sequence, start, end):
+        if sequence < 0:
+            return ".\t.\t.\t."
+
+        return "{}\t{}\t{}\t{}".format(table.names[side][sequence],
+                                       table.lengths[side][sequence], start, end)
+
+    with open("{}/{}".format(out_dir, out_file), "w") as f:
+        for (path, block, query, target, strand) in table.rows():
+            f.write("{}\t{}\t{}\t{}\t{}\n".format(
+                path, block if block != 0 else ".",
+                format_side("query", *query), format_side("target", *target),
+                STRAND_SYMBOLS[strand]))
+
+
+def load_liftover_table(table_file):
+    sequences = {"query": ([], [], dict()), "target": ([], [], dict())}
+
+    def parse_side(side, name, length, start, end):
+        if name == ".":
+            return (-1, 0, 0)
+
+        names, lengths, name2id = sequences[side]
+        if name not in name2id:
+            name2id[name] = len(names)
+            names.append(name)
+            lengths.append(int(length))
+
+        return (name2id[name], int(start), int(end))
+
+    rows = []
+    with open(table_file) as f:
+        for line in f:
+            record = line.rstrip("\n").split("\t")
+            block = int(record[1]) if record[1] != "." else 0
+            strand = {symbol: strand for (strand, symbol) in STRAND_SYMBOLS.items()}[record[10]]
+            rows.append((int(record[0]), block) + parse_side("query", *record[2:6]) +
+                        parse_side("target", *record[6:10]) + (strand,))
+
+    return LiftoverTable(sequences["query"][0], sequences["query"][1],
+                         sequences["target"][0], sequences["target"][1], rows)
+
+
+def lift_file(table, in_file, out_file, unmapped_file, file_format="bed",
+              reverse=False, chunk_size=100000):
+    # Lifts a BED or PAF file (the query columns of a PAF) chunk by chunk.
+    # Header and comment lines are copied as is; unmapped records go to
+    # unmapped_file, each preceded by the reason in the style of UCSC liftOver.
+    name_column, start_column, end_column, strand_column, length_column = \
+        FILE_FORMATS[file_format]
+    source, destination = sides(reverse)
+    number_mapped, number_unmapped = 0, 0
+
+    with open_input(in_file) as f_in, open(out_file, "w") as f_out, \
+            open(unmapped_file, "w") as f_unmapped:
+        while True:
+            lines = list(islice(f_in, chunk_size))
+            if not lines:
+                break
+
+            records = []
+            for line in lines:
+                if line.startswith(("#", "track", "browser")) or not line.strip():
+                    f_out.write(line)
+                else:
+                    records.append(line.rstrip("\n").split("\t"))
+
+            if not records:
+                continue
+
+            sequence_ids = table.sequence_ids(source, [record[name_column] for record in records])
+            starts = np.array([record[start_column] for record in records], dtype=np.int64)
+            ends = np.array([record[end_column] for record in records], dtype=np.int64)
+
+            status, sequences, starts, ends, strands = table.lift_ids(sequence_ids, starts, ends,
+                                                                      reverse)
+
+            names = table.names[destination]
+            lengths = table.lengths[destination]
+
+            for (record, record_status, sequence, start, end, strand) in zip(
+                    records, status.tolist(), sequences.tolist(),
+                    starts.tolist(), ends.tolist(), strands.tolist()):
+                if record_status != MAPPED:
+                    f_unmapped.write(UNMAPPED_REASONS[record_status] + "\n")
+                    f_unmapped.write("\t".join(record) + "\n")
+                    number_unmapped += 1
+                    continue
+
+                record[name_column] = names[sequence]
+                record[start_column] = str(start)
+                record[end_column] = str(end)
+
+                if length_column is not None:
+                    record[length_column] = str(lengths[sequence])
+
+                if strand < 0 and len(record) > strand_column:
+                    record[strand_column] = {"+": "-", "-": "+"}.get(record[strand_column],
+                                                                     record[strand_column])
+
+                f_out.write("\t".join(record) + "\n")
+                number_mapped += 1
+
+    return number_mapped, number_unmapped
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog="asgan liftover")
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--out-file", required=True)
+    parser.add_argument("--unmapped-file", required=True)
+    parser.add_argument("--format", default="bed", choices=sorted(FILE_FORMATS))
+    parser.add_argument("--reverse", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    table = load_liftover_table(args.table)
+    number_mapped, number_unmapped = lift_file(table, args.input, args.out_file,
+                                               args.unmapped_file, args.format,
+                                               args.reverse, args.chunk_size)
+    print("mapped: {}, unmapped: {}".format(number_mapped, number_unmapped))
+
@@ -1,18 +1,35 @@
 import os
+import sys
 import argparse
 
-import asgan.stats as st
-import asgan.paths as ps
-import asgan.hits as ht
-import asgan.aligner as aligner
-import asgan.assembly_graph as asg
-import asgan.adjacency_graph as adg
-import asgan.synteny_blocks as sb
-import asgan.breakpoint_graph as bpg
-import asgan.gfa_parser as gfa_parser
+import asgan.pipeline as pipeline
+import asgan.liftover as liftover
+import asgan.sweep as sweep
+import asgan.multi as multi
+import asgan.results_db as results_db
+import asgan.dotplot as dotplot
+import asgan.overlaps as ovl
+import asgan.checkpoint as ck
+import asgan.sketch as sk
 import asgan.output_generator as out_gen
+import asgan.assembly_graph as asg
+import asgan.sequence_store as ss
+import asgan.progress as progress
+import asgan.work_queue as work_queue
+
+# commands run as "python -m asgan <command> [args]" instead of a comparison
+COMMANDS = {"liftover": liftover.main, "sweep": sweep.main, "multi": multi.main,
+            "submit": work_queue.submit_main, "worker": work_queue.worker_main}
+
+
+def parse_size(size):
+    # a number of bytes with an optional K, M or G suffix
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
 
-import networkx as nx
+    if size[-1:].upper() in units:
+        return int(float(size[:-1]) * units[size[-1].upper()])
+
+    return int(size)
 
 
 def parse_args():
@@ -21,96 +38,108 @@ def parse_args():
     parser.add_argument("--input-target")
     parser.add_argument("--out-dir")
     parser.add_argument("--minimap-preset", default="asm10")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--repeat-detection", default="tag",
+                        choices=asg.REPEAT_DETECTION_METHODS)
+    parser.add_argument("--previous-run")
+    parser.add_argument("--prescreen", type=float)
+    parser.add_argument("--triage", action="store_true")
+    parser.add_argument("--database")
+    parser.add_argument("--dot-shards", action="store_true")
+    parser.add_argument("--max-dot-edges", type=int, default=2000)
+    parser.add_argument("--dot-plot", choices=["png", "pgm"])
+    parser.add_argument("--dot-plot-size", type=int, default=1000)
+    parser.add_argument("--overlap-stats", action="store_true")
+    parser.add_argument("--snapshot", action="store_true")
+    parser.add_argument("--snapshot-dir")
+    parser.add_argument("--path-fasta", action="store_true")
+    parser.add_argument("--max-memory", type=parse_size)
+    parser.add_argument("--progress")
     return parser.parse_args()
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     # Running the pipeline
     args = parse_args()
-    os.mkdir(args.out_dir)
-
-    gfa_query, gfa_target = args.input_query, args.input_target
-
-    print("Parsing assembly graphs..")
-    assembly_graph_query = asg.parse_assembly_graph(gfa_query)
-    assembly_graph_target = asg.parse_assembly_graph(gfa_target)
 
-    repeats_query = asg.get_repeats(assembly_graph_query)
-    repeats_target = asg.get_repeats(assembly_graph_target)
+    if args.triage:
+        out_gen.print_triage(*sk.triage(args.input_query, args.input_target))
+        return
 
-    print("Extracting sequences..")
-    sequences_query = gfa_parser.extract_sequences(gfa_query, out_dir=args.out_dir,
-                                                   out_file="sequences_query.fasta")
-    sequences_target = gfa_parser.extract_sequences(gfa_target, out_dir=args.out_dir,
-                                                    out_file="sequences_target.fasta")
-
-    print("Aligning sequences..")
-    raw_hits = aligner.align(sequences_query, sequences_target, args)
-    filtered_hits = ht.filter_repeats(raw_hits, repeats_query, repeats_target)
-    processed_hits = ht.process_raw_hits(filtered_hits)
-
-    print("Finding shared paths..")
-    synteny_blocks_query, synteny_blocks_target = sb.extract_synteny_blocks(processed_hits)
-
-    adjacency_graph_query = adg.build_adjacency_graph(assembly_graph_query, synteny_blocks_query)
-    adjacency_graph_target = adg.build_adjacency_graph(assembly_graph_target, synteny_blocks_target)
-
-    breakpoint_graph = bpg.build_breakpoint_graph(adjacency_graph_query, synteny_blocks_query,
-                                                  adjacency_graph_target, synteny_blocks_target)
-
-    max_matching = nx.max_weight_matching(breakpoint_graph)
+    os.mkdir(args.out_dir)
 
-    path_components = bpg.build_path_components(breakpoint_graph, max_matching)
-    unused_edges = bpg.get_unused_edges(breakpoint_graph, max_matching)
+    if args.progress is not None:
+        progress.enable(args.progress)
 
-    number_united_components = bpg.unite_cycles(path_components, unused_edges)
+    previous_run = None
+    if args.previous_run is not None:
+        previous_run = ck.load_checkpoint(args.previous_run)
 
-    synteny_paths = ps.build_synteny_paths(path_components)
-    path_sequences_query = ps.build_path_sequences(synteny_blocks_query, synteny_paths,
-                                                   adjacency_graph_query)
-    path_sequences_target = ps.build_path_sequences(synteny_blocks_target, synteny_paths,
-                                                    adjacency_graph_target)
+    result = pipeline.compare(args.input_query, args.input_target,
+                              minimap_preset=args.minimap_preset,
+                              threads=args.threads,
+                              repeat_detection=args.repeat_detection,
+                              previous_run=previous_run,
+                              prescreen=args.prescreen,
+                              use_snapshot=args.snapshot or args.snapshot_dir is not None,
+                              snapshot_dir=args.snapshot_dir,
+                              max_memory=args.max_memory,
+                              verbose=True)
 
-    print("Calculating stats..")
-    stats = st.calc_stats(assembly_graph_query, synteny_blocks_query, path_sequences_query,
-                          assembly_graph_target, synteny_blocks_target, path_sequences_target,
-                          synteny_paths, number_united_components, raw_hits, args.out_dir)
+    if args.overlap_stats:
+        result.stats.update(ovl.calc_stats(args.input_query, args.input_target))
 
     # Generating output
-    block_attributes = sb.set_block_attributes(synteny_paths)
-    out_gen.adjacency_graph_save_dot(adjacency_graph_query, out_dir=args.out_dir,
-                                     block_attributes=block_attributes,
-                                     out_file="adjacency_graph_query.gv")
-    out_gen.adjacency_graph_save_dot(adjacency_graph_target, out_dir=args.out_dir,
-                                     block_attributes=block_attributes,
-                                     out_file="adjacency_graph_target.gv")
-
-    out_gen.save_path_sequences(path_sequences_query, path_sequences_target,
-                                out_dir=args.out_dir)
-
-    out_gen.output_stats(stats, out_dir=args.out_dir)
-
-    os.remove(sequences_query)
-    os.remove(sequences_target)
+    with progress.stage("save_results"):
+        pipeline.save_results(result, out_dir=args.out_dir,
+                              dot_shards=args.dot_shards, max_dot_edges=args.max_dot_edges)
+
+    if args.dot_plot is not None:
+        dotplot.save_dot_plot(result, out_dir=args.out_dir,
+                              out_file="dot_plot.{}".format(args.dot_plot),
+                              size=args.dot_plot_size)
+
+    if args.path_fasta:
+        out_gen.path_sequences_save_fasta(result.path_sequences_query,
+                                          result.assembly_graph_query.graph["sequences"],
+                                          ss.read_sequence_store(args.input_query,
+                                                                 args.snapshot_dir),
+                                          result.path_sequences_target,
+                                          result.assembly_graph_target.graph["sequences"],
+                                          ss.read_sequence_store(args.input_target,
+                                                                 args.snapshot_dir),
+                                          out_dir=args.out_dir)
+
+    if args.database is not None:
+        results_db.save_result(result, args.database,
+                               query=args.input_query, target=args.input_target,
+                               minimap_preset=args.minimap_preset,
+                               repeat_detection=args.repeat_detection)
 
     '''
-    out_gen.save_blocks(synteny_blocks_query, synteny_blocks_target,
+    out_gen.save_blocks(result.synteny_blocks_query,
+                        result.assembly_graph_query.graph["sequences"],
+                        result.synteny_blocks_target,
+                        result.assembly_graph_target.graph["sequences"],
                         out_dir=args.out_dir, out_file="synteny_blocks.txt")
 
-    out_gen.assembly_graph_save_dot(graph=assembly_graph_query,
+    out_gen.assembly_graph_save_dot(graph=result.assembly_graph_query,
                                     out_file="assembly_graph_query.gv",
                                     out_dir=args.out_dir)
-    out_gen.assembly_graph_save_dot(graph=assembly_graph_target,
+    out_gen.assembly_graph_save_dot(graph=result.assembly_graph_target,
                                     out_file="assembly_graph_target.gv",
                                     out_dir=args.out_dir)
 
-    out_gen.save_raw_hits(raw_hits, out_dir=args.out_dir, out_file="raw_hits.txt")
+    out_gen.save_raw_hits(result.raw_hits,
+                          result.assembly_graph_query.graph["sequences"],
+                          result.assembly_graph_target.graph["sequences"],
+                          out_dir=args.out_dir, out_file="raw_hits.txt")
 
-    out_gen.breakpoint_graph_save_dot(breakpoint_graph, max_matching,
+    out_gen.breakpoint_graph_save_dot(result.breakpoint_graph, result.max_matching,
                                       out_dir=args.out_dir,
                                       out_file="breakpoint_graph.gv")
-
-    out_gen.path_sequences_save_fasta(path_sequences_query, sequences_query,
-                                      path_sequences_target, sequences_target,
-                                      args.out_dir)
     '''
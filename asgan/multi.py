@@ -0,0 +1,264 @@
+import os
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import networkx as nx
+import numpy as np
+
+import asgan.stats as st
+import asgan.paths as ps
+import asgan.pipeline as pipeline
+import asgan.checkpoint as ck
+import asgan.assembly_graph as asg
+import asgan.output_generator as out_gen
+from asgan.synteny_blocks import forward_block
+from asgan.interval_index import IntervalIndex
+
+MIN_COMMON_BLOCK_LENGTH = 10000
+
+
+class PairwiseBlocks:
+    # Synteny blocks of a comparison of the reference (query) with another
+    # assembly (target), on the forward strands of the reference sequences.
+    # rows are (sequence, start, end, path, rank, strand): the number of the
+    # synteny path, the position of the block in it and the strand of the
+    # reference sequence the path goes along.
+    def __init__(self, names, lengths, rows, stats):
+        self.names = names
+        self.lengths = lengths
+        self.rows = rows
+        self.stats = stats
+
+
+class MultiResult:
+    # Common blocks are the parts of the reference covered by a synteny
+    # block in every compared assembly, as (sequence, start, end).
+    # block_paths[i][j] is the pairwise synteny path of the assembly
+    # subset[i] going through the common block j + 1, negative if it goes
+    # along the reverse strand. Shared paths are lists of signed common
+    # block ids (starting from 1).
+    def __init__(self, gfa_files, subset, names, pairwise_blocks, common_blocks,
+                 block_paths, shared_paths):
+        self.gfa_files = gfa_files
+        self.subset = subset
+        self.names = names
+        self.pairwise_blocks = pairwise_blocks
+        self.common_blocks = common_blocks
+        self.block_paths = block_paths
+        self.shared_paths = shared_paths
+
+
+def compare_pair(gfa_reference, gfa_file, cache_dir, minimap_preset, threads,
+                 repeat_detection):
+    # the checkpoint of the previous comparison of the same files lets
+    # compare reuse the alignments of the unchanged sequences
+    previous_run = None
+    cache_file = None
+
+    if cache_dir is not None:
+        cache_file = checkpoint_cache_path(cache_dir, gfa_reference, gfa_file,
+                                           minimap_preset, repeat_detection)
+
+        if os.path.exists(os.path.join(cache_file, ck.CHECKPOINT_FILE)):
+            previous_run = ck.load_checkpoint(cache_file)
+
+    result = pipeline.compare(gfa_reference, gfa_file, minimap_preset=minimap_preset,
+                              threads=threads, repeat_detection=repeat_detection,
+                              previous_run=previous_run)
+
+    if cache_file is not None:
+        os.makedirs(cache_file, exist_ok=True)
+        ck.save_checkpoint(result.checkpoint, cache_file)
+
+    sequences = result.assembly_graph_query.graph["sequences"]
+    rows = []
+
+    for (i, path_sequence) in enumerate(result.path_sequences_query):
+        blocks = [element for element in path_sequence if not isinstance(element, list)]
+
+        for (rank, block) in enumerate(blocks):
+            strand = -1 if block.sequence_id & 1 else 1
+            block = forward_block(block)
+            rows.append((block.sequence_id >> 1, block.start, block.end, i + 1, rank, strand))
+
+    return PairwiseBlocks(sequences.names, sequences.lengths, rows, result.stats)
+
+
+def checkpoint_cache_path(cache_dir, gfa_query, gfa_target, minimap_preset, repeat_detection):
+    # the directory of the checkpoint of the last comparison of two files
+    key = "\t".join([os.path.abspath(gfa_query), os.path.abspath(gfa_target),
+                     minimap_preset, repeat_detection])
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+
+def find_common_blocks(lengths, pairwise_blocks, min_length=MIN_COMMON_BLOCK_LENGTH):
+    # Splits the reference at all block ends and keeps the pieces covered in
+    # every comparison; adjacent pieces lying in the same blocks are merged.
+    # Returns the common blocks and, for each comparison, the row of the
+    # block containing each common block.
+    indices, bounds = [], dict()
+
+    for blocks in pairwise_blocks:
+        intervals = []
+        for (i, (sequence, start, end, _, _, _)) in enumerate(blocks.rows):
+            intervals.append((sequence, start, end, i + 1))
+            bounds.setdefault(sequence, set()).update([start, end])
+
+        indices.append(IntervalIndex(lengths, intervals))
+
+    pieces = [(sequence, start, end)
+              for sequence in sorted(bounds)
+              for (start, end) in zip(sorted(bounds[sequence]), sorted(bounds[sequence])[1:])]
+
+    if not pieces:
+        return [], [[] for _ in pairwise_blocks]
+
+    sequences, starts, ends = (np.array(column, dtype=np.int64) for column in zip(*pieces))
+    rows = np.stack([index.find_batch(sequences, starts) for index in indices]) - 1
+    covered = (rows >= 0).all(axis=0)
+
+    common_blocks, common_rows = [], []
+    for i in np.nonzero(covered)[0].tolist():
+        piece, piece_rows = pieces[i], rows[:, i].tolist()
+
+        if common_blocks and common_blocks[-1][0] == piece[0] and \
+                common_blocks[-1][2] == piece[1] and common_rows[-1] == piece_rows:
+            common_blocks[-1] = (piece[0], common_blocks[-1][1], piece[2])
+        else:
+            common_blocks.append(piece)
+            common_rows.append(piece_rows)
+
+    kept = [i for (i, (_, start, end)) in enumerate(common_blocks) if end - start >= min_length]
+    common_blocks = [common_blocks[i] for i in kept]
+    block_rows = [[common_rows[i][j] for i in kept] for j in range(len(pairwise_blocks))]
+
+    return common_blocks, block_rows
+
+
+def find_adjacencies(common_blocks, blocks, rows):
+    # oriented pairs of common blocks that follow each other in a synteny
+    # path of one comparison; (a, b) and (-b, -a) are the same adjacency
+    order = []
+    for (i, ((_, start, _), row)) in enumerate(zip(common_blocks, rows)):
+        _, _, _, path, rank, strand = blocks.rows[row]
+        order.append((path, rank, start * strand, strand * (i + 1)))
+
+    order.sort()
+    adjacencies = set()
+
+    for (prev, curr) in zip(order, order[1:]):
+        if prev[0] == curr[0]:
+            adjacencies.add(min((prev[3], curr[3]), (-curr[3], -prev[3])))
+
+    return adjacencies
+
+
+def find_shared_paths(common_blocks, adjacencies):
+    # the same layout as the path components of the breakpoint graph: block
+    # i has the tail node i and the head node n + i
+    number_blocks = len(common_blocks)
+    graph = nx.Graph(number_synteny_blocks=number_blocks)
+
+    for i in range(1, number_blocks + 1):
+        graph.add_node(i)
+        graph.add_node(number_blocks + i)
+
+    for i in range(1, number_blocks + 1):
+        graph.add_edge(i, number_blocks + i)
+
+    for (block_from, block_to) in sorted(adjacencies):
+        node_from = number_blocks + block_from if block_from > 0 else -block_from
+        node_to = block_to if block_to > 0 else number_blocks - block_to
+        graph.add_edge(node_from, node_to)
+
+    if number_blocks == 0:
+        return []
+
+    return ps.build_synteny_paths(graph)
+
+
+def compare_many(gfa_files, subset=None, cache_dir=None, jobs=1, minimap_preset="asm10",
+                 threads=4, repeat_detection="tag", min_block_length=MIN_COMMON_BLOCK_LENGTH):
+    # The first GFA is the reference: every other one is compared with it
+    # once, and the blocks are projected onto the reference sequences.
+    # subset holds the indices (in gfa_files) of the assemblies the shared
+    # paths are searched for; the reference is always included.
+    if len(gfa_files) < 2:
+        raise ValueError("at least two GFA files are required")
+
+    if subset is None:
+        subset = list(range(1, len(gfa_files)))
+
+    subset = sorted(set(subset) - {0})
+    if not subset or subset[-1] >= len(gfa_files):
+        raise ValueError("subset must contain indices of the compared assemblies")
+
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(compare_pair, gfa_files[0], gfa_file, cache_dir,
+                               minimap_preset, threads, repeat_detection)
+                   for gfa_file in gfa_files[1:]]
+        pairwise_blocks = [future.result() for future in futures]
+
+    names, lengths = pairwise_blocks[0].names, pairwise_blocks[0].lengths
+    selected_blocks = [pairwise_blocks[i - 1] for i in subset]
+
+    common_blocks, block_rows = find_common_blocks(lengths, selected_blocks, min_block_length)
+
+    block_paths = [[blocks.rows[row][3] * blocks.rows[row][5] for row in rows]
+                   for (blocks, rows) in zip(selected_blocks, block_rows)]
+
+    adjacencies = None
+    for (blocks, rows) in zip(selected_blocks, block_rows):
+        pair_adjacencies = find_adjacencies(common_blocks, blocks, rows)
+        adjacencies = pair_adjacencies if adjacencies is None else adjacencies & pair_adjacencies
+
+    shared_paths = find_shared_paths(common_blocks, adjacencies)
+
+    return MultiResult(gfa_files, subset, names, pairwise_blocks, common_blocks,
+                       block_paths, shared_paths)
+
+
+def calc_stats(result):
+    block_lengths = [end - start for (_, start, end) in result.common_blocks]
+    path_lengths = [sum(block_lengths[abs(block) - 1] for block in path)
+                    for path in result.shared_paths]
+
+    blocks_n50, blocks_l50 = st.calc_nx(block_lengths)
+    paths_n50, paths_l50 = st.calc_nx(path_lengths)
+
+    return {"number_blocks": len(block_lengths),
+            "blocks_total_length": sum(block_lengths),
+            "blocks_n50": blocks_n50,
+            "blocks_l50": blocks_l50,
+            "number_paths": len(path_lengths),
+            "paths_total_length": sum(path_lengths),
+            "paths_n50": paths_n50,
+            "paths_l50": paths_l50}
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog="asgan multi")
+    parser.add_argument("--inputs", nargs="+", required=True)
+    parser.add_argument("--out-dir", required=True)
+    parser.add_argument("--subset", type=int, nargs="+")
+    parser.add_argument("--cache-dir")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--minimap-preset", default="asm10")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--repeat-detection", default="tag",
+                        choices=asg.REPEAT_DETECTION_METHODS)
+    parser.add_argument("--min-block-length", type=int, default=MIN_COMMON_BLOCK_LENGTH)
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    os.mkdir(args.out_dir)
+
+    result = compare_many(args.inputs, subset=args.subset, cache_dir=args.cache_dir,
+                          jobs=args.jobs, minimap_preset=args.minimap_preset,
+                          threads=args.threads, repeat_detection=args.repeat_detection,
+                          min_block_length=args.min_block_length)
+
+    out_gen.save_multi_result(result, calc_stats(result), out_dir=args.out_dir)
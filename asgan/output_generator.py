@@ -1,111 +1,210 @@
-import asgan.fasta_parser as fp
+import os
+
+from asgan.common import block_index
+from asgan.breakpoint_graph import node_block, is_head
 import networkx as nx
 
 
 def assembly_graph_save_dot(graph, out_dir, out_file):
+    sequences = graph.graph["sequences"]
+
     with open("{}/{}".format(out_dir, out_file), "w") as f:
         f.write("digraph {\n")
         f.write("  node [shape=point]\n")
         f.write("  edge [penwidth=5, color=blue, fontsize=20]\n")
 
         for (node_from, node_to, data) in graph.edges(data=True):
-            edge_color = ["green", "black"][data["is_repeat"]]
+            edge_color = ["green", "black"][sequences.is_repeat[data["id"] >> 1]]
             f.write("  {} -> {} [label=\"{}\", color=\"{}\"]\n".format(
-                node_from, node_to, data["name"], edge_color))
+                node_from, node_to, sequences.oriented_name(data["id"]), edge_color))
 
         f.write("}\n")
 
 
-def save_raw_hits(raw_hits, out_dir, out_file):
-    raw_hits.sort(key=lambda hit: (hit.query_name, hit.query_start))
+def save_raw_hits(raw_hits, sequences_query, sequences_target, out_dir, out_file):
     out_file = "{}/{}".format(out_dir, out_file)
 
     with open(out_file, "w") as f:
-        for raw_hit in raw_hits:
-            f.write(str(raw_hit) + "\n")
-
-
-def save_blocks(synteny_blocks_query, synteny_blocks_target, out_dir, out_file):
-    def _save_blocks(synteny_blocks):
-        for seq, blocks in synteny_blocks.items():
-            blocks.sort(key=lambda block: block.start)
+        for raw_hit in sorted(raw_hits, key=lambda hit: (hit.query_id, hit.query_start)):
+            query_info = "{}\t{}\t{}\t{}".format(
+                sequences_query.names[raw_hit.query_id],
+                pretty_number(raw_hit.query_len),
+                pretty_number(raw_hit.query_start),
+                pretty_number(raw_hit.query_end))
+
+            target_info = "{}\t{}\t{}\t{}".format(
+                sequences_target.names[raw_hit.target_id],
+                pretty_number(raw_hit.target_len),
+                pretty_number(raw_hit.target_start),
+                pretty_number(raw_hit.target_end))
+
+            f.write("{}\t{}\t{}\n".format(query_info, raw_hit.strand, target_info))
+
+
+def save_blocks(synteny_blocks_query, sequences_query,
+                synteny_blocks_target, sequences_target, out_dir, out_file):
+    def _save_blocks(synteny_blocks, sequences):
+        for blocks in synteny_blocks:
+            if blocks is None:
+                continue
 
             for block in blocks:
-                f.write(str(block) + "\n")
+                f.write("{}\t{}\t{}\t{}\n".format(
+                    sequences.oriented_name(block.sequence_id),
+                    pretty_number(block.start), pretty_number(block.end),
+                    block_name(block.id)))
 
             f.write("\n")
 
     with open("{}/{}".format(out_dir, out_file), "w") as f:
         f.write("Query:\n\n")
-        save_blocks(synteny_blocks_query)
+        _save_blocks(synteny_blocks_query, sequences_query)
 
         f.write("\nTarget:\n\n")
-        save_blocks(synteny_blocks_target)
+        _save_blocks(synteny_blocks_target, sequences_target)
 
 
 def adjacency_graph_save_dot(adjacency_graph, out_dir, out_file, block_attributes=None):
-    def get_edge_color(edge_name):
-        if block_attributes is None:
-            if edge_name.startswith("+") or edge_name.startswith("-"):
-                return "blue"
-            else:
-                return "black"
-        else:
-            edge_color = block_attributes["color"].get(edge_name)
+    lines = [DOT_HEADER]
 
-        if edge_color is None:
-            return "black"
+    for component in nx.weakly_connected_component_subgraphs(adjacency_graph, copy=False):
+        if not contains_synteny_blocks(component):
+            continue
 
-        return edge_color
+        for node_from, node_to, data in component.edges(data=True):
+            lines.append(dot_edge(node_from, node_to, data, block_attributes))
 
-    def get_edge_label(edge_name):
-        if edge_name.startswith("+") or edge_name.startswith("-"):
-            return edge_name
+    lines.append("}\n")
 
-        return ""
+    with open("{}/{}".format(out_dir, out_file), "w") as f:
+        f.write("".join(lines))
+
+
+def adjacency_graph_save_dot_shards(adjacency_graph, out_dir, block_attributes=None,
+                                    max_edges=2000):
+    # One file per component with synteny blocks, numbered from the largest
+    # one. Chains of non-synteny edges are collapsed into single edges
+    # labeled with the number of edges and their total length, and a file
+    # keeps at most max_edges edges: all block edges first, then the
+    # longest collapsed ones.
+    os.mkdir(out_dir)
+    sequences = adjacency_graph.graph["sequences"]
 
-    def get_edge_style(edge_name):
-        if block_attributes is None:
-            return "solid"
-        else:
-            edge_style = block_attributes["style"].get(edge_name)
+    components = [component for component in
+                  nx.weakly_connected_component_subgraphs(adjacency_graph, copy=False)
+                  if contains_synteny_blocks(component)]
+    components.sort(key=lambda component: component.number_of_edges(), reverse=True)
 
-            if edge_style is None:
-                return "solid"
+    for (i, component) in enumerate(components):
+        block_edges = [(node_from, node_to, data)
+                       for (node_from, node_to, data) in component.edges(data=True)
+                       if "block" in data]
+        summary_edges = summarize_edges(component, sequences)
+        summary_edges.sort(key=lambda edge: edge[3], reverse=True)
 
-            return edge_style
+        lines = [DOT_HEADER]
+        for (node_from, node_to, data) in block_edges[:max_edges]:
+            lines.append(dot_edge(node_from, node_to, data, block_attributes))
 
-    def contains_synteny_blocks(component):
-        for (_, _, data) in component.edges(data=True):
-            if data["name"].startswith("+") or data["name"].startswith("-"):
-                return True
+        number_summary_edges = max(0, min(len(summary_edges), max_edges - len(block_edges)))
+        for (node_from, node_to, number_edges, length) in summary_edges[:number_summary_edges]:
+            lines.append("  {} -> {} [label=\"{} / {}\", color=\"black\", style=\"solid\", "
+                         "penwidth=\"3\"]\n".format(node_from, node_to, number_edges,
+                                                     pretty_number(length, min_width=0)))
 
-        return False
+        number_omitted = len(block_edges) + len(summary_edges) - len(lines) + 1
+        if number_omitted > 0:
+            lines.append("  // {} edges omitted\n".format(number_omitted))
 
-    with open("{}/{}".format(out_dir, out_file), "w") as f:
-        f.write("digraph {\n")
-        f.write("  node [shape=point, width=0.06]\n")
-        f.write("  edge [fontsize=20]\n")
-        f.write("  graph[center=true, margin=0.5, ")
-        f.write("nodesep=0.45, ranksep=0.35]\n")
+        lines.append("}\n")
 
-        for component in nx.weakly_connected_component_subgraphs(adjacency_graph, copy=False):
-            if not contains_synteny_blocks(component):
-                continue
+        with open("{}/component_{}.gv".format(out_dir, i + 1), "w") as f:
+            f.write("".join(lines))
 
-            for node_from, node_to, data in component.edges(data=True):
-                edge_color = get_edge_color(data["name"])
-                edge_label = get_edge_label(data["name"])
-                edge_style = get_edge_style(data["name"])
-                edge_penwidth = 3 if edge_color == "black" else 6
 
-                f.write("  {} -> {} [".format(node_from, node_to))
-                f.write("label=\"{}\", ".format(edge_label))
-                f.write("color=\"{}\", ".format(edge_color))
-                f.write("style=\"{}\", ".format(edge_style))
-                f.write("penwidth=\"{}\"]\n".format(edge_penwidth))
+def summarize_edges(component, sequences):
+    # Collapses the chains of non-synteny edges passing through nodes with a
+    # single incoming and a single outgoing edge, and then parallel chains.
+    # Returns (node_from, node_to, number_edges, total_length).
+    def is_inner(node):
+        if component.in_degree(node) != 1 or component.out_degree(node) != 1:
+            return False
 
-        f.write("}\n")
+        (_, node_to, data), = component.out_edges(node, data=True)
+        (node_from, _, prev_data), = component.in_edges(node, data=True)
+        return node_to != node and "block" not in data and "block" not in prev_data
+
+    def follow(node_from, node_to, key, data):
+        visited.add((node_from, node_to, key))
+        number_edges, length = 1, sequences.length(data["id"])
+
+        while is_inner(node_to) and node_to != node_from:
+            (_, next_node, next_key, next_data), = component.out_edges(node_to, keys=True,
+                                                                       data=True)
+            if (node_to, next_node, next_key) in visited:
+                break
+
+            visited.add((node_to, next_node, next_key))
+            number_edges += 1
+            length += sequences.length(next_data["id"])
+            node_to = next_node
+
+        return (node_from, node_to, number_edges, length)
+
+    visited = set()
+    chains = []
+    edges = [(node_from, node_to, key, data)
+             for (node_from, node_to, key, data) in component.edges(keys=True, data=True)
+             if "block" not in data]
+
+    for (node_from, node_to, key, data) in edges:
+        if not is_inner(node_from):
+            chains.append(follow(node_from, node_to, key, data))
+
+    # what is left are cycles of inner nodes
+    for (node_from, node_to, key, data) in edges:
+        if (node_from, node_to, key) not in visited:
+            chains.append(follow(node_from, node_to, key, data))
+
+    summary = dict()
+    for (node_from, node_to, number_edges, length) in chains:
+        prev_number_edges, prev_length = summary.get((node_from, node_to), (0, 0))
+        summary[(node_from, node_to)] = (prev_number_edges + number_edges, prev_length + length)
+
+    return [(node_from, node_to, number_edges, length)
+            for ((node_from, node_to), (number_edges, length)) in summary.items()]
+
+
+DOT_HEADER = ("digraph {\n"
+              "  node [shape=point, width=0.06]\n"
+              "  edge [fontsize=20]\n"
+              "  graph[center=true, margin=0.5, nodesep=0.45, ranksep=0.35]\n")
+
+
+def contains_synteny_blocks(component):
+    for (_, _, data) in component.edges(data=True):
+        if "block" in data:
+            return True
+
+    return False
+
+
+def dot_edge(node_from, node_to, data, block_attributes):
+    edge_color, edge_style, edge_label = "black", "solid", ""
+
+    if "block" in data:
+        edge_label = block_name(data["block"])
+
+        if block_attributes is None:
+            edge_color = "blue"
+        else:
+            edge_color = block_attributes["color"][block_index(data["block"])] or "black"
+            edge_style = block_attributes["style"][block_index(data["block"])] or "solid"
+
+    edge_penwidth = 3 if edge_color == "black" else 6
+
+    return "  {} -> {} [label=\"{}\", color=\"{}\", style=\"{}\", penwidth=\"{}\"]\n".format(
+        node_from, node_to, edge_label, edge_color, edge_style, edge_penwidth)
 
 
 def breakpoint_graph_save_dot(graph, max_matching, out_dir, out_file):
@@ -123,8 +222,8 @@ def breakpoint_graph_save_dot(graph, max_matching, out_dir, out_file):
         f.write("  edge [penwidth=5]\n")
         f.write("  node [fontsize=20]\n")
 
-        for node, data in graph.nodes(data=True):
-            f.write("  {} [label=\"{}\"]\n".format(node, data["label"]))
+        for node in graph.nodes():
+            f.write("  {} [label=\"{}\"]\n".format(node, node_label(graph, node)))
 
         for (node_from, node_to) in graph.edges():
             color = get_edge_color(node_from, node_to)
@@ -141,8 +240,8 @@ def path_components_save_dot(paths, unused_edges, out_dir):
             f.write("  node [fontsize=20]\n")
             f.write("  edge [penwidth=5]\n")
 
-            for (node, data) in paths.nodes(data=True):
-                f.write("  {} [label=\"{}\"]\n".format(node, data["label"]))
+            for node in paths.nodes():
+                f.write("  {} [label=\"{}\"]\n".format(node, node_label(paths, node)))
 
             for (node_from, node_to) in paths.edges():
                 f.write("  {} -- {} [color=blue] \n".format(node_from, node_to))
@@ -157,10 +256,10 @@ def path_components_save_dot(paths, unused_edges, out_dir):
     save("paths_with_unused_edges", with_unused_edges=True)
 
 
-def save_path_sequences(paths_query, paths_target, out_dir):
+def save_path_sequences(paths_query, sequences_query, paths_target, sequences_target, out_dir):
     def write_block_pair(block_query, block_target):
         if block_query is not None:
-            query_sequence_name = block_query.sequence_name
+            query_sequence_name = sequences_query.oriented_name(block_query.sequence_id)
             query_sequence_length = pretty_number(block_query.sequence_length)
             query_start = pretty_number(block_query.start)
             query_end = pretty_number(block_query.end)
@@ -171,7 +270,7 @@ def save_path_sequences(paths_query, paths_target, out_dir):
             query_end = fill("")
 
         if block_target is not None:
-            target_sequence_name = block_target.sequence_name
+            target_sequence_name = sequences_target.oriented_name(block_target.sequence_id)
             target_sequence_length = pretty_number(block_target.sequence_length)
             target_start = pretty_number(block_target.start)
             target_end = pretty_number(block_target.end)
@@ -182,9 +281,9 @@ def save_path_sequences(paths_query, paths_target, out_dir):
             target_end = fill("")
 
         if block_query is not None:
-            block_id = block_query.signed_id()
+            block_id = block_name(block_query.id)
         else:
-            block_id = block_target.signed_id()
+            block_id = block_name(block_target.id)
 
         f.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
             block_id,
@@ -221,50 +320,27 @@ def save_path_sequences(paths_query, paths_target, out_dir):
             f.write("\n\n")
 
 
-def path_sequences_save_fasta(paths_query, sequences_fasta_query,
-                              paths_target, sequences_fasta_target,
+def path_sequences_save_fasta(paths_query, sequences_query, store_query,
+                              paths_target, sequences_target, store_target,
                               out_dir):
-    def complement(seq):
-        complement_nt = {"A": "T", "T": "A", "C": "G", "G": "C"}
-        complement_seq = ""
-
-        for nt in reversed(seq):
-            complement_seq += complement_nt[nt]
-
-        return complement_seq
-
-    sequences_query = fp.make_fasta_dict(sequences_fasta_query)
-    sequences_target = fp.make_fasta_dict(sequences_fasta_target)
-
-    path_query = paths_query[0]
-    path_target = paths_target[0]
-
-    sequence_query = ""
-    sequence_target = ""
+    # Stores are sequence_store.SequenceStore of the GFAs. The blocks of the
+    # first path and the sequences between them are fetched one by one, so
+    # no whole sequence is held in memory.
+    def save_path(path, sequences, store, out_file, header):
+        with open("{}/{}".format(out_dir, out_file), "w") as f:
+            f.write(">{}\n".format(header))
+
+            for item in path:
+                for block in (item if isinstance(item, list) else [item]):
+                    f.write(store.fetch(sequences.names[block.sequence_id >> 1],
+                                        block.start, block.end,
+                                        reverse=block.sequence_id & 1 == 1))
 
-    for block in path_query:
-        sequence = sequences_query[block.sequence_name[:-1]]
-
-        if block.sequence_name[-1] == "+":
-            sequence_query += sequence[block.start:block.end + 1]
-        else:
-            sequence_query += complement(sequence)[block.start:block.end + 1]
-
-    for block in path_target:
-        sequence = sequences_target[block.sequence_name[:-1]]
-
-        if block.sequence_name[-1] == "+":
-            sequence_target += sequence[block.start:block.end + 1]
-        else:
-            sequence_target += complement(sequence)[block.start:block.end + 1]
-
-    with open("{}/path-query-1.fasta".format(out_dir), "w") as f:
-        f.write(">query_path1\n")
-        f.write(sequence_query + "\n")
+            f.write("\n")
 
-    with open("{}/path-target-1.fasta".format(out_dir), "w") as f:
-        f.write(">target_path1\n")
-        f.write(sequence_target + "\n")
+    save_path(paths_query[0], sequences_query, store_query, "path-query-1.fasta", "query_path1")
+    save_path(paths_target[0], sequences_target, store_target, "path-target-1.fasta",
+              "target_path1")
 
 
 def output_stats(stats, out_dir):
@@ -333,6 +409,10 @@ def output_stats(stats, out_dir):
         f.write("N50\t{}\t{}\n".format(paths_n50_query, paths_n50_target))
         f.write("L50\t{}\t{}\n\n".format(paths_l50_query, paths_l50_target))
 
+        # overlaps of the links, only if they were calculated
+        if "number_links_query" in stats:
+            output_overlap_stats(stats, f)
+
         # link types and united components
         # f.write("links: {} {} {} {}\n".format(*stats["link_types"]))
         # f.write("uc: {}\n\n".format(stats["number_united_components"]))
@@ -380,6 +460,89 @@ def output_stats(stats, out_dir):
         '''
 
 
+def output_overlap_stats(stats, f):
+    def values(name, format_value):
+        return [format_value(stats[name + suffix]) if name + suffix in stats else fill("NA")
+                for suffix in ["_query", "_target"]]
+
+    f.write("links\t{}\t{}\n".format(*values("number_links", pretty_number)))
+    f.write("ovmin\t{}\t{}\n".format(*values("overlap_min", pretty_number)))
+    f.write("ovmed\t{}\t{}\n".format(*values("overlap_median", pretty_number)))
+    f.write("ovmax\t{}\t{}\n".format(*values("overlap_max", pretty_number)))
+    f.write("ovid\t{}\t{}\n\n".format(*values("identity_median", fill)))
+
+
+def print_triage(stats, pairs):
+    print("\tQuery       \tTarget")
+    print("seqs\t{}\t{}".format(pretty_number(stats["number_sequences_query"]),
+                                pretty_number(stats["number_sequences_target"])))
+    print("tlen\t{}\t{}".format(pretty_number(stats["total_length_query"]),
+                                pretty_number(stats["total_length_target"])))
+    print("shared\t{}\t{}".format(pretty_number(stats["shared_length_query"]),
+                                  pretty_number(stats["shared_length_target"])))
+
+    if pairs:
+        print("")
+
+    for (name_query, name_target, shared_length) in pairs:
+        print("{}\t{}\t{}".format(fill(name_query), fill(name_target),
+                                  pretty_number(shared_length)))
+
+
+def save_sweep_stats(results, out_dir, out_file):
+    # one row per combination of the parameters, with all the stats or NA
+    # for the combinations without synteny blocks
+    parameter_names = ["min_hit_length", "max_hits_dist", "max_adjacency_dist"]
+    stat_names = next((list(stats) for (_, stats) in results if stats is not None), [])
+
+    with open("{}/{}".format(out_dir, out_file), "w") as f:
+        f.write("\t".join(parameter_names + stat_names) + "\n")
+
+        for (parameters, stats) in results:
+            if stats is None:
+                values = list(parameters) + ["NA"] * len(stat_names)
+            else:
+                values = list(parameters) + [stats[name] for name in stat_names]
+            f.write("\t".join(map(str, values)) + "\n")
+
+
+def save_multi_result(result, stats, out_dir):
+    with open("{}/multi_blocks.txt".format(out_dir), "w") as f:
+        for (i, (sequence, start, end)) in enumerate(result.common_blocks):
+            paths = [block_name(paths[i]) for paths in result.block_paths]
+            f.write("{}\t{}\t{}\t{}\t{}\n".format(
+                i + 1, fill(result.names[sequence]), pretty_number(start), pretty_number(end),
+                "\t".join(fill(path) for path in paths)))
+
+    with open("{}/multi_paths.txt".format(out_dir), "w") as f:
+        for path in result.shared_paths:
+            f.write(" ".join(block_name(block) for block in path) + "\n")
+
+    with open("{}/multi_stats.txt".format(out_dir), "w") as f:
+        f.write("inputs\t{}\n".format(" ".join(result.gfa_files[i]
+                                               for i in [0] + result.subset)))
+        f.write("blocks\t{}\n".format(pretty_number(stats["number_blocks"])))
+        f.write("tlen\t{}\n".format(pretty_number(stats["blocks_total_length"])))
+        f.write("N50\t{}\n".format(pretty_number(stats["blocks_n50"])))
+        f.write("L50\t{}\n\n".format(pretty_number(stats["blocks_l50"])))
+        f.write("paths\t{}\n".format(pretty_number(stats["number_paths"])))
+        f.write("tlen\t{}\n".format(pretty_number(stats["paths_total_length"])))
+        f.write("N50\t{}\n".format(pretty_number(stats["paths_n50"])))
+        f.write("L50\t{}\n".format(pretty_number(stats["paths_l50"])))
+
+
+def block_name(block_id):
+    if block_id is None:
+        return ""
+
+    return ["-", "+"][block_id > 0] + str(abs(block_id))
+
+
+def node_label(breakpoint_graph, node):
+    return "{}{}".format(node_block(breakpoint_graph, node),
+                         ["t", "h"][is_head(breakpoint_graph, node)])
+
+
 def pretty_number(number, min_width=12):
     digits = []
     number = str(number)
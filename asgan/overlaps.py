@@ -0,0 +1,164 @@
+import re
+
+import numpy as np
+
+from asgan.gfa_parser import RecordType
+from asgan.compression import open_input
+
+CIGAR_OPERATION = re.compile(r"(\d+)([MIDNSHP=X])")
+OPERATIONS = "MIDNSHP=X"
+OPERATION_INDEX = {operation: i for (i, operation) in enumerate(OPERATIONS)}
+BATCH_SIZE = 100000
+
+# identities are counted in bins of IDENTITY_BIN, ten times finer than the
+# precision they are reported with
+IDENTITY_BIN = 1e-4
+NUMBER_IDENTITY_BINS = int(round(1 / IDENTITY_BIN)) + 1
+
+
+class OverlapStats:
+    # Exact counts of the overlap lengths (length_counts[i] links overlap
+    # by i bases), binned counts of the identities (the number of matches
+    # over the overlap length) and the total length of each CIGAR operation.
+    # Links without a CIGAR ("*") are counted in number_links only.
+    def __init__(self):
+        self.number_links = 0
+        self.length_counts = np.zeros(0, dtype=np.int64)
+        self.identity_counts = np.zeros(NUMBER_IDENTITY_BINS, dtype=np.int64)
+        self.identity_sum = 0.0
+        self.identity_range = (1.0, 0.0)
+        self.operation_lengths = np.zeros(len(OPERATIONS), dtype=np.int64)
+
+    def add_batch(self, cigars):
+        # the operations of all the CIGARs of a batch are parsed into flat
+        # arrays and summed per link with a single bincount
+        self.number_links += len(cigars)
+        cigars = [cigar for cigar in cigars if cigar != "*"]
+        if not cigars:
+            return
+
+        operations = [CIGAR_OPERATION.findall(cigar) for cigar in cigars]
+        number_operations = np.array([len(ops) for ops in operations], dtype=np.int64)
+        lengths = np.array([int(length) for ops in operations for (length, _) in ops],
+                           dtype=np.int64)
+        codes = np.array([OPERATION_INDEX[op] for ops in operations for (_, op) in ops],
+                         dtype=np.int64)
+
+        links = np.repeat(np.arange(len(cigars)), number_operations)
+        per_link = np.bincount(links * len(OPERATIONS) + codes, weights=lengths,
+                               minlength=len(cigars) * len(OPERATIONS))
+        per_link = per_link.reshape(len(cigars), len(OPERATIONS)).astype(np.int64)
+
+        self.operation_lengths += per_link.sum(axis=0)
+
+        total_lengths = per_link.sum(axis=1)
+        if total_lengths.max() >= len(self.length_counts):
+            self.length_counts = np.concatenate([
+                self.length_counts,
+                np.zeros(total_lengths.max() + 1 - len(self.length_counts), dtype=np.int64)])
+        self.length_counts += np.bincount(total_lengths, minlength=len(self.length_counts))
+
+        # zero-length overlaps have no identity
+        nonzero = total_lengths > 0
+        identities = per_link[nonzero, OPERATION_INDEX["M"]] / total_lengths[nonzero]
+        self.identity_sum += identities.sum()
+        if len(identities) > 0:
+            self.identity_range = (min(self.identity_range[0], identities.min()),
+                                   max(self.identity_range[1], identities.max()))
+        self.identity_counts += np.bincount(
+            np.floor(identities / IDENTITY_BIN).astype(np.int64), minlength=NUMBER_IDENTITY_BINS)
+
+    def number_overlaps(self):
+        return int(self.length_counts.sum())
+
+    def number_identities(self):
+        return int(self.identity_counts.sum())
+
+    def length_quantile(self, q):
+        return quantile(self.length_counts, q)
+
+    def identity_quantile(self, q):
+        # the extremes are exact, the other quantiles are the middles of bins
+        if q == 0 or q == 1:
+            return round(float(self.identity_range[q]), 3)
+
+        return round((quantile(self.identity_counts, q) + 0.5) * IDENTITY_BIN, 3)
+
+    def mean_length(self):
+        return int(np.dot(np.arange(len(self.length_counts)), self.length_counts)) // \
+            self.number_overlaps()
+
+    def mean_identity(self):
+        return round(self.identity_sum / self.number_identities(), 3)
+
+    def length_histogram(self):
+        # powers of two: bin i holds the overlaps of [2^(i-1), 2^i) bases,
+        # bin 0 the ones of 0 bases
+        lengths = np.nonzero(self.length_counts)[0]
+        bins = np.zeros(len(lengths), dtype=np.int64)
+        bins[lengths > 0] = np.floor(np.log2(lengths[lengths > 0])).astype(np.int64) + 1
+        return np.bincount(bins, weights=self.length_counts[lengths]).astype(np.int64)
+
+    def identity_histogram(self, number_bins=100):
+        bins = np.arange(NUMBER_IDENTITY_BINS) * number_bins // (NUMBER_IDENTITY_BINS - 1)
+        return np.bincount(bins, weights=self.identity_counts,
+                           minlength=number_bins + 1).astype(np.int64)
+
+
+def quantile(counts, q):
+    # the value of rank floor(q * n) in the sorted order, as the median of
+    # the old full sort (values[n // 2])
+    cumulative = np.cumsum(counts)
+    rank = min(int(q * cumulative[-1]), cumulative[-1] - 1)
+    return int(np.searchsorted(cumulative, rank, side="right"))
+
+
+def read_cigars(gfa_file):
+    with open_input(gfa_file) as f:
+        for line in f:
+            if line.startswith(RecordType.LINK + "\t"):
+                yield line.split("\t", 6)[5].strip()
+
+
+def calc_overlap_stats(gfa_file, batch_size=BATCH_SIZE):
+    stats = OverlapStats()
+    batch = []
+
+    for cigar in read_cigars(gfa_file):
+        batch.append(cigar)
+        if len(batch) == batch_size:
+            stats.add_batch(batch)
+            batch = []
+
+    stats.add_batch(batch)
+    return stats
+
+
+def summarize(stats):
+    summary = {"number_links": stats.number_links,
+               "number_overlaps": stats.number_overlaps()}
+
+    if stats.number_overlaps() > 0:
+        summary.update({"overlap_min": stats.length_quantile(0),
+                        "overlap_max": stats.length_quantile(1),
+                        "overlap_median": stats.length_quantile(0.5),
+                        "overlap_mean": stats.mean_length()})
+
+    if stats.number_identities() > 0:
+        summary.update({"identity_min": stats.identity_quantile(0),
+                        "identity_max": stats.identity_quantile(1),
+                        "identity_median": stats.identity_quantile(0.5),
+                        "identity_mean": stats.mean_identity()})
+
+    return summary
+
+
+def calc_stats(gfa_query, gfa_target):
+    # the summaries of both graphs in the naming of stats.calc_stats
+    stats = dict()
+
+    for (gfa_file, suffix) in [(gfa_query, "query"), (gfa_target, "target")]:
+        for (name, value) in summarize(calc_overlap_stats(gfa_file)).items():
+            stats["{}_{}".format(name, suffix)] = value
+
+    return stats
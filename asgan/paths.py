@@ -1,12 +1,12 @@
 import networkx as nx
-from asgan.synteny_blocks import SequenceBlock
+from asgan.synteny_blocks import SequenceBlock, get_block
 from asgan.adjacency_graph import build_contracted_adjacency_graph
-from asgan.common import build_id2block_dict, build_block2edge_dict
+from asgan.breakpoint_graph import node_block, is_head
+from asgan.common import block_index, count_synteny_blocks, build_id2block, build_block2edge
 
 
 def build_synteny_paths(path_components):
     components = nx.connected_component_subgraphs(path_components)
-    node_labels = nx.get_node_attributes(path_components, "label")
 
     paths = []
     for component in components:
@@ -21,10 +21,7 @@ def build_synteny_paths(path_components):
 
         if not component_is_processed:
             for (node_from, node_to) in component.edges():
-                node_from_label = node_labels[node_from]
-                node_to_label = node_labels[node_to]
-
-                if node_from_label[:-1] != node_to_label[:-1]:
+                if node_block(path_components, node_from) != node_block(path_components, node_to):
                     component.remove_edge(node_from, node_to)
                     path = list(nx.dfs_preorder_nodes(component, node_from))
                     # path.append(node_from)
@@ -37,8 +34,10 @@ def build_synteny_paths(path_components):
         synteny_path = []
 
         for i in range(0, len(path), 2):
-            node_label = node_labels[path[i]]
-            block_id = ["+", "-"][node_label[-1] == "h"] + node_label[:-1]
+            block_id = node_block(path_components, path[i])
+            if is_head(path_components, path[i]):
+                block_id = -block_id
+
             synteny_path.append(block_id)
 
         synteny_paths.append(synteny_path)
@@ -49,8 +48,8 @@ def build_synteny_paths(path_components):
 def build_path_sequences(synteny_blocks, synteny_paths, adjacency_graph):
     contracted_adjacency_graph = build_contracted_adjacency_graph(adjacency_graph)
     edge2data = build_edge2data_dict(contracted_adjacency_graph)
-    block2edge = build_block2edge_dict(adjacency_graph)
-    id2block = build_id2block_dict(synteny_blocks)
+    block2edge = build_block2edge(adjacency_graph, count_synteny_blocks(synteny_blocks))
+    id2block = build_id2block(synteny_blocks)
 
     path_sequences = []
     for synteny_path in synteny_paths:
@@ -64,12 +63,12 @@ def build_path_sequences(synteny_blocks, synteny_paths, adjacency_graph):
 def build_path_sequence(synteny_path, contracted_adjacency_graph,
                         id2block, block2edge, edge2data):
     if len(synteny_path) == 1:
-        return [id2block[synteny_path[0]]]
+        return [get_block(id2block, synteny_path[0])]
 
     path_sequence = []
 
-    block_from = id2block[synteny_path[0]]
-    block_to = id2block[synteny_path[1]]
+    block_from = get_block(id2block, synteny_path[0])
+    block_to = get_block(id2block, synteny_path[1])
     path_between_blocks = build_path_between_blocks(block_from, block_to,
                                                     contracted_adjacency_graph,
                                                     block2edge, edge2data)
@@ -80,7 +79,7 @@ def build_path_sequence(synteny_path, contracted_adjacency_graph,
 
     for i in range(2, len(synteny_path)):
         block_from = block_to
-        block_to = id2block[synteny_path[i]]
+        block_to = get_block(id2block, synteny_path[i])
         path_between_blocks = build_path_between_blocks(block_from, block_to,
                                                         contracted_adjacency_graph,
                                                         block2edge, edge2data)
@@ -94,24 +93,24 @@ def build_path_sequence(synteny_path, contracted_adjacency_graph,
 def build_path_between_blocks(block_from, block_to,
                               contracted_adjacency_graph,
                               block2edge, edge2data):
-    (from_start, from_end) = block2edge[block_from.signed_id()]
-    (to_start, to_end) = block2edge[block_to.signed_id()]
+    (from_start, from_end) = block2edge[block_index(block_from.id)]
+    (to_start, to_end) = block2edge[block_index(block_to.id)]
 
     if from_end == to_start:
         dist = contracted_adjacency_graph.nodes[from_end].get("distance")
 
-        if dist is None or block_from.sequence_name != block_to.sequence_name:
-            block1 = SequenceBlock(id=None, sequence_name=block_from.sequence_name,
+        if dist is None or block_from.sequence_id != block_to.sequence_id:
+            block1 = SequenceBlock(id=None, sequence_id=block_from.sequence_id,
                                    sequence_length=block_from.sequence_length,
                                    start=block_from.end, end=block_from.sequence_length)
 
-            block2 = SequenceBlock(id=None, sequence_name=block_to.sequence_name,
+            block2 = SequenceBlock(id=None, sequence_id=block_to.sequence_id,
                                    sequence_length=block_to.sequence_length,
                                    start=0, end=block_to.start)
 
             return [block1, block2]
         else:
-            block = SequenceBlock(id=None, sequence_name=block_from.sequence_name,
+            block = SequenceBlock(id=None, sequence_id=block_from.sequence_id,
                                   sequence_length=block_from.sequence_length,
                                   start=block_from.end,
                                   end=block_to.start
@@ -125,7 +124,7 @@ def build_path_between_blocks(block_from, block_to,
     path = []
     if not path_nodes:
         data = edge2data[(from_end, to_start)]
-        block = SequenceBlock(id=None, sequence_name=data["name"],
+        block = SequenceBlock(id=None, sequence_id=data["id"],
                               sequence_length=data["weight"],
                               start=0, end=data["weight"])
         path.append(block)
@@ -134,7 +133,7 @@ def build_path_between_blocks(block_from, block_to,
     for i in range(len(path_nodes) - 1):
         node_from, node_to = path_nodes[i], path_nodes[i + 1]
         data = edge2data[(node_from, node_to)]
-        block = SequenceBlock(id=None, sequence_name=data["name"],
+        block = SequenceBlock(id=None, sequence_id=data["id"],
                               sequence_length=data["weight"],
                               start=0, end=data["weight"])
         path.append(block)
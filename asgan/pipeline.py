@@ -0,0 +1,393 @@
+import os
+import heapq
+import tempfile
+from functools import partial
+
+import asgan.stats as st
+import asgan.paths as ps
+import asgan.hits as ht
+import asgan.aligner as aligner
+import asgan.assembly_graph as asg
+import asgan.adjacency_graph as adg
+import asgan.synteny_blocks as sb
+import asgan.breakpoint_graph as bpg
+import asgan.gfa_parser as gfa_parser
+import asgan.output_generator as out_gen
+import asgan.interval_index as ii
+import asgan.liftover as lo
+import asgan.checkpoint as ck
+import asgan.sketch as sk
+import asgan.progress as progress
+from asgan.scheduler import StageScheduler
+
+import networkx as nx
+import numpy as np
+
+
+class ComparisonResult:
+    def __init__(self, assembly_graph_query, assembly_graph_target, raw_hits):
+        self.assembly_graph_query = assembly_graph_query
+        self.assembly_graph_target = assembly_graph_target
+        self.raw_hits = raw_hits
+
+        self.synteny_blocks_query = None
+        self.synteny_blocks_target = None
+        self.adjacency_graph_query = None
+        self.adjacency_graph_target = None
+        self.breakpoint_graph = None
+        self.max_matching = None
+        self.number_united_components = None
+        self.synteny_paths = None
+        self.path_sequences_query = None
+        self.path_sequences_target = None
+        self.block_index_query = None
+        self.block_index_target = None
+        self.path_index_query = None
+        self.path_index_target = None
+        self.liftover_table = None
+        self.checkpoint = None
+        self.stats = None
+
+    def locate(self, assembly, sequence_name, position):
+        # synteny blocks and paths (numbered from 1) covering a position on
+        # the forward strand of a query or a target sequence
+        sequences, block_index, path_index = self._get_indices(assembly)
+        sequence = sequences.name2id[sequence_name]
+        return block_index.find(sequence, position), path_index.find(sequence, position)
+
+    def locate_batch(self, assembly, sequence_names, positions):
+        # vectorized locate; returns arrays of block ids and path numbers,
+        # 0 where a position is not covered
+        sequences, block_index, path_index = self._get_indices(assembly)
+        names, inverse = np.unique(np.asarray(sequence_names), return_inverse=True)
+        name_ids = np.array([sequences.name2id[name] for name in names], dtype=np.int64)
+        sequence_ids = name_ids[inverse]
+        return (block_index.find_batch(sequence_ids, positions),
+                path_index.find_batch(sequence_ids, positions))
+
+    def _get_indices(self, assembly):
+        if assembly == "query":
+            return (self.assembly_graph_query.graph["sequences"],
+                    self.block_index_query, self.path_index_query)
+
+        if assembly == "target":
+            return (self.assembly_graph_target.graph["sequences"],
+                    self.block_index_target, self.path_index_target)
+
+        raise ValueError("assembly must be either query or target")
+
+
+def compare(query, target, raw_hits=None, minimap_preset="asm10", threads=4,
+            repeat_detection="tag", previous_run=None, prescreen=None, use_snapshot=False,
+            snapshot_dir=None, max_memory=None, verbose=False):
+    # query and target are either paths to GFA files or assembly graphs
+    # returned by asg.parse_assembly_graph; already parsed graphs can only
+    # be used together with raw hits since their sequences are not kept.
+    # Raw hits refer to sequences by their indices in the graphs they were
+    # aligned for, so they can only be reused with graphs of the same GFAs.
+    # previous_run is a checkpoint (see ck.load_checkpoint) of an earlier
+    # comparison of GFA files; the hits of the query sequences that did not
+    # change since then are taken from it instead of being aligned again.
+    # With prescreen set, only the sequences whose k-mer containment in the
+    # other assembly reaches it are aligned (see sk.screen). use_snapshot and
+    # snapshot_dir are passed to asg.parse_assembly_graph. With max_memory,
+    # the raw hits stay in a file and are streamed through ht.process_raw_hits.
+    def log(message):
+        if verbose:
+            print(message)
+
+    if raw_hits is None and not (isinstance(query, str) and isinstance(target, str)):
+        raise ValueError("raw hits are required when assembly graphs are passed instead of GFA files")
+
+    states = None
+    if raw_hits is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log("Parsing assembly graphs and aligning sequences..")
+            with progress.stage("ingest"):
+                assembly_graph_query, assembly_graph_target, raw_hits, states = ingest(
+                    query, target, tmp_dir, minimap_preset, threads, repeat_detection,
+                    previous_run, prescreen, use_snapshot, snapshot_dir, max_memory)
+    else:
+        log("Parsing assembly graphs..")
+        with progress.stage("parse"):
+            assembly_graph_query = load_assembly_graph(query, repeat_detection,
+                                                       use_snapshot, snapshot_dir)
+            assembly_graph_target = load_assembly_graph(target, repeat_detection,
+                                                        use_snapshot, snapshot_dir)
+
+    result = ComparisonResult(assembly_graph_query, assembly_graph_target, raw_hits)
+
+    if states is not None:
+        state_query, state_target, reused, screen = states
+        result.checkpoint = ck.build_checkpoint(minimap_preset, prescreen, screen.skip_target,
+                                                state_query, state_target, raw_hits,
+                                                assembly_graph_query.graph["sequences"],
+                                                assembly_graph_target.graph["sequences"])
+
+        if previous_run is not None:
+            log("Query changes: {}".format(ck.GfaDiff(previous_run.state_query, state_query)))
+            log("Target changes: {}".format(ck.GfaDiff(previous_run.state_target, state_target)))
+            log("Reused the alignments of {} of {} query sequences".format(
+                len(reused), len(state_query.names)))
+
+        if screen.recall is not None:
+            log("Pre-screen left out {} query and {} target sequences, "
+                "estimated recall {:.3f}".format(len(screen.skip_query),
+                                                 len(screen.skip_target), screen.recall))
+
+    log("Finding shared paths..")
+    with progress.stage("find_synteny_paths"):
+        find_synteny_paths(result, max_memory=max_memory)
+
+    log("Calculating stats..")
+    with progress.stage("calc_stats"):
+        result.stats = calc_stats(result)
+
+    return result
+
+
+def ingest(gfa_query, gfa_target, tmp_dir, minimap_preset, threads, repeat_detection,
+           previous_run=None, prescreen=None, use_snapshot=False, snapshot_dir=None,
+           max_memory=None):
+    # Both graphs are parsed in parallel, and the target index is built while
+    # the query sequences are still being extracted. With a previous run,
+    # only the query sequences whose hits cannot be reused are extracted,
+    # and the pre-screen leaves out the sequences with no similar ones.
+    scheduler = StageScheduler(max_workers=threads)
+
+    scheduler.add_stage("parse_query",
+                        partial(asg.parse_assembly_graph, gfa_query, repeat_detection,
+                                use_snapshot, snapshot_dir),
+                        in_process=True)
+    scheduler.add_stage("parse_target",
+                        partial(asg.parse_assembly_graph, gfa_target, repeat_detection,
+                                use_snapshot, snapshot_dir),
+                        in_process=True)
+
+    if prescreen is None:
+        scheduler.add_stage("screen", sk.no_screen)
+    else:
+        scheduler.add_stage("sketch_query", partial(sk.sketch_gfa, gfa_query),
+                            in_process=True)
+        scheduler.add_stage("sketch_target", partial(sk.sketch_gfa, gfa_target),
+                            in_process=True)
+        scheduler.add_stage("screen", partial(sk.screen, prescreen),
+                            deps=["sketch_query", "sketch_target"], in_process=True)
+
+    scheduler.add_stage("extract_target", partial(extract_target, gfa_target, tmp_dir),
+                        deps=["screen"], in_process=True)
+    scheduler.add_stage("state_query", partial(ck.read_gfa_state, gfa_query),
+                        in_process=True)
+    scheduler.add_stage("state_target", partial(ck.read_gfa_state, gfa_target),
+                        in_process=True)
+
+    if previous_run is None:
+        scheduler.add_stage("reused", set)
+    else:
+        scheduler.add_stage("reused",
+                            partial(ck.find_reusable_sequences, previous_run,
+                                    minimap_preset, prescreen),
+                            deps=["state_query", "state_target", "screen"])
+
+    scheduler.add_stage("extract_query", partial(extract_query, gfa_query, tmp_dir),
+                        deps=["reused", "screen"], in_process=True)
+    scheduler.add_stage("index_target",
+                        partial(aligner.build_index, out_dir=tmp_dir,
+                                minimap_preset=minimap_preset, threads=threads),
+                        deps=["extract_target"])
+    scheduler.add_stage("align",
+                        partial(align, previous_run=previous_run, out_dir=tmp_dir,
+                                minimap_preset=minimap_preset, threads=threads,
+                                max_memory=max_memory),
+                        deps=["extract_query", "index_target",
+                              "parse_query", "parse_target", "reused"])
+
+    results = scheduler.run()
+    states = (results["state_query"], results["state_target"], results["reused"],
+              results["screen"])
+    return results["parse_query"], results["parse_target"], results["align"], states
+
+
+def extract_query(gfa_query, out_dir, reused, screen):
+    return gfa_parser.extract_sequences(gfa_query, out_dir, "sequences_query.fasta",
+                                        skip=reused | screen.skip_query)
+
+
+def extract_target(gfa_target, out_dir, screen):
+    return gfa_parser.extract_sequences(gfa_target, out_dir, "sequences_target.fasta",
+                                        skip=screen.skip_target)
+
+
+def align(fasta_query, fasta_target, assembly_graph_query, assembly_graph_target, reused,
+          previous_run, out_dir, minimap_preset, threads, max_memory=None):
+    # with max_memory, the raw hits are left in a PAF file (see
+    # aligner.RawHitFile) instead of being read into a list
+    sequences_query = assembly_graph_query.graph["sequences"]
+    sequences_target = assembly_graph_target.graph["sequences"]
+    keep_file = max_memory is not None
+
+    raw_hits = []
+    if os.path.getsize(fasta_query) > 0:
+        raw_hits = aligner.align(fasta_query, fasta_target, sequences_query, sequences_target,
+                                 out_dir, minimap_preset, threads, keep_file)
+    elif keep_file:
+        open(out_dir + "/minimap.paf", "w").close()
+        raw_hits = aligner.take_paf_file(out_dir + "/minimap.paf",
+                                         sequences_query, sequences_target)
+
+    if not reused:
+        return raw_hits
+
+    reused_hits = [raw_hit for raw_hit in previous_run.raw_hits
+                   if raw_hit.split("\t", 1)[0] in reused]
+
+    # minimap2 reports the hits grouped by query sequences in the order of
+    # the GFA, and so does a full run
+    if not keep_file:
+        raw_hits.extend(aligner.RawPafHit(raw_hit, sequences_query, sequences_target)
+                        for raw_hit in reused_hits)
+        raw_hits.sort(key=lambda raw_hit: raw_hit.query_id)
+        return raw_hits
+
+    # the PAF records of the checkpoint are parsed only as they are merged
+    reused_hits.sort(key=lambda raw_hit: sequences_query.name2id[raw_hit.split("\t", 1)[0]])
+    reused_hits = (aligner.RawPafHit(raw_hit, sequences_query, sequences_target)
+                   for raw_hit in reused_hits)
+    merged_file = out_dir + "/merged.paf"
+
+    with open(merged_file, "w") as f:
+        for raw_hit in heapq.merge(raw_hits, reused_hits,
+                                   key=lambda raw_hit: raw_hit.query_id):
+            f.write(raw_hit.to_paf(sequences_query, sequences_target) + "\n")
+
+    return aligner.take_paf_file(merged_file, sequences_query, sequences_target)
+
+
+def load_assembly_graph(assembly, repeat_detection, use_snapshot=False, snapshot_dir=None):
+    if isinstance(assembly, str):
+        return asg.parse_assembly_graph(assembly, repeat_detection, use_snapshot, snapshot_dir)
+
+    return assembly
+
+
+def find_synteny_paths(result, min_hit_length=ht.MIN_HIT_LENGTH,
+                       max_hits_dist=ht.MAX_HITS_DIST,
+                       max_adjacency_dist=bpg.MAX_ADJACENCY_DIST, max_memory=None):
+    sequences_query = result.assembly_graph_query.graph["sequences"]
+    sequences_target = result.assembly_graph_target.graph["sequences"]
+
+    filtered_hits = ht.filter_repeats(result.raw_hits, sequences_query, sequences_target)
+    find_synteny_blocks(result, filtered_hits, min_hit_length, max_hits_dist, max_memory)
+    link_synteny_blocks(result, max_adjacency_dist)
+
+
+def find_synteny_blocks(result, filtered_hits, min_hit_length, max_hits_dist,
+                        max_memory=None):
+    sequences_query = result.assembly_graph_query.graph["sequences"]
+    sequences_target = result.assembly_graph_target.graph["sequences"]
+
+    processed_hits = ht.process_raw_hits(filtered_hits, min_hit_length, max_hits_dist,
+                                         max_memory)
+
+    synteny_blocks_query, synteny_blocks_target = sb.extract_synteny_blocks(
+        processed_hits, len(sequences_query), len(sequences_target))
+
+    adjacency_graph_query = adg.build_adjacency_graph(result.assembly_graph_query,
+                                                      synteny_blocks_query)
+    adjacency_graph_target = adg.build_adjacency_graph(result.assembly_graph_target,
+                                                       synteny_blocks_target)
+
+    result.synteny_blocks_query = synteny_blocks_query
+    result.synteny_blocks_target = synteny_blocks_target
+    result.adjacency_graph_query = adjacency_graph_query
+    result.adjacency_graph_target = adjacency_graph_target
+
+
+def link_synteny_blocks(result, max_adjacency_dist):
+    # everything after the synteny blocks; only reads the blocks and the
+    # adjacency graphs, so they can be shared between results
+    sequences_query = result.assembly_graph_query.graph["sequences"]
+    sequences_target = result.assembly_graph_target.graph["sequences"]
+    synteny_blocks_query = result.synteny_blocks_query
+    synteny_blocks_target = result.synteny_blocks_target
+    adjacency_graph_query = result.adjacency_graph_query
+    adjacency_graph_target = result.adjacency_graph_target
+
+    with progress.stage("breakpoint_graph"):
+        breakpoint_graph = bpg.build_breakpoint_graph(adjacency_graph_query,
+                                                      synteny_blocks_query,
+                                                      adjacency_graph_target,
+                                                      synteny_blocks_target,
+                                                      max_adjacency_dist)
+
+    with progress.stage("max_matching"):
+        max_matching = nx.max_weight_matching(breakpoint_graph)
+
+    path_components = bpg.build_path_components(breakpoint_graph, max_matching)
+    unused_edges = bpg.get_unused_edges(breakpoint_graph, max_matching)
+
+    with progress.stage("unite_cycles"):
+        number_united_components = bpg.unite_cycles(path_components, unused_edges)
+
+    synteny_paths = ps.build_synteny_paths(path_components)
+    path_sequences_query = ps.build_path_sequences(synteny_blocks_query, synteny_paths,
+                                                   adjacency_graph_query)
+    path_sequences_target = ps.build_path_sequences(synteny_blocks_target, synteny_paths,
+                                                    adjacency_graph_target)
+
+    result.breakpoint_graph = breakpoint_graph
+    result.max_matching = max_matching
+    result.number_united_components = number_united_components
+    result.synteny_paths = synteny_paths
+    result.path_sequences_query = path_sequences_query
+    result.path_sequences_target = path_sequences_target
+
+    result.block_index_query = ii.build_block_index(synteny_blocks_query, sequences_query)
+    result.block_index_target = ii.build_block_index(synteny_blocks_target, sequences_target)
+    result.path_index_query = ii.build_path_index(path_sequences_query, sequences_query)
+    result.path_index_target = ii.build_path_index(path_sequences_target, sequences_target)
+
+    result.liftover_table = lo.build_liftover_table(path_sequences_query, sequences_query,
+                                                    path_sequences_target, sequences_target)
+
+
+def calc_stats(result):
+    return st.calc_stats(result.assembly_graph_query, result.synteny_blocks_query,
+                         result.path_sequences_query,
+                         result.assembly_graph_target, result.synteny_blocks_target,
+                         result.path_sequences_target,
+                         result.synteny_paths, result.number_united_components,
+                         result.raw_hits)
+
+
+def save_results(result, out_dir, dot_shards=False, max_dot_edges=2000):
+    # set_block_attributes sorts the paths, so the result keeps its own order
+    block_attributes = sb.set_block_attributes(list(result.synteny_paths))
+
+    if dot_shards:
+        # a directory of summarized per-component files instead of one file
+        for (graph, name) in [(result.adjacency_graph_query, "adjacency_graph_query"),
+                              (result.adjacency_graph_target, "adjacency_graph_target")]:
+            out_gen.adjacency_graph_save_dot_shards(graph, os.path.join(out_dir, name),
+                                                    block_attributes=block_attributes,
+                                                    max_edges=max_dot_edges)
+    else:
+        out_gen.adjacency_graph_save_dot(result.adjacency_graph_query, out_dir=out_dir,
+                                         block_attributes=block_attributes,
+                                         out_file="adjacency_graph_query.gv")
+        out_gen.adjacency_graph_save_dot(result.adjacency_graph_target, out_dir=out_dir,
+                                         block_attributes=block_attributes,
+                                         out_file="adjacency_graph_target.gv")
+
+    out_gen.save_path_sequences(result.path_sequences_query,
+                                result.assembly_graph_query.graph["sequences"],
+                                result.path_sequences_target,
+                                result.assembly_graph_target.graph["sequences"],
+                                out_dir=out_dir)
+    lo.save_liftover_table(result.liftover_table, out_dir=out_dir,
+                           out_file="liftover_table.txt")
+
+    out_gen.output_stats(result.stats, out_dir=out_dir)
+
+    if result.checkpoint is not None:
+        ck.save_checkpoint(result.checkpoint, out_dir)
@@ -0,0 +1,127 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+# seconds between two progress events of a counter
+REPORT_INTERVAL = 10.0
+# a counter looks at the clock only every this many increments
+CHECK_STEP = 1000
+
+_log = None
+
+
+class ProgressLog:
+    # Writes events as JSON lines, one object per line with at least the
+    # time and the name of the event. Lines are flushed as they are written,
+    # so the log can be followed while the run goes on; worker processes
+    # forked after enable share the same file.
+    def __init__(self, file_handle, interval=REPORT_INTERVAL):
+        self.file_handle = file_handle
+        self.interval = interval
+        self.stages = []
+
+    def emit(self, event, **fields):
+        record = {"time": round(time.time(), 3), "event": event}
+        if self.stages:
+            record["stage"] = self.stages[-1]
+        record.update(fields)
+
+        self.file_handle.write(json.dumps(record) + "\n")
+        self.file_handle.flush()
+
+
+class Counter:
+    # Counts the items processed by a loop and reports the count, the rate
+    # and, with a known total, the estimated time left every interval
+    def __init__(self, log, name, total):
+        self.log = log
+        self.name = name
+        self.total = total
+        self.value = 0
+        self.next_check = CHECK_STEP
+        self.start_time = self.last_report = time.monotonic()
+
+    def add(self, n=1):
+        self.value += n
+
+        if self.value >= self.next_check:
+            self.next_check = self.value + CHECK_STEP
+            now = time.monotonic()
+            if now - self.last_report >= self.log.interval:
+                self.last_report = now
+                self.report("progress", now)
+
+    def done(self):
+        self.report("counter_end", time.monotonic())
+
+    def report(self, event, now):
+        elapsed = now - self.start_time
+        rate = self.value / elapsed if elapsed > 0 else 0.0
+        fields = {"counter": self.name, "value": self.value, "rate": round(rate, 1)}
+
+        if self.total is not None:
+            fields["total"] = self.total
+            if event == "progress" and rate > 0:
+                fields["eta"] = round((self.total - self.value) / rate, 1)
+
+        self.log.emit(event, **fields)
+
+
+class NullCounter:
+    # stands for every counter while progress reporting is disabled
+    def add(self, n=1):
+        pass
+
+    def done(self):
+        pass
+
+
+NULL_COUNTER = NullCounter()
+
+
+def enable(out_file, interval=REPORT_INTERVAL):
+    # out_file is a file name or - for stderr
+    global _log
+    file_handle = sys.stderr if out_file == "-" else open(out_file, "a")
+    _log = ProgressLog(file_handle, interval)
+
+
+def disable():
+    global _log
+    if _log is not None and _log.file_handle is not sys.stderr:
+        _log.file_handle.close()
+    _log = None
+
+
+def is_enabled():
+    return _log is not None
+
+
+def event(name, **fields):
+    if _log is not None:
+        _log.emit(name, **fields)
+
+
+def counter(name, total=None):
+    if _log is None:
+        return NULL_COUNTER
+
+    return Counter(_log, name, total)
+
+
+@contextmanager
+def stage(name):
+    if _log is None:
+        yield
+        return
+
+    start_time = time.monotonic()
+    _log.emit("stage_start", stage=name)
+    _log.stages.append(name)
+
+    try:
+        yield
+    finally:
+        _log.stages.pop()
+        _log.emit("stage_end", stage=name, elapsed=round(time.monotonic() - start_time, 3))
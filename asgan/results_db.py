@@ -0,0 +1,157 @@
+import sqlite3
+import datetime
+
+from asgan.synteny_blocks import forward_block
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created TEXT,
+    query TEXT,
+    target TEXT,
+    minimap_preset TEXT,
+    repeat_detection TEXT
+);
+CREATE TABLE IF NOT EXISTS stats (
+    run_id INTEGER REFERENCES runs(id),
+    name TEXT,
+    value
+);
+CREATE TABLE IF NOT EXISTS synteny_blocks (
+    run_id INTEGER REFERENCES runs(id),
+    block_id INTEGER,
+    assembly TEXT,
+    sequence_name TEXT,
+    sequence_length INTEGER,
+    start INTEGER,
+    end INTEGER,
+    strand TEXT
+);
+CREATE TABLE IF NOT EXISTS path_elements (
+    run_id INTEGER REFERENCES runs(id),
+    path INTEGER,
+    position INTEGER,
+    block_id INTEGER,
+    assembly TEXT,
+    sequence_name TEXT,
+    sequence_length INTEGER,
+    start INTEGER,
+    end INTEGER,
+    strand TEXT
+);
+CREATE TABLE IF NOT EXISTS alignments (
+    run_id INTEGER REFERENCES runs(id),
+    query_name TEXT,
+    query_length INTEGER,
+    query_start INTEGER,
+    query_end INTEGER,
+    strand TEXT,
+    target_name TEXT,
+    target_length INTEGER,
+    target_start INTEGER,
+    target_end INTEGER,
+    matching_bases INTEGER,
+    number_bases INTEGER
+);
+CREATE INDEX IF NOT EXISTS stats_run ON stats (run_id, name);
+CREATE INDEX IF NOT EXISTS stats_name ON stats (name);
+CREATE INDEX IF NOT EXISTS synteny_blocks_run ON synteny_blocks (run_id);
+CREATE INDEX IF NOT EXISTS synteny_blocks_sequence ON synteny_blocks (sequence_name);
+CREATE INDEX IF NOT EXISTS path_elements_run ON path_elements (run_id, path);
+CREATE INDEX IF NOT EXISTS path_elements_sequence ON path_elements (sequence_name);
+CREATE INDEX IF NOT EXISTS alignments_run ON alignments (run_id);
+CREATE INDEX IF NOT EXISTS alignments_query ON alignments (query_name);
+CREATE INDEX IF NOT EXISTS alignments_target ON alignments (target_name);
+"""
+
+
+def connect(db_file):
+    connection = sqlite3.connect(db_file)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def save_result(result, db_file, query=None, target=None, minimap_preset=None,
+                repeat_detection=None):
+    # Stores a comparison as a new run in one transaction and returns its
+    # id. Coordinates are given on the forward strands of the sequences.
+    sequences_query = result.assembly_graph_query.graph["sequences"]
+    sequences_target = result.assembly_graph_target.graph["sequences"]
+    connection = connect(db_file)
+
+    try:
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (created, query, target, minimap_preset, repeat_detection) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (datetime.datetime.now().isoformat(timespec="seconds"),
+                 query, target, minimap_preset, repeat_detection))
+            run_id = cursor.lastrowid
+
+            connection.executemany(
+                "INSERT INTO stats VALUES (?, ?, ?)",
+                [(run_id, name, value) for (name, value) in result.stats.items()])
+
+            connection.executemany(
+                "INSERT INTO synteny_blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                block_rows(run_id, "query", result.synteny_blocks_query, sequences_query) +
+                block_rows(run_id, "target", result.synteny_blocks_target, sequences_target))
+
+            connection.executemany(
+                "INSERT INTO path_elements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                path_element_rows(run_id, "query", result.path_sequences_query,
+                                  sequences_query) +
+                path_element_rows(run_id, "target", result.path_sequences_target,
+                                  sequences_target))
+
+            connection.executemany(
+                "INSERT INTO alignments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((run_id,
+                  sequences_query.names[hit.query_id], hit.query_len,
+                  hit.query_start, hit.query_end, hit.strand,
+                  sequences_target.names[hit.target_id], hit.target_len,
+                  hit.target_start, hit.target_end,
+                  hit.matching_bases, hit.number_bases) for hit in result.raw_hits))
+    finally:
+        connection.close()
+
+    return run_id
+
+
+def block_rows(run_id, assembly, synteny_blocks, sequences):
+    rows = []
+
+    for blocks in synteny_blocks:
+        if blocks is None:
+            continue
+
+        for block in blocks:
+            rows.append((run_id, block.id, assembly) + forward_coordinates(block, sequences))
+
+    return rows
+
+
+def path_element_rows(run_id, assembly, path_sequences, sequences):
+    # gaps between blocks have no block id; position is the order of an
+    # element in its path, counting the sequences of gaps one by one
+    rows = []
+
+    for (i, path_sequence) in enumerate(path_sequences):
+        position = 0
+
+        for element in path_sequence:
+            blocks = element if isinstance(element, list) else [element]
+
+            for block in blocks:
+                rows.append((run_id, i + 1, position, block.id, assembly) +
+                            forward_coordinates(block, sequences))
+                position += 1
+
+    return rows
+
+
+def forward_coordinates(block, sequences):
+    strand = "-" if block.sequence_id & 1 else "+"
+    block = forward_block(block)
+    return (sequences.names[block.sequence_id >> 1], block.sequence_length,
+            block.start, block.end, strand)
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import asgan.progress as progress
+
+
+class Stage:
+    def __init__(self, name, func, deps, in_process):
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.in_process = in_process
+
+
+class StageScheduler:
+    # Runs each stage as soon as all its dependencies are finished. A stage
+    # function gets the results of its dependencies as positional arguments.
+    # CPU-bound Python stages go to a process pool, stages that wait for
+    # external tools or disk go to a thread pool.
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.stages = dict()
+
+    def add_stage(self, name, func, deps=(), in_process=False):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError("unknown dependency {} of stage {}".format(dep, name))
+
+        self.stages[name] = Stage(name, func, tuple(deps), in_process)
+
+    def run(self):
+        results = dict()
+        running = dict()
+        pending = list(self.stages.values())
+
+        with ThreadPoolExecutor(self.max_workers) as thread_pool, \
+                ProcessPoolExecutor(self.max_workers) as process_pool:
+            while pending or running:
+                ready = [stage for stage in pending
+                         if all(dep in results for dep in stage.deps)]
+
+                for stage in ready:
+                    pending.remove(stage)
+                    pool = process_pool if stage.in_process else thread_pool
+                    args = [results[dep] for dep in stage.deps]
+                    running[pool.submit(stage.func, *args)] = stage.name
+                    progress.event("stage_start", stage=stage.name)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                        progress.event("stage_end", stage=name)
+                    except Exception:
+                        progress.event("stage_failed", stage=name)
+                        for other in running:
+                            other.cancel()
+                        raise
+
+        return results
@@ -0,0 +1,214 @@
+import os
+
+import numpy as np
+
+import asgan.snapshot as snap
+from asgan.gfa_parser import GfaTokenizer
+from asgan.compression import open_input
+
+STORE_VERSION = 1
+STORE_SUFFIX = ".2bit"
+PACKED_FILE = "packed.bin"
+
+BASES = b"ACGT"
+NO_CODE = 255
+
+# 2-bit codes of the bases in either case; other characters are kept as
+# exceptions
+ENCODE = np.full(256, NO_CODE, dtype=np.uint8)
+for (code, base) in enumerate(BASES):
+    ENCODE[base] = code
+    ENCODE[base + 32] = code
+
+UPPER = np.arange(256, dtype=np.uint8)
+UPPER[ord("a"):ord("z") + 1] -= 32
+
+# the four bases of each byte, the first one in the high bits
+DECODE = np.array([[BASES[(byte >> shift) & 3] for shift in (6, 4, 2, 0)]
+                   for byte in range(256)], dtype=np.uint8)
+
+COMPLEMENT = np.arange(256, dtype=np.uint8)
+COMPLEMENT[np.frombuffer(b"ACGTRYKMBDHVN", dtype=np.uint8)] = \
+    np.frombuffer(b"TGCAYRMKVHDBN", dtype=np.uint8)
+
+
+class SequenceStore:
+    # Sequences of a GFA packed into 2 bits per base. Each sequence starts
+    # at a byte boundary at base offset offsets[i] of the packed file; runs
+    # of other characters (mostly N) are listed separately by their base
+    # offsets in the file. All the arrays are memory-mapped, so processes
+    # reading the same store share its pages, and a pickled store only
+    # holds its path.
+    def __init__(self, path):
+        self.path = path
+
+        packed_file = os.path.join(path, PACKED_FILE)
+        if os.path.getsize(packed_file) > 0:
+            self.packed = np.memmap(packed_file, dtype=np.uint8, mode="r")
+        else:
+            self.packed = np.zeros(0, dtype=np.uint8)
+
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                  for name in ["names", "name_offsets", "offsets", "lengths",
+                               "run_starts", "run_lengths", "run_chars"]}
+
+        self.names = snap.unpack_names(arrays["names"], arrays["name_offsets"])
+        self.name2id = {name: i for (i, name) in enumerate(self.names)}
+        self.offsets = arrays["offsets"]
+        self.lengths = arrays["lengths"]
+        self.run_starts = arrays["run_starts"]
+        self.run_ends = arrays["run_starts"] + arrays["run_lengths"]
+        self.run_chars = arrays["run_chars"]
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def __len__(self):
+        return len(self.names)
+
+    def length(self, name):
+        return int(self.lengths[self.name2id[name]])
+
+    def fetch(self, name, start=0, end=None, reverse=False):
+        # bases [start, end) of the sequence; with reverse, start and end
+        # are positions on its reverse complement
+        index = self.name2id[name]
+        length = int(self.lengths[index])
+        end = length if end is None else min(end, length)
+
+        if reverse:
+            start, end = length - end, length - start
+
+        if end <= start:
+            return ""
+
+        start += int(self.offsets[index])
+        end += int(self.offsets[index])
+
+        shift = start & 3
+        bases = DECODE[self.packed[start >> 2:(end + 3) >> 2]].ravel()[shift:shift + end - start]
+
+        first = np.searchsorted(self.run_ends, start, side="right")
+        last = np.searchsorted(self.run_starts, end)
+        for i in range(first, last):
+            run_start = max(int(self.run_starts[i]), start) - start
+            run_end = min(int(self.run_ends[i]), end) - start
+            bases[run_start:run_end] = self.run_chars[i]
+
+        if reverse:
+            bases = COMPLEMENT[bases[::-1]]
+
+        return bases.tobytes().decode()
+
+
+class StoreWriter:
+    # Packs the sequences passed piece by piece, as GfaTokenizer streams
+    # them, into the packed file of a store
+    def __init__(self, file_handle):
+        self.file_handle = file_handle
+        self.names = []
+        self.offsets = []
+        self.lengths = []
+        self.runs = []
+        self.pending = np.zeros(0, dtype=np.uint8)
+
+    def add_sequence(self, name):
+        self.flush()
+        self.offsets.append(self.position())
+        self.names.append(name)
+        self.lengths.append(0)
+        return self.write
+
+    def position(self):
+        if not self.names:
+            return 0
+        return self.offsets[-1] + (self.lengths[-1] + 3) // 4 * 4
+
+    def write(self, piece):
+        # * stands for a sequence that is not stored in the GFA
+        if piece == b"*" and self.lengths[-1] == 0:
+            return
+
+        chars = np.frombuffer(piece, dtype=np.uint8)
+        codes = ENCODE[chars]
+
+        exceptions = np.flatnonzero(codes == NO_CODE)
+        if len(exceptions) > 0:
+            self.add_runs(self.offsets[-1] + self.lengths[-1] + exceptions,
+                          UPPER[chars[exceptions]])
+            codes[exceptions] = 0
+
+        self.lengths[-1] += len(chars)
+        self.pending = np.concatenate((self.pending, codes))
+
+        full = len(self.pending) // 4 * 4
+        self.file_handle.write(pack(self.pending[:full]).tobytes())
+        self.pending = self.pending[full:]
+
+    def add_runs(self, positions, chars):
+        breaks = np.flatnonzero((np.diff(positions) != 1) | (np.diff(chars) != 0)) + 1
+        for (first, last) in zip(np.concatenate(([0], breaks)).tolist(),
+                                 np.concatenate((breaks, [len(positions)])).tolist()):
+            start, char = int(positions[first]), int(chars[first])
+
+            # a run may go on from the previous piece
+            if self.runs and self.runs[-1][0] + self.runs[-1][1] == start and \
+                    self.runs[-1][2] == char:
+                self.runs[-1][1] += last - first
+            else:
+                self.runs.append([start, last - first, char])
+
+    def flush(self):
+        if len(self.pending) > 0:
+            padding = np.zeros(4 - len(self.pending), dtype=np.uint8)
+            self.file_handle.write(pack(np.concatenate((self.pending, padding))).tobytes())
+            self.pending = np.zeros(0, dtype=np.uint8)
+
+    def arrays(self):
+        names, name_offsets = snap.pack_names(self.names)
+        runs = np.array(self.runs, dtype=np.int64).reshape(-1, 3)
+
+        return {"names": names,
+                "name_offsets": name_offsets,
+                "offsets": np.array(self.offsets, dtype=np.int64),
+                "lengths": np.array(self.lengths, dtype=np.int64),
+                "run_starts": runs[:, 0].copy(),
+                "run_lengths": runs[:, 1].copy(),
+                "run_chars": runs[:, 2].astype(np.uint8)}
+
+
+def pack(codes):
+    codes = codes.reshape(-1, 4)
+    return (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+
+
+def build_sequence_store(gfa_file, path):
+    # the GFA is streamed, so no sequence is held in memory as a whole
+    tmp_path = snap.make_tmp_dir(path)
+
+    with open_input(gfa_file, "rb") as fin, \
+            open(os.path.join(tmp_path, PACKED_FILE), "wb") as fout:
+        writer = StoreWriter(fout)
+        for _ in GfaTokenizer(fin, writer.add_sequence).records():
+            pass
+        writer.flush()
+
+    for (name, array) in writer.arrays().items():
+        np.save(os.path.join(tmp_path, name + ".npy"), array)
+
+    snap.write_meta(tmp_path, gfa_file, STORE_VERSION)
+    snap.replace_dir(tmp_path, path, gfa_file, STORE_VERSION)
+
+
+def read_sequence_store(gfa_file, store_dir=None):
+    # the store is built next to the GFA (or in store_dir) on first use and
+    # rebuilt when the GFA changes
+    path = snap.snapshot_path(gfa_file, store_dir, STORE_SUFFIX)
+
+    if not snap.is_valid(path, gfa_file, STORE_VERSION):
+        build_sequence_store(gfa_file, path)
+
+    return SequenceStore(path)
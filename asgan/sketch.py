@@ -0,0 +1,219 @@
+import numpy as np
+
+from asgan.gfa_parser import RecordType, GfaTokenizer
+from asgan.compression import open_input
+
+KMER_SIZE = 19
+# a k-mer goes to a sketch if its hash is below 2**64 / SCALE, so a sketch
+# keeps about one k-mer of SCALE and shared lengths are estimated as
+# SCALE * number of shared hashes (FracMinHash)
+SCALE = 200
+
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for (code, bases) in enumerate(["Aa", "Cc", "Gg", "Tt"]):
+    for base in bases:
+        BASE_CODES[ord(base)] = code
+
+
+class Sketches:
+    # hashes[i] is the sorted array of unique hashes of the sequence names[i]
+    def __init__(self, names, lengths, hashes):
+        self.names = names
+        self.lengths = lengths
+        self.hashes = hashes
+
+
+class Screen:
+    # names of the sequences left out of the alignment and the estimated
+    # fraction of the shared k-mers of the query kept by the screen
+    def __init__(self, skip_query, skip_target, recall):
+        self.skip_query = skip_query
+        self.skip_target = skip_target
+        self.recall = recall
+
+
+def no_screen():
+    return Screen(set(), set(), None)
+
+
+class SketchWriter:
+    # Sketches the sequences passed piece by piece, as GfaTokenizer streams
+    # them; the last kmer_size - 1 bases of a piece are kept for the k-mers
+    # that go on into the next one
+    def __init__(self, kmer_size=KMER_SIZE, scale=SCALE):
+        self.kmer_size = kmer_size
+        self.max_hash = np.uint64(2**64 // scale)
+        self.hashes = []
+        self.pieces = None
+        self.tail = np.zeros(0, dtype=np.uint8)
+
+    def add_sequence(self, name):
+        self.finish()
+        self.pieces = []
+        self.tail = np.zeros(0, dtype=np.uint8)
+        return self.write
+
+    def write(self, piece):
+        codes = np.concatenate((self.tail, BASE_CODES[np.frombuffer(piece, dtype=np.uint8)]))
+
+        if len(codes) >= self.kmer_size:
+            piece_hashes = hash_kmers(codes, self.kmer_size)
+            self.pieces.append(np.unique(piece_hashes[piece_hashes < self.max_hash]))
+
+        self.tail = codes[len(codes) - self.kmer_size + 1:]
+
+    def finish(self):
+        # ends the current sequence, if any
+        if self.pieces is None:
+            return
+
+        if self.pieces:
+            self.hashes.append(np.unique(np.concatenate(self.pieces)))
+        else:
+            self.hashes.append(np.zeros(0, dtype=np.uint64))
+        self.pieces = None
+
+
+def hash_kmers(codes, kmer_size):
+    # hashes of the canonical k-mers of a chunk; k-mers with bases other
+    # than ACGT get the maximum hash
+    number_kmers = len(codes) - kmer_size + 1
+    invalid = np.concatenate([[0], np.cumsum(codes == 4)])
+    is_valid = invalid[kmer_size:] == invalid[:number_kmers]
+
+    codes = np.minimum(codes, 3).astype(np.uint64)
+    complement = np.uint64(3) - codes
+    forward = np.zeros(number_kmers, dtype=np.uint64)
+    reverse = np.zeros(number_kmers, dtype=np.uint64)
+
+    for i in range(kmer_size):
+        forward = (forward << np.uint64(2)) | codes[i:i + number_kmers]
+        reverse = (reverse << np.uint64(2)) | complement[kmer_size - 1 - i:
+                                                         kmer_size - 1 - i + number_kmers]
+
+    hashes = mix64(np.minimum(forward, reverse))
+    hashes[~is_valid] = np.uint64(2**64 - 1)
+    return hashes
+
+
+def mix64(x):
+    # splitmix64 finalizer
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        return x ^ (x >> np.uint64(31))
+
+
+def sketch_gfa(gfa_file, kmer_size=KMER_SIZE, scale=SCALE):
+    # the GFA is streamed, so no sequence is held in memory as a whole
+    names, lengths = [], []
+    writer = SketchWriter(kmer_size, scale)
+
+    with open_input(gfa_file, "rb") as f:
+        for (record, length) in GfaTokenizer(f, writer.add_sequence).records():
+            if record[0] == RecordType.SEQUENCE:
+                names.append(record[1])
+                lengths.append(length)
+
+    writer.finish()
+    return Sketches(names, lengths, writer.hashes)
+
+
+def count_shared_hashes(sketches_query, sketches_target):
+    # numbers of hashes shared by the pairs of query and target sequences
+    # sharing any, as arrays of query indices, target indices and counts;
+    # fragmented assemblies have far too many pairs for a dense matrix
+    query_indices, target_indices, counts = [], [], []
+
+    if sketches_target.hashes:
+        target_hashes = np.concatenate(sketches_target.hashes)
+        target_sequences = np.repeat(np.arange(len(sketches_target.hashes)),
+                                     [len(hashes) for hashes in sketches_target.hashes])
+        order = np.argsort(target_hashes, kind="stable")
+        target_hashes, target_sequences = target_hashes[order], target_sequences[order]
+
+        for (i, hashes) in enumerate(sketches_query.hashes):
+            lo = np.searchsorted(target_hashes, hashes, side="left")
+            hi = np.searchsorted(target_hashes, hashes, side="right")
+            found = hi > lo
+
+            if not found.any():
+                continue
+
+            # a hash may occur in several target sequences
+            lo, hi = lo[found], hi[found]
+            positions = np.repeat(lo, hi - lo) + \
+                np.arange((hi - lo).sum()) - np.repeat(np.cumsum(hi - lo) - (hi - lo), hi - lo)
+            sequences, sequence_counts = np.unique(target_sequences[positions],
+                                                   return_counts=True)
+
+            query_indices.append(np.full(len(sequences), i, dtype=np.int64))
+            target_indices.append(sequences.astype(np.int64))
+            counts.append(sequence_counts.astype(np.int64))
+
+    if not counts:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64))
+
+    return np.concatenate(query_indices), np.concatenate(target_indices), np.concatenate(counts)
+
+
+def screen(threshold, sketches_query, sketches_target):
+    # A query sequence is aligned if the fraction of its hashes found in the
+    # target (its containment) reaches the threshold, and a target sequence
+    # is indexed if its containment in the query does.
+    query_indices, target_indices, counts = count_shared_hashes(sketches_query, sketches_target)
+
+    sizes_query = np.array([len(hashes) for hashes in sketches_query.hashes], dtype=np.int64)
+    sizes_target = np.array([len(hashes) for hashes in sketches_target.hashes], dtype=np.int64)
+    containment_query = shared_hashes(sketches_query, sketches_target) / np.maximum(sizes_query, 1)
+    containment_target = shared_hashes(sketches_target, sketches_query) / np.maximum(sizes_target, 1)
+
+    keep_query = containment_query >= threshold
+    keep_target = containment_target >= threshold
+
+    total_shared = counts.sum()
+    recall = 1.0
+    if total_shared > 0:
+        kept = keep_query[query_indices] & keep_target[target_indices]
+        recall = counts[kept].sum() / total_shared
+
+    skip_query = {name for (name, keep) in zip(sketches_query.names, keep_query) if not keep}
+    skip_target = {name for (name, keep) in zip(sketches_target.names, keep_target) if not keep}
+    return Screen(skip_query, skip_target, float(recall))
+
+
+def shared_hashes(sketches, other_sketches):
+    # numbers of hashes of each sequence found anywhere in the other assembly
+    if not other_sketches.hashes:
+        return np.zeros(len(sketches.hashes), dtype=np.int64)
+
+    other_hashes = np.unique(np.concatenate(other_sketches.hashes))
+    return np.array([np.isin(hashes, other_hashes, assume_unique=True).sum()
+                     for hashes in sketches.hashes], dtype=np.int64)
+
+
+def triage(gfa_query, gfa_target, kmer_size=KMER_SIZE, scale=SCALE, max_pairs=20):
+    # approximate comparison of two assemblies without alignment
+    sketches_query = sketch_gfa(gfa_query, kmer_size, scale)
+    sketches_target = sketch_gfa(gfa_target, kmer_size, scale)
+    query_indices, target_indices, counts = count_shared_hashes(sketches_query, sketches_target)
+
+    shared_query = shared_hashes(sketches_query, sketches_target)
+    shared_target = shared_hashes(sketches_target, sketches_query)
+
+    stats = {
+        "number_sequences_query": len(sketches_query.names),
+        "number_sequences_target": len(sketches_target.names),
+        "total_length_query": sum(sketches_query.lengths),
+        "total_length_target": sum(sketches_target.lengths),
+        "shared_length_query": int(shared_query.sum()) * scale,
+        "shared_length_target": int(shared_target.sum()) * scale
+    }
+
+    pairs = []
+    for (i, j, count) in zip(query_indices.tolist(), target_indices.tolist(), counts.tolist()):
+        pairs.append((sketches_query.names[i], sketches_target.names[j], count * scale))
+
+    pairs.sort(key=lambda pair: pair[2], reverse=True)
+    return stats, pairs[:max_pairs]
@@ -0,0 +1,155 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+from asgan.gfa_parser import SequenceTable
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot"
+META_FILE = "meta.json"
+HASH_CHUNK_SIZE = 1 << 24
+
+
+class Fingerprint:
+    # Identifies the content of a GFA. Size and mtime are checked first;
+    # the content hash is only computed when the mtime changed but the size
+    # did not, e.g. for a copied or touched file.
+    def __init__(self, size, mtime, digest):
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+
+    def to_dict(self):
+        return {"size": self.size, "mtime": self.mtime, "digest": self.digest}
+
+
+def file_digest(file_name):
+    digest = hashlib.sha1()
+
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def fingerprint(gfa_file):
+    stat = os.stat(gfa_file)
+    return Fingerprint(stat.st_size, stat.st_mtime_ns, file_digest(gfa_file))
+
+
+def snapshot_path(gfa_file, snapshot_dir=None, suffix=SNAPSHOT_SUFFIX):
+    # next to the GFA by default; in a cache directory, snapshots are named
+    # by the absolute path of their GFA
+    if snapshot_dir is None:
+        return gfa_file + suffix
+
+    key = hashlib.sha1(os.path.abspath(gfa_file).encode()).hexdigest()
+    return os.path.join(snapshot_dir, key + suffix)
+
+
+def make_tmp_dir(path):
+    return tempfile.mkdtemp(prefix=os.path.basename(path) + ".",
+                            dir=os.path.dirname(os.path.abspath(path)))
+
+
+def write_meta(path, gfa_file, version):
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({"version": version, "gfa": fingerprint(gfa_file).to_dict()}, f)
+
+
+def replace_dir(tmp_path, path, gfa_file, version):
+    # a valid snapshot saved by another run in the meantime may be being
+    # read, so it is kept and the new one dropped
+    if os.path.exists(path) and is_valid(path, gfa_file, version):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+
+    if os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    # another run may have saved the same snapshot in the meantime
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def pack_names(names):
+    # names are kept as one byte array and the offsets of their ends
+    names = [name.encode() for name in names]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    name_offsets[1:] = np.cumsum([len(name) for name in names])
+    return np.frombuffer(b"".join(names), dtype=np.uint8), name_offsets
+
+
+def unpack_names(names, name_offsets):
+    names_blob = names.tobytes()
+    offsets = name_offsets.tolist()
+    return [names_blob[start:end].decode() for (start, end) in zip(offsets, offsets[1:])]
+
+
+def save_snapshot(path, gfa_file, sequences, nodes_from, nodes_to):
+    # Arrays are written as .npy files so that they can be memory-mapped.
+    # The snapshot is written to a temporary directory first, so a reader
+    # never sees a half-written one.
+    names, name_offsets = pack_names(sequences.names)
+
+    arrays = {
+        "names": names,
+        "name_offsets": name_offsets,
+        "lengths": np.array(sequences.lengths, dtype=np.int64),
+        "is_repeat": np.array(sequences.is_repeat, dtype=bool),
+        "depths": np.array([np.nan if depth is None else depth for depth in sequences.depths],
+                           dtype=np.float64),
+        "nodes_from": np.array(nodes_from, dtype=np.int64),
+        "nodes_to": np.array(nodes_to, dtype=np.int64)}
+
+    tmp_path = make_tmp_dir(path)
+
+    for (name, array) in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), array)
+
+    write_meta(tmp_path, gfa_file, SNAPSHOT_VERSION)
+    replace_dir(tmp_path, path, gfa_file, SNAPSHOT_VERSION)
+
+
+def is_valid(path, gfa_file, version=SNAPSHOT_VERSION):
+    meta_file = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_file):
+        return False
+
+    with open(meta_file) as f:
+        meta = json.load(f)
+
+    if meta.get("version") != version:
+        return False
+
+    stat = os.stat(gfa_file)
+    if stat.st_size != meta["gfa"]["size"]:
+        return False
+
+    return stat.st_mtime_ns == meta["gfa"]["mtime"] or \
+        file_digest(gfa_file) == meta["gfa"]["digest"]
+
+
+def load_snapshot(path):
+    # returns the sequence table and the nodes of the edges of both strands
+    # of every sequence (see assembly_graph.find_nodes)
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+              for name in ["names", "name_offsets", "lengths", "is_repeat", "depths",
+                           "nodes_from", "nodes_to"]}
+
+    sequences = SequenceTable()
+    sequences.names = unpack_names(arrays["names"], arrays["name_offsets"])
+    sequences.lengths = arrays["lengths"].tolist()
+    sequences.is_repeat = arrays["is_repeat"].tolist()
+    sequences.depths = [None if np.isnan(depth) else depth
+                        for depth in arrays["depths"].tolist()]
+    sequences.name2id = {name: i for (i, name) in enumerate(sequences.names)}
+
+    return sequences, arrays["nodes_from"].tolist(), arrays["nodes_to"].tolist()
@@ -1,9 +1,10 @@
 import networkx as nx
+from asgan.common import complement_id
 
 
 def calc_stats(assembly_graph_query, synteny_blocks_query, path_sequences_query,
                assembly_graph_target, synteny_blocks_target, path_sequences_target,
-               synteny_paths, number_united_components, raw_hits, out_dir):
+               synteny_paths, number_united_components, raw_hits):
     stats = dict()
 
     # number wcc
@@ -170,59 +171,60 @@ def number_wcc(assembly_graph, synteny_blocks):
 
 
 def contains_complementary_sequences(component):
-    def complement(name):
-        return name[:-1] + ["+", "-"][name[-1] == "+"]
-
     sequences = set()
 
     for (_, _, data) in component.edges(data=True):
-        if complement(data["name"]) in sequences:
+        if complement_id(data["id"]) in sequences:
             return True
 
-        sequences.add(data["name"])
+        sequences.add(data["id"])
 
     return False
 
 
-def calc_sequence_lengths(assembly_graph, synteny_blocks):
-    sequence_lengths = []
+def get_covered_sequences(assembly_graph, synteny_blocks):
+    # Both strands of a sequence belong to components with synteny blocks,
+    # so each sequence is counted once by its forward strand
+    covered_sequences = set()
 
     for component in nx.weakly_connected_component_subgraphs(assembly_graph, copy=False):
         if contains_synteny_blocks(component, synteny_blocks):
-            sequence_lengths.extend([data["length"] for (_, _, data)
-                                     in component.edges(data=True)])
+            covered_sequences.update([data["id"] >> 1 for (_, _, data)
+                                      in component.edges(data=True)])
+
+    return covered_sequences
 
-    return filter_complement(sequence_lengths)
+
+def calc_sequence_lengths(assembly_graph, synteny_blocks):
+    sequences = assembly_graph.graph["sequences"]
+    covered_sequences = get_covered_sequences(assembly_graph, synteny_blocks)
+    return [sequences.lengths[i] for i in covered_sequences]
 
 
 def calc_unique_sequences(assembly_graph, synteny_blocks):
+    sequences = assembly_graph.graph["sequences"]
     number_unique_sequences = 0
 
-    for component in nx.weakly_connected_component_subgraphs(assembly_graph, copy=False):
-        if contains_synteny_blocks(component, synteny_blocks):
-            for (_, _, data) in component.edges(data=True):
-                if data["length"] >= 50000 and not data["is_repeat"] and data["name"] in synteny_blocks:
-                    number_unique_sequences += 1
+    for i in get_covered_sequences(assembly_graph, synteny_blocks):
+        if sequences.lengths[i] >= 50000 and not sequences.is_repeat[i] \
+           and synteny_blocks[i] is not None:
+            number_unique_sequences += 1
 
-    return number_unique_sequences // 2
+    return number_unique_sequences
 
 
 def calc_genome_size(assembly_graph):
-    genome_size = 0
-
-    for (_, _, data) in assembly_graph.edges(data=True):
-        genome_size += data["length"]
-
-    return genome_size // 2
+    return sum(assembly_graph.graph["sequences"].lengths)
 
 
 def calc_synteny_block_lengths(synteny_blocks):
     synteny_block_lengths = []
 
-    for blocks in synteny_blocks.values():
-        synteny_block_lengths.extend([block.length() for block in blocks])
+    for blocks in synteny_blocks:
+        if blocks is not None:
+            synteny_block_lengths.extend([block.length() for block in blocks])
 
-    return filter_complement(synteny_block_lengths)
+    return synteny_block_lengths
 
 
 def calc_path_lengths(paths):
@@ -238,58 +240,47 @@ def calc_path_length(path):
         else:
             path_length += subpath.length()
 
-    if len(path) > 1 and path[0].signed_id() == path[-1].signed_id():
+    if len(path) > 1 and path[0].id == path[-1].id:
         path_length -= path[0].length()
 
     return path_length
 
 
 def calc_mean_alignment_identity(raw_hits):
-    alignment_identities = [hit.alignment_identity() for hit in raw_hits]
-    sum_alignment_identities = float(sum(alignment_identities))
-    len_alignment_identities = float(len(alignment_identities))
+    # raw hits may be a RawHitFile, so they are summed without building lists
+    sum_alignment_identities = float(sum(hit.alignment_identity() for hit in raw_hits))
+    len_alignment_identities = float(sum(1 for _ in raw_hits))
     mean_alignment_identity = sum_alignment_identities / len_alignment_identities
     return round(mean_alignment_identity, 3)
 
 
 def calc_total_alignment_identity(raw_hits):
-    matching_bases = [hit.matching_bases for hit in raw_hits]
-    number_bases = [hit.number_bases for hit in raw_hits]
-    sum_matching_bases = float(sum(matching_bases))
-    sum_number_bases = float(sum(number_bases))
+    sum_matching_bases = float(sum(hit.matching_bases for hit in raw_hits))
+    sum_number_bases = float(sum(hit.number_bases for hit in raw_hits))
     total_alignment_identity = sum_matching_bases / sum_number_bases
     return round(total_alignment_identity, 3)
 
 
 def calc_assembly_coverage(raw_hits, assembly_graph_query, assembly_graph_target):
-    query_hit_lengths = [hit.query_hit_length() for hit in raw_hits]
-    target_hit_lengths = [hit.target_hit_length() for hit in raw_hits]
+    query_sequence_lengths = assembly_graph_query.graph["sequences"].lengths
+    target_sequence_lengths = assembly_graph_target.graph["sequences"].lengths
 
-    query_sequence_lengths = [data["length"] for (_, _, data)
-                              in assembly_graph_query.edges(data=True)]
-    target_sequence_lengths = [data["length"] for (_, _, data)
-                               in assembly_graph_target.edges(data=True)]
-
-    query_hit_total_length = float(sum(query_hit_lengths))
-    query_sequence_total_length = float(sum(query_sequence_lengths) / 2)
+    query_hit_total_length = float(sum(hit.query_hit_length() for hit in raw_hits))
+    query_sequence_total_length = float(sum(query_sequence_lengths))
     query_assembly_coverage = query_hit_total_length / query_sequence_total_length
     query_assembly_coverage = round(query_assembly_coverage, 3)
 
-    target_hit_total_length = float(sum(target_hit_lengths))
-    target_sequence_total_length = float(sum(target_sequence_lengths) / 2)
+    target_hit_total_length = float(sum(hit.target_hit_length() for hit in raw_hits))
+    target_sequence_total_length = float(sum(target_sequence_lengths))
     target_assembly_coverage = target_hit_total_length / target_sequence_total_length
     target_assembly_coverage = round(target_assembly_coverage, 3)
 
     return query_assembly_coverage, target_assembly_coverage
 
 
-def filter_complement(lengths):
-    return [length for i, length in enumerate(sorted(lengths)) if i % 2 == 0]
-
-
 def contains_synteny_blocks(component, synteny_blocks):
     for (_, _, data) in component.edges(data=True):
-        if data["name"] in synteny_blocks:
+        if synteny_blocks[data["id"] >> 1] is not None:
             return True
 
     return False
@@ -316,19 +307,19 @@ def calc_link_types(synteny_paths, synteny_blocks_query, synteny_blocks_target):
     def get_link_type(block_from, block_to, id2block_query, id2block_target):
         link_types = [[0, 2], [1, 3]]
 
-        seq_from_query = id2block_query[block_from].sequence_name
-        seq_to_query = id2block_query[block_to].sequence_name
+        seq_from_query = get_block(id2block_query, block_from).sequence_id
+        seq_to_query = get_block(id2block_query, block_to).sequence_id
 
-        seq_from_target = id2block_target[block_from].sequence_name
-        seq_to_target = id2block_target[block_to].sequence_name
+        seq_from_target = get_block(id2block_target, block_from).sequence_id
+        seq_to_target = get_block(id2block_target, block_to).sequence_id
 
         row = seq_from_query != seq_to_query
         col = seq_from_target != seq_to_target
 
         return link_types[row][col]
 
-    id2block_query = build_id2block_dict(synteny_blocks_query)
-    id2block_target = build_id2block_dict(synteny_blocks_target)
+    id2block_query = build_id2block(synteny_blocks_query)
+    id2block_target = build_id2block(synteny_blocks_target)
     link_types = [0, 0, 0, 0]
 
     for path in synteny_paths:
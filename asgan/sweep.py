@@ -0,0 +1,116 @@
+import os
+import argparse
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import asgan.hits as ht
+import asgan.pipeline as pipeline
+import asgan.assembly_graph as asg
+import asgan.breakpoint_graph as bpg
+import asgan.output_generator as out_gen
+
+# graphs and hits shared by all the combinations, set once in each worker
+# process by init_worker instead of being sent with every task
+shared = dict()
+
+
+def init_worker(assembly_graph_query, assembly_graph_target, raw_hits, filtered_hits):
+    shared["assembly_graph_query"] = assembly_graph_query
+    shared["assembly_graph_target"] = assembly_graph_target
+    shared["raw_hits"] = raw_hits
+    shared["filtered_hits"] = filtered_hits
+
+
+def run_combinations(min_hit_length, max_hits_dist, max_adjacency_dists):
+    # the blocks and adjacency graphs depend only on the hit parameters, so
+    # they are built once for all the adjacency distances
+    result = pipeline.ComparisonResult(shared["assembly_graph_query"],
+                                       shared["assembly_graph_target"],
+                                       shared["raw_hits"])
+    pipeline.find_synteny_blocks(result, shared["filtered_hits"], min_hit_length, max_hits_dist)
+
+    # no stats for the combinations that leave no blocks
+    if all(blocks is None for blocks in result.synteny_blocks_query):
+        return [None] * len(max_adjacency_dists)
+
+    stats = []
+    for max_adjacency_dist in max_adjacency_dists:
+        pipeline.link_synteny_blocks(result, max_adjacency_dist)
+        stats.append(pipeline.calc_stats(result))
+
+    return stats
+
+
+def sweep(query, target, min_hit_lengths, max_hits_dists, max_adjacency_dists,
+          minimap_preset="asm10", threads=4, repeat_detection="tag", verbose=False):
+    # Aligns the GFAs once and runs the rest of the pipeline for every
+    # combination of the parameters. Returns a list of
+    # ((min_hit_length, max_hits_dist, max_adjacency_dist), stats).
+    def log(message):
+        if verbose:
+            print(message)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log("Parsing assembly graphs and aligning sequences..")
+        assembly_graph_query, assembly_graph_target, raw_hits, _ = pipeline.ingest(
+            query, target, tmp_dir, minimap_preset, threads, repeat_detection)
+
+    # the filtered hits are shared by all the combinations
+    filtered_hits = list(ht.filter_repeats(raw_hits,
+                                           assembly_graph_query.graph["sequences"],
+                                           assembly_graph_target.graph["sequences"]))
+
+    # the adjacency distances are split into chunks when there are fewer
+    # hit parameter pairs than workers
+    hit_parameters = list(itertools.product(min_hit_lengths, max_hits_dists))
+    number_chunks = max(1, min(len(max_adjacency_dists), threads // len(hit_parameters)))
+    chunks = [max_adjacency_dists[i::number_chunks] for i in range(number_chunks)]
+
+    log("Running {} combinations..".format(len(hit_parameters) * len(max_adjacency_dists)))
+    tasks = list(itertools.product(hit_parameters, chunks))
+    stats = dict()
+
+    with ProcessPoolExecutor(threads, initializer=init_worker,
+                             initargs=(assembly_graph_query, assembly_graph_target,
+                                       raw_hits, filtered_hits)) as pool:
+        futures = [pool.submit(run_combinations, min_hit_length, max_hits_dist, chunk)
+                   for ((min_hit_length, max_hits_dist), chunk) in tasks]
+
+        for (((min_hit_length, max_hits_dist), chunk), future) in zip(tasks, futures):
+            for (max_adjacency_dist, chunk_stats) in zip(chunk, future.result()):
+                stats[(min_hit_length, max_hits_dist, max_adjacency_dist)] = chunk_stats
+
+    return [(parameters, stats[parameters])
+            for parameters in itertools.product(min_hit_lengths, max_hits_dists,
+                                                max_adjacency_dists)]
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog="asgan sweep")
+    parser.add_argument("--input-query")
+    parser.add_argument("--input-target")
+    parser.add_argument("--out-dir")
+    parser.add_argument("--minimap-preset", default="asm10")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--repeat-detection", default="tag",
+                        choices=asg.REPEAT_DETECTION_METHODS)
+    parser.add_argument("--min-hit-length", type=int, nargs="+",
+                        default=[ht.MIN_HIT_LENGTH])
+    parser.add_argument("--max-hits-dist", type=int, nargs="+",
+                        default=[ht.MAX_HITS_DIST])
+    parser.add_argument("--max-adjacency-dist", type=int, nargs="+",
+                        default=[bpg.MAX_ADJACENCY_DIST])
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    os.mkdir(args.out_dir)
+
+    results = sweep(args.input_query, args.input_target,
+                    args.min_hit_length, args.max_hits_dist, args.max_adjacency_dist,
+                    minimap_preset=args.minimap_preset, threads=args.threads,
+                    repeat_detection=args.repeat_detection, verbose=True)
+
+    out_gen.save_sweep_stats(results, out_dir=args.out_dir, out_file="sweep_stats.txt")
@@ -1,100 +1,131 @@
-from asgan.output_generator import pretty_number
+from asgan.common import complement_id, block_index
 
 
 class SequenceBlock:
-    def __init__(self, id, sequence_name, sequence_length, start, end):
+    # sequence_id is an oriented sequence id (see common.oriented_id)
+    def __init__(self, id, sequence_id, sequence_length, start, end):
         self.id = id
-        self.sequence_name = sequence_name
+        self.sequence_id = sequence_id
         self.sequence_length = sequence_length
         self.start = start
         self.end = end
 
-    def signed_id(self):
-        if self.id is None:
-            return ""
-
-        return ["-", "+"][self.id > 0] + str(abs(self.id))
-
     def length(self):
         return self.end - self.start
 
-    def __str__(self):
-        name = self.sequence_name
-        start = pretty_number(self.start)
-        end = pretty_number(self.end)
-        id = "-"
 
-        if self.id is not None:
-            id = self.signed_id()
+class SyntenyBlock(SequenceBlock):
+    pass
 
-        return "{}\t{}\t{}\t{}".format(name, start, end, id)
 
+def complement_block(block):
+    block_id = None
+    if block.id is not None:
+        block_id = -block.id
 
-class SyntenyBlock(SequenceBlock):
-    pass
+    return block.__class__(block_id, complement_id(block.sequence_id),
+                           block.sequence_length,
+                           block.sequence_length - block.end,
+                           block.sequence_length - block.start)
 
 
-def extract_synteny_blocks(hits):
+def forward_block(block):
+    if block.sequence_id & 1:
+        return complement_block(block)
+
+    return block
+
+
+def extract_synteny_blocks(hits, number_sequences_query, number_sequences_target):
+    # Blocks are stored once, on the forward strand of their sequence. The
+    # blocks of the reverse strand are given by get_sequence_blocks.
     synteny_blocks_query, synteny_blocks_target = [], []
 
     for hit in hits:
         synteny_block_query = SyntenyBlock(hit.id,
-                                           hit.query_name, hit.query_len,
+                                           hit.query_id, hit.query_len,
                                            hit.query_start, hit.query_end)
         synteny_block_target = SyntenyBlock(hit.id,
-                                            hit.target_name, hit.target_len,
+                                            hit.target_id, hit.target_len,
                                             hit.target_start, hit.target_end)
 
-        synteny_blocks_query.append(synteny_block_query)
-        synteny_blocks_target.append(synteny_block_target)
+        synteny_blocks_query.append(forward_block(synteny_block_query))
+        synteny_blocks_target.append(forward_block(synteny_block_target))
 
-    return (group_by_sequence(synteny_blocks_query),
-            group_by_sequence(synteny_blocks_target))
+    return (group_by_sequence(synteny_blocks_query, number_sequences_query),
+            group_by_sequence(synteny_blocks_target, number_sequences_target))
 
 
-def group_by_sequence(synteny_blocks):
-    grouped_synteny_blocks = dict()
+def group_by_sequence(synteny_blocks, number_sequences):
+    # indexed by sequence, None for the sequences without blocks;
+    # the blocks of each sequence are sorted by start
+    grouped_synteny_blocks = [None] * number_sequences
 
     for synteny_block in synteny_blocks:
-        if synteny_block.sequence_name not in grouped_synteny_blocks:
-            grouped_synteny_blocks[synteny_block.sequence_name] = []
+        sequence = synteny_block.sequence_id >> 1
+
+        if grouped_synteny_blocks[sequence] is None:
+            grouped_synteny_blocks[sequence] = []
+
+        grouped_synteny_blocks[sequence].append(synteny_block)
 
-        grouped_synteny_blocks[synteny_block.sequence_name].append(synteny_block)
+    for blocks in grouped_synteny_blocks:
+        if blocks is not None:
+            blocks.sort(key=lambda block: block.start)
 
     return grouped_synteny_blocks
 
 
+def get_sequence_blocks(synteny_blocks, sequence_id):
+    blocks = synteny_blocks[sequence_id >> 1]
+
+    if blocks is None or sequence_id & 1 == 0:
+        return blocks
+
+    # overlapping blocks do not keep their order on the reverse strand; ties
+    # keep the order of the hits, as the blocks were added by hit id
+    return sorted((complement_block(block) for block in blocks),
+                  key=lambda block: (block.start, abs(block.id)))
+
+
+def get_block(id2block, block_id):
+    block = id2block[abs(block_id)]
+
+    if block.id != block_id:
+        return complement_block(block)
+
+    return block
+
+
 def set_block_attributes(paths):
+    # indexed by common.block_index
     colors = ["blue", "green", "gold", "red", "purple", "darkorange",
               "hotpink", "khaki", "lightblue", "thistle", "tan"]
-    block_colors = dict()
-    block_styles = dict()
+    number_blocks = max([abs(block) for path in paths for block in path], default=0)
+    block_colors = [None] * (2 * number_blocks)
+    block_styles = [None] * (2 * number_blocks)
     i = 0
 
     paths.sort(key=lambda path: len(path), reverse=True)
 
     while i < len(colors) and i < len(paths):
         for block in paths[i]:
-            block_colors[block] = colors[i]
-            block_styles[block] = "solid"
+            block_colors[block_index(block)] = colors[i]
+            block_styles[block_index(block)] = "solid"
 
-            block_colors[inv_block(block)] = colors[i]
-            block_styles[inv_block(block)] = "dashed"
+            block_colors[block_index(-block)] = colors[i]
+            block_styles[block_index(-block)] = "dashed"
 
         i += 1
 
     while i < len(paths):
         for block in paths[i]:
-            block_colors[block] = "gray"
-            block_styles[block] = "solid"
+            block_colors[block_index(block)] = "gray"
+            block_styles[block_index(block)] = "solid"
 
-            block_colors[inv_block(block)] = "gray"
-            block_styles[inv_block(block)] = "dashed"
+            block_colors[block_index(-block)] = "gray"
+            block_styles[block_index(-block)] = "dashed"
 
         i += 1
 
     return {"color": block_colors, "style": block_styles}
-
-
-def inv_block(block_id):
-    return ["+", "-"][block_id[0] == "+"] + block_id[1:]
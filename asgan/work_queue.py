@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import shutil
+import socket
+import hashlib
+import argparse
+import cProfile
+import threading
+import traceback
+
+import asgan.pipeline as pipeline
+import asgan.checkpoint as ck
+import asgan.progress as progress
+import asgan.assembly_graph as asg
+from asgan.multi import checkpoint_cache_path
+
+LEASE_TIMEOUT = 600
+HEARTBEAT_INTERVAL = 30
+POLL_INTERVAL = 10
+MAX_ATTEMPTS = 3
+
+JOBS_DIR = "jobs"
+LEASES_DIR = "leases"
+DONE_DIR = "done"
+FAILED_DIR = "failed"
+RESULTS_DIR = "results"
+CACHE_DIR = "cache"
+
+
+class WorkQueue:
+    # A queue of pairwise comparisons kept in a directory shared by all the
+    # workers, with no other coordination than atomic file operations:
+    #   jobs/<id>.json        a comparison and its options
+    #   leases/<id>.<n>       attempt n at the job, created with O_EXCL so
+    #                         that only one worker gets it; its owner touches
+    #                         it while the job runs
+    #   done/<id>.json        written once the results are in results/<id>
+    #   failed/<id>.json      the error, or too many expired leases
+    #   cache/                graph snapshots and checkpoints of earlier runs
+    # An attempt whose lease has not been touched for lease_timeout seconds
+    # is considered dead, and the job is taken again with attempt n + 1.
+    def __init__(self, queue_dir):
+        self.queue_dir = queue_dir
+
+    def path(self, *names):
+        return os.path.join(self.queue_dir, *names)
+
+    def create(self):
+        for name in [JOBS_DIR, LEASES_DIR, DONE_DIR, FAILED_DIR, RESULTS_DIR, CACHE_DIR]:
+            os.makedirs(self.path(name), exist_ok=True)
+
+    def job_ids(self):
+        return sorted(file_name[:-len(".json")] for file_name in os.listdir(self.path(JOBS_DIR))
+                      if file_name.endswith(".json"))
+
+    def read_job(self, job_id):
+        return read_json(self.path(JOBS_DIR, job_id + ".json"))
+
+    def is_finished(self, job_id):
+        return os.path.exists(self.path(DONE_DIR, job_id + ".json")) or \
+            os.path.exists(self.path(FAILED_DIR, job_id + ".json"))
+
+    def attempts(self, job_id):
+        prefix = job_id + "."
+        return [int(file_name[len(prefix):]) for file_name in os.listdir(self.path(LEASES_DIR))
+                if file_name.startswith(prefix) and file_name[len(prefix):].isdigit()]
+
+    def lease_file(self, job_id, attempt):
+        return self.path(LEASES_DIR, "{}.{}".format(job_id, attempt))
+
+    def last_attempt(self, job_id):
+        return max(self.attempts(job_id), default=0)
+
+    def remove_leases(self, job_id):
+        for attempt in self.attempts(job_id):
+            try:
+                os.remove(self.lease_file(job_id, attempt))
+            except FileNotFoundError:
+                pass
+
+    def lease_age(self, job_id, attempt):
+        try:
+            return time.time() - os.stat(self.lease_file(job_id, attempt)).st_mtime
+        except FileNotFoundError:
+            return None
+
+
+class Lease:
+    def __init__(self, queue, job_id, attempt):
+        self.queue = queue
+        self.job_id = job_id
+        self.attempt = attempt
+        self.file_name = queue.lease_file(job_id, attempt)
+
+    def touch(self):
+        try:
+            os.utime(self.file_name)
+        except FileNotFoundError:
+            pass
+
+    def is_owned(self):
+        # a newer attempt means the lease expired and the job was taken over
+        return os.path.exists(self.file_name) and \
+            self.queue.last_attempt(self.job_id) == self.attempt
+
+    def release(self):
+        try:
+            os.remove(self.file_name)
+        except FileNotFoundError:
+            pass
+
+
+class Heartbeat:
+    # touches a lease from a background thread while a job runs
+    def __init__(self, lease, interval):
+        self.lease = lease
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.lease.touch()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def read_json(file_name):
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def write_json(file_name, data):
+    tmp_file = "{}.{}.tmp".format(file_name, os.getpid())
+
+    with open(tmp_file, "w") as f:
+        json.dump(data, f, indent=2)
+
+    os.replace(tmp_file, file_name)
+
+
+def job_id(job):
+    return hashlib.sha1(json.dumps(job, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def submit(queue_dir, pairs, minimap_preset="asm10", repeat_detection="tag", prescreen=None):
+    # adds a job for each (query, target) pair; a job that is already in the
+    # queue is not added again
+    queue = WorkQueue(queue_dir)
+    queue.create()
+
+    job_ids = []
+    for (query, target) in pairs:
+        job = {"query": os.path.abspath(query), "target": os.path.abspath(target),
+               "minimap_preset": minimap_preset, "repeat_detection": repeat_detection,
+               "prescreen": prescreen}
+        job_ids.append(job_id(job))
+
+        job_file = queue.path(JOBS_DIR, job_ids[-1] + ".json")
+        if not os.path.exists(job_file):
+            write_json(job_file, job)
+
+    return job_ids
+
+
+def claim_job(queue, worker_id, lease_timeout, max_attempts):
+    # Returns a lease on the first job that is neither finished nor taken
+    # by a live worker, or None. Returns False if every job is finished.
+    unfinished = False
+
+    for job in queue.job_ids():
+        if queue.is_finished(job):
+            continue
+
+        unfinished = True
+        attempt = queue.last_attempt(job)
+
+        if attempt > 0:
+            age = queue.lease_age(job, attempt)
+            if age is not None and age < lease_timeout:
+                continue
+
+            # the lease expired (or was released by a worker that stopped)
+            if attempt >= max_attempts:
+                write_json(queue.path(FAILED_DIR, job + ".json"),
+                           {"error": "the lease expired {} times".format(attempt),
+                            "worker": worker_id})
+                queue.remove_leases(job)
+                continue
+
+        try:
+            fd = os.open(queue.lease_file(job, attempt + 1), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+
+        with os.fdopen(fd, "w") as f:
+            json.dump({"worker": worker_id, "time": time.time()}, f)
+
+        return Lease(queue, job, attempt + 1)
+
+    return None if unfinished else False
+
+
+def run_job(queue, lease, worker_id, threads, profile):
+    # The results are written to a private directory and moved to results/
+    # only if the lease is still held, so a worker that lost its lease
+    # never overwrites the results of the one that took the job over.
+    job = queue.read_job(lease.job_id)
+    tmp_dir = queue.path(RESULTS_DIR, ".{}.{}".format(lease.job_id, worker_id))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.mkdir(tmp_dir)
+
+    snapshot_dir = queue.path(CACHE_DIR, "snapshots")
+    cache_file = checkpoint_cache_path(queue.path(CACHE_DIR, "checkpoints"),
+                                       job["query"], job["target"],
+                                       job["minimap_preset"], job["repeat_detection"])
+    os.makedirs(snapshot_dir, exist_ok=True)
+    os.makedirs(cache_file, exist_ok=True)
+
+    previous_run = None
+    if os.path.exists(os.path.join(cache_file, ck.CHECKPOINT_FILE)):
+        previous_run = ck.load_checkpoint(cache_file)
+
+    profiler = cProfile.Profile() if profile else None
+    start_time = time.time()
+    progress.enable(os.path.join(tmp_dir, "events.jsonl"))
+
+    try:
+        if profiler is not None:
+            profiler.enable()
+
+        result = pipeline.compare(job["query"], job["target"],
+                                  minimap_preset=job["minimap_preset"], threads=threads,
+                                  repeat_detection=job["repeat_detection"],
+                                  previous_run=previous_run, prescreen=job["prescreen"],
+                                  use_snapshot=True, snapshot_dir=snapshot_dir)
+
+        with progress.stage("save_results"):
+            pipeline.save_results(result, out_dir=tmp_dir)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(tmp_dir, "profile.pstats"))
+        progress.disable()
+
+    ck.save_checkpoint(result.checkpoint, cache_file)
+
+    if not lease.is_owned():
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+
+    out_dir = queue.path(RESULTS_DIR, lease.job_id)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp_dir, out_dir)
+
+    write_json(queue.path(DONE_DIR, lease.job_id + ".json"),
+               {"query": job["query"], "target": job["target"], "worker": worker_id,
+                "attempt": lease.attempt, "elapsed": round(time.time() - start_time, 3)})
+    return True
+
+
+def run_worker(queue_dir, worker_id=None, threads=4, lease_timeout=LEASE_TIMEOUT,
+               heartbeat_interval=HEARTBEAT_INTERVAL, poll_interval=POLL_INTERVAL,
+               max_attempts=MAX_ATTEMPTS, profile=False):
+    # Takes jobs until every job of the queue is finished; while the others
+    # are held by other workers, waits for them in case their leases expire.
+    # Returns the number of jobs done by this worker.
+    if worker_id is None:
+        worker_id = "{}-{}".format(socket.gethostname(), os.getpid())
+
+    queue = WorkQueue(queue_dir)
+    number_done = 0
+
+    while True:
+        lease = claim_job(queue, worker_id, lease_timeout, max_attempts)
+
+        if lease is False:
+            return number_done
+
+        if lease is None:
+            time.sleep(poll_interval)
+            continue
+
+        try:
+            with Heartbeat(lease, heartbeat_interval):
+                number_done += run_job(queue, lease, worker_id, threads, profile)
+        except Exception:
+            # errors are not retried: running the job again would fail the same way
+            shutil.rmtree(queue.path(RESULTS_DIR, ".{}.{}".format(lease.job_id, worker_id)),
+                          ignore_errors=True)
+            if lease.is_owned():
+                write_json(queue.path(FAILED_DIR, lease.job_id + ".json"),
+                           {"error": traceback.format_exc(), "worker": worker_id,
+                            "attempt": lease.attempt})
+
+        if queue.is_finished(lease.job_id):
+            queue.remove_leases(lease.job_id)
+        else:
+            lease.release()
+
+
+def parse_submit_args(args):
+    parser = argparse.ArgumentParser(prog="asgan submit")
+    parser.add_argument("--queue-dir", required=True)
+    parser.add_argument("--query", required=True)
+    parser.add_argument("--targets", nargs="+", required=True)
+    parser.add_argument("--minimap-preset", default="asm10")
+    parser.add_argument("--repeat-detection", default="tag",
+                        choices=asg.REPEAT_DETECTION_METHODS)
+    parser.add_argument("--prescreen", type=float)
+    return parser.parse_args(args)
+
+
+def submit_main(args):
+    args = parse_submit_args(args)
+    job_ids = submit(args.queue_dir, [(args.query, target) for target in args.targets],
+                     minimap_preset=args.minimap_preset,
+                     repeat_detection=args.repeat_detection, prescreen=args.prescreen)
+
+    for (target, job) in zip(args.targets, job_ids):
+        print("{}\t{}".format(job, target))
+
+
+def parse_worker_args(args):
+    parser = argparse.ArgumentParser(prog="asgan worker")
+    parser.add_argument("--queue-dir", required=True)
+    parser.add_argument("--worker-id")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT)
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    parser.add_argument("--profile", action="store_true")
+    return parser.parse_args(args)
+
+
+def worker_main(args):
+    args = parse_worker_args(args)
+    number_done = run_worker(args.queue_dir, worker_id=args.worker_id, threads=args.threads,
+                             lease_timeout=args.lease_timeout,
+                             heartbeat_interval=args.heartbeat_interval,
+                             poll_interval=args.poll_interval,
+                             max_attempts=args.max_attempts, profile=args.profile)
+    print("jobs done: {}".format(number_done))
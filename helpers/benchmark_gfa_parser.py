@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asgan.gfa_parser as gfa_parser  # noqa: E402
+
+
+def write_gfa(gfa_file, number_sequences, length):
+    # chromosome-scale S records joined into a chain by links
+    block = "".join(random.choice("ACGT") for _ in range(1 << 16)).encode()
+
+    with open(gfa_file, "wb") as f:
+        f.write(b"H\tVN:Z:1.0\n")
+
+        for i in range(number_sequences):
+            f.write("S\tchr{}\t".format(i + 1).encode())
+            for _ in range(length // len(block)):
+                f.write(block)
+            f.write(block[:length % len(block)])
+            f.write("\tLN:i:{}\tdp:i:30\n".format(length).encode())
+
+        for i in range(number_sequences - 1):
+            f.write("L\tchr{}\t+\tchr{}\t+\t0M\n".format(i + 1, i + 2).encode())
+
+
+def parse_gfa_split(gfa_file):
+    # the previous parser: every line is stripped and split as a whole
+    sequences, links = gfa_parser.SequenceTable(), set()
+
+    with open(gfa_file) as f:
+        for line in f:
+            record = line.strip().split()
+
+            if record[0] == gfa_parser.RecordType.SEQUENCE:
+                sequences.add(gfa_parser.parse_sequence(record))
+
+            if record[0] == gfa_parser.RecordType.LINK:
+                link = gfa_parser.parse_link(record, sequences)
+                links.add(link)
+                links.add(gfa_parser.inv_link(link))
+
+    return sequences, sorted(links)
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-gfa")
+    parser.add_argument("--number-sequences", type=int, default=3)
+    parser.add_argument("--length", type=int, default=100 * 10**6)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gfa_file = args.input_gfa
+        if gfa_file is None:
+            gfa_file = os.path.join(tmp_dir, "benchmark.gfa")
+            write_gfa(gfa_file, args.number_sequences, args.length)
+
+        print("{}: {:.1f} Mb".format(gfa_file, os.path.getsize(gfa_file) / 10**6))
+        print("parser\ttime, s\tpeak memory, Mb")
+
+        results = []
+        for (name, function) in [("split", parse_gfa_split),
+                                 ("tokenizer", gfa_parser.parse_gfa)]:
+            result, elapsed, peak = measure(function, gfa_file)
+            results.append(result)
+            print("{}\t{:.2f}\t{:.1f}".format(name, elapsed, peak / 10**6))
+
+        _, elapsed, peak = measure(gfa_parser.extract_sequences, gfa_file, tmp_dir, "out.fasta")
+        print("{}\t{:.2f}\t{:.1f}".format("extract", elapsed, peak / 10**6))
+
+        (sequences_split, links_split), (sequences, links) = results
+        if sequences_split.lengths != sequences.lengths or links_split != links:
+            print("the parsers disagree")
+
+
+if __name__ == "__main__":
+    main()
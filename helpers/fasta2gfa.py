@@ -1,38 +1,123 @@
+import os
+import sys
+import gzip
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def read_fasta(file_handle):
-    header = None
-    seq = []
+from asgan.compression import open_input  # noqa: E402
 
-    for line in file_handle:
-        line = line.strip()
-        if not line:
-            continue
+CHUNK_SIZE = 1 << 20
 
-        if line.startswith(">"):
-            if header:
-                yield header, "".join(seq)
-                seq = []
+# upper-cases the sequence, the whitespace is deleted by translate itself
+UPPER = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+WHITESPACE = b"\r\n\t "
 
-            header = line[1:].split(" ")[0]
-        else:
-            seq.append(line)
 
-    if header and len(seq):
-        yield header, "".join(seq)
+def open_output(file_name):
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, "wb", compresslevel=6)
+
+    return open(file_name, "wb")
+
+
+class GfaWriter:
+    # Writes S records piece by piece: the record is started with the first
+    # piece of its sequence and the LN:i tag is written once it is finished,
+    # so only one chunk of a sequence is held in memory at a time.
+    def __init__(self, file_handle):
+        self.file_handle = file_handle
+        self.header = None
+        self.length = 0
+
+    def start_record(self, header):
+        self.finish_record(last=False)
+        # records without a name (> or > description) are skipped
+        self.header = header.rstrip().split(b" ")[0]
+        self.length = 0
+
+    def write_sequence(self, data):
+        data = data.translate(UPPER, WHITESPACE)
+        if not data or not self.header:
+            return
+
+        if self.length == 0:
+            self.file_handle.write(b"S\t" + self.header + b"\t")
+
+        self.file_handle.write(data)
+        self.length += len(data)
+
+    def finish_record(self, last):
+        # an empty record is skipped only at the end of the file
+        if not self.header:
+            return
+
+        if self.length == 0:
+            if last:
+                return
+            self.file_handle.write(b"S\t" + self.header + b"\t")
+
+        self.file_handle.write(b"\tLN:i:" + str(self.length).encode() + b"\n")
+        self.header = None
+
+
+def convert(input_fasta, out_file):
+    with open_input(input_fasta, "rb") as fin, open_output(out_file) as fout:
+        fout.write(b"H\tVN:Z:1.0\n")
+        writer = GfaWriter(fout)
+
+        header = None
+        line_start = True
+
+        for chunk in iter(lambda: fin.read(CHUNK_SIZE), b""):
+            pos = 0
+
+            while pos < len(chunk):
+                if header is not None:
+                    end = chunk.find(b"\n", pos)
+                    if end == -1:
+                        header += chunk[pos:]
+                        break
+
+                    writer.start_record(header + chunk[pos:end])
+                    header = None
+                    line_start = True
+                    pos = end + 1
+                elif line_start and chunk[pos] == ord(">"):
+                    header = b""
+                    pos += 1
+                else:
+                    # the sequence runs up to the next header line
+                    end = chunk.find(b"\n>", pos)
+                    if end == -1:
+                        writer.write_sequence(chunk[pos:])
+                        line_start = chunk.endswith(b"\n")
+                        break
+
+                    writer.write_sequence(chunk[pos:end + 1])
+                    line_start = True
+                    pos = end + 1
+
+        if header is not None:
+            writer.start_record(header)
+        writer.finish_record(last=True)
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input-fasta")
-    parser.add_argument("--out-file")
+    parser.add_argument("--input-fasta", nargs="+")
+    parser.add_argument("--out-file", nargs="+")
+    parser.add_argument("--jobs", type=int, default=1)
     args = parser.parse_args()
 
-    with open(args.input_fasta) as fin, open(args.out_file, "w") as fout:
-        fout.write("H\tVN:Z:1.0\n")
-        for header, seq in read_fasta(fin):
-            fout.write("S\t{}\t{}\tLN:i:{}\n".format(header, seq.upper(), len(seq)))
+    if len(args.input_fasta) != len(args.out_file):
+        parser.error("--input-fasta and --out-file must have the same number of files")
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        for future in [pool.submit(convert, input_fasta, out_file)
+                       for (input_fasta, out_file) in zip(args.input_fasta, args.out_file)]:
+            future.result()
 
 
 if __name__ == "__main__":
@@ -1,49 +1,150 @@
+import os
+import sys
+import mmap
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def read_fasta(file_handle):
-    header = None
-    seq = []
+from asgan.compression import open_input, is_compressed  # noqa: E402
 
-    for line in file_handle:
-        line = line.strip()
-        if not line:
-            continue
+CHUNK_SIZE = 1 << 20
+WHITESPACE = b"\r\n\t "
 
-        if line.startswith(">"):
-            if header:
-                yield header, "".join(seq)
-                seq = []
 
-            header = line[1:].split(" ")[0]
-        else:
-            seq.append(line)
+class FastaRecord:
+    # an entry of a faidx index: the sequence starts at offset in the file,
+    # and its lines hold line_bases bases and line_width bytes
+    def __init__(self, name, length, offset, line_bases, line_width):
+        self.name = name
+        self.length = length
+        self.offset = offset
+        self.line_bases = line_bases
+        self.line_width = line_width
 
-    if header and len(seq):
-        yield header, "".join(seq)
+
+def index_file(input_fasta):
+    return input_fasta + ".fai"
+
+
+def build_index(input_fasta):
+    records = []
+
+    with open(input_fasta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = mm.find(b">")
+        while pos != -1:
+            header_end = mm.find(b"\n", pos)
+            if header_end == -1:
+                header_end = len(mm)
+
+            name = mm[pos + 1:header_end].strip().split(b" ")[0].decode()
+            offset = min(header_end + 1, len(mm))
+
+            end = mm.find(b"\n>", offset - 1)
+            end = len(mm) if end == -1 else end + 1
+
+            line_end = mm.find(b"\n", offset, end)
+            line_width = (end if line_end == -1 else line_end + 1) - offset
+            line_bases = len(mm[offset:offset + line_width].rstrip(b"\r\n"))
+
+            length = 0
+            for chunk_start in range(offset, end, CHUNK_SIZE):
+                chunk = mm[chunk_start:min(chunk_start + CHUNK_SIZE, end)]
+                length += len(chunk.translate(None, WHITESPACE))
+
+            records.append(FastaRecord(name, length, offset, line_bases, line_width))
+            pos = end if end < len(mm) else -1
+
+    return records
+
+
+def save_index(records, out_file):
+    with open(out_file, "w") as f:
+        for record in records:
+            f.write("{}\t{}\t{}\t{}\t{}\n".format(record.name, record.length, record.offset,
+                                                record.line_bases, record.line_width))
+
+
+def load_index(in_file):
+    records = []
+
+    with open(in_file) as f:
+        for line in f:
+            name, length, offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+            records.append(FastaRecord(name, int(length), int(offset),
+                                       int(line_bases), int(line_width)))
+
+    return records
+
+
+def read_index(input_fasta):
+    # an existing index (e.g. from samtools faidx) is reused unless the
+    # FASTA is newer than it
+    fai_file = index_file(input_fasta)
+
+    if os.path.exists(fai_file) and os.path.getmtime(fai_file) >= os.path.getmtime(input_fasta):
+        return load_index(fai_file)
+
+    records = build_index(input_fasta)
+    save_index(records, fai_file)
+    return records
+
+
+def copy_sequence(mm, record, file_handle):
+    # the sequence is copied chunk by chunk without the line breaks, which
+    # works for any line layout, not only for the uniform one of faidx
+    pos, remaining = record.offset, record.length
+
+    while remaining > 0:
+        chunk = mm[pos:pos + CHUNK_SIZE]
+        if not chunk:
+            raise ValueError("{}: the FASTA is shorter than its index".format(record.name))
+
+        data = chunk.translate(None, WHITESPACE)[:remaining]
+        file_handle.write(data)
+        remaining -= len(data)
+        pos += CHUNK_SIZE
+
+
+def add_sequences(input_fasta, records, input_gfa, out_file):
+    records = {record.name: record for record in records}
+
+    with open(input_fasta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            open_input(input_gfa, "rb") as fin, open(out_file, "wb") as fout:
+        for line in fin:
+            if not line.startswith(b"S\t"):
+                fout.write(line)
+                continue
+
+            name = line.split(b"\t", 2)[1].strip()
+            record = records[name.decode()]
+
+            fout.write(b"S\t" + name + b"\t")
+            copy_sequence(mm, record, fout)
+            fout.write(b"\tLN:i:" + str(record.length).encode() + b"\n")
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input-fasta")
-    parser.add_argument("--input-gfa")
-    parser.add_argument("--out-file")
+    parser.add_argument("--input-gfa", nargs="+")
+    parser.add_argument("--out-file", nargs="+")
+    parser.add_argument("--jobs", type=int, default=1)
     args = parser.parse_args()
 
-    sequences = dict()
+    if len(args.input_gfa) != len(args.out_file):
+        parser.error("--input-gfa and --out-file must have the same number of files")
 
-    with open(args.input_fasta) as f:
-        for header, seq in read_fasta(f):
-            sequences[header] = seq
+    # sequences are read at random through mmap
+    if is_compressed(args.input_fasta):
+        parser.error("--input-fasta must be uncompressed")
 
-    with open(args.input_gfa) as fin, open(args.out_file, "w") as fout:
-        for line in fin:
-            record = line.strip().split()
-            if record[0] == "S":
-                sequence = sequences[record[1]]
-                fout.write("S\t{}\t{}\tLN:i{}\n".format(record[1], sequence, len(sequence)))
-            else:
-                fout.write(line)
+    records = read_index(args.input_fasta)
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        for future in [pool.submit(add_sequences, args.input_fasta, records, input_gfa, out_file)
+                       for (input_gfa, out_file) in zip(args.input_gfa, args.out_file)]:
+            future.result()
 
 
 if __name__ == "__main__":
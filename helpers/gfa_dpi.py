@@ -1,8 +1,13 @@
+import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asgan.compression import open_input  # noqa: E402
+
 
 def main():
-    with open(sys.argv[1]) as f:
+    with open_input(sys.argv[1]) as f:
         for line in f:
             line = line.strip().split()
             if line[0] == "S":
@@ -1,17 +1,49 @@
+import os
+import sys
 import argparse
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asgan.gfa_index as gfai  # noqa: E402
+from asgan.compression import open_input  # noqa: E402
+
+
+def extract_all(input_gfa, out_file):
+    with open_input(input_gfa) as fin, open(out_file, "w") as fout:
+        for line in fin:
+            record = line.strip().split()
+            if record[0] == "S":
+                fout.write(">{}\n{}\n".format(record[1], record[2]))
+
 
 def main():
+    # without a selection every sequence is extracted; a selection reads
+    # only the needed S records through the .gfai index
     parser = argparse.ArgumentParser()
     parser.add_argument("--input-gfa")
     parser.add_argument("--out-file")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--names", nargs="+")
+    selection.add_argument("--component")
+    selection.add_argument("--synteny-paths")
+    parser.add_argument("--path", type=int, default=1)
+    parser.add_argument("--assembly", default="query", choices=["query", "target"])
     args = parser.parse_args()
 
-    with open(args.input_gfa) as fin, open(args.out_file, "w") as fout:
-        for line in fin:
-            record = line.strip().split()
-            if record[0] == "S":
-                fout.write(">{}\n{}\n".format(record[1], record[2]))
+    if args.names is None and args.component is None and args.synteny_paths is None:
+        extract_all(args.input_gfa, args.out_file)
+        return
+
+    index = gfai.read_gfa_index(args.input_gfa)
+
+    if args.names is not None:
+        names = args.names
+    elif args.component is not None:
+        names = index.component(args.component)
+    else:
+        names = gfai.read_synteny_path(args.synteny_paths, args.path, args.assembly)
+
+    gfai.extract_sequences(args.input_gfa, index, names, args.out_file)
 
 
 if __name__ == "__main__":
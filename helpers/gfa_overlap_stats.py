@@ -1,63 +1,46 @@
+import os
+import sys
+import json
 import argparse
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def cigar_total_length(cigar_string, match_only=False):
-    total_length = 0
-    curr_length = ""
+import asgan.overlaps as ovl  # noqa: E402
 
-    for ch in cigar_string:
-        if ch.isdigit():
-            curr_length += ch
-        else:
-            if not match_only or (match_only and ch == "M"):
-                total_length += int(curr_length)
 
-            curr_length = ""
+def print_text(stats):
+    summary = ovl.summarize(stats)
 
-    return total_length
+    print("Overlap stats:")
+    for name in ["min", "max", "median", "mean"]:
+        print("{}: {}".format(name, summary.get("overlap_" + name, "NA")))
 
+    print("\nIdentity stats:")
+    for name in ["min", "max", "median", "mean"]:
+        print("{}: {}".format(name, summary.get("identity_" + name, "NA")))
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input-gfa")
-    args = parser.parse_args()
 
-    overlap_lengths = []
-    identities = []
+def print_tsv(stats):
+    for (name, value) in ovl.summarize(stats).items():
+        print("{}\t{}".format(name, value))
 
-    with open(args.input_gfa) as f:
-        for line in f:
-            line = line.strip().split()
 
-            if line[0] == "L":
-                total_length = cigar_total_length(line[5])
-                match_length = cigar_total_length(line[5], match_only=True)
-                overlap_lengths.append(total_length)
-                identities.append(match_length / total_length)
+def print_json(stats):
+    report = ovl.summarize(stats)
+    report["operation_lengths"] = dict(zip(ovl.OPERATIONS, stats.operation_lengths.tolist()))
+    report["overlap_histogram"] = stats.length_histogram().tolist()
+    report["identity_histogram"] = stats.identity_histogram().tolist()
+    print(json.dumps(report, indent=2))
 
-    overlap_lengths.sort()
-    min_overlap = overlap_lengths[0]
-    max_overlap = overlap_lengths[-1]
-    median_overlap = overlap_lengths[len(overlap_lengths) // 2]
-    mean_overlap = sum(overlap_lengths) // len(overlap_lengths)
 
-    print("Overlap stats:")
-    print("min: {}".format(min_overlap))
-    print("max: {}".format(max_overlap))
-    print("median: {}".format(median_overlap))
-    print("mean: {}\n".format(mean_overlap))
-
-    identities.sort()
-    min_identity = round(identities[0], 3)
-    max_identity = round(identities[-1], 3)
-    median_identity = round(identities[len(identities) // 2], 3)
-    mean_identity = round(sum(identities) / len(identities), 3)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-gfa")
+    parser.add_argument("--format", default="text", choices=["text", "tsv", "json"])
+    args = parser.parse_args()
 
-    print("Identity stats:")
-    print("min: {}".format(min_identity))
-    print("max: {}".format(max_identity))
-    print("median: {}".format(median_identity))
-    print("mean: {}".format(mean_identity))
+    stats = ovl.calc_overlap_stats(args.input_gfa)
+    {"text": print_text, "tsv": print_tsv, "json": print_json}[args.format](stats)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,11 @@
+import os
+import sys
 import argparse
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asgan.compression import open_input  # noqa: E402
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -10,7 +16,7 @@ def main():
     depths = []
     lengths = []
 
-    with open(args.input_gfa) as f:
+    with open_input(args.input_gfa) as f:
         for line in f:
             record = line.strip().split()
             if record[0] == "S":
@@ -22,7 +28,7 @@ def main():
     depths_weighted_sum = sum([depths[i] * lengths[i] for i in range(len(depths))])
     depths_weighted_mean = depths_weighted_sum / sum(lengths)
 
-    with open(args.input_gfa) as fin, open(args.out_file, "w") as fout:
+    with open_input(args.input_gfa) as fin, open(args.out_file, "w") as fout:
         for line in fin:
             record = line.strip().split()
             if record[0] == "S":